@@ -1,12 +1,25 @@
 import argparse
+import logging
 import time
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor
-from bmw_crawler import BMWCrawler
-from mercedes_crawler import MercedesCrawler
-from reporter import EmailReporter
+from typing import TYPE_CHECKING
+from brands import BrandRegistry
+from report import REPORT_MODES
+from http_cache import CACHE_MODES, ResponseCache
+from metrics import RunMetrics
 import json
-import pandas as pd
+
+# Modules that load pandas, requests or smtplib are imported inside the
+# functions that use them, so --help and single-brand runs start quickly
+if TYPE_CHECKING:
+    from crawler import InventoryCrawler
+    from reporter import EmailReporter
+
+# Search radius in miles used by every crawler and by the coverage planner
+SEARCH_RADIUS = 50
+# Brands from config/brands.json and installed entry points
+BRANDS = BrandRegistry.load()
 
 
 def load_config(file_path: str) -> dict:
@@ -24,23 +37,25 @@ def load_config(file_path: str) -> dict:
         raise
 
 
-def get_crawler(brand: str, keys: dict, db_file: str):
-    """Factory function to create the appropriate crawler"""
-    if brand.lower() == 'bmw':
-        return BMWCrawler(
-            auth_token=keys['auth_token'],
-            series='3 Series',
-            radius=50,
-            db_file=db_file
-        )
-    elif brand.lower() == 'mercedes':
-        return MercedesCrawler(
-            auth_token=keys['auth_token'],
-            radius=50,
-            db_file=db_file
-        )
-    else:
-        raise ValueError(f"Unsupported brand: {brand}")
+def load_brand_profiles(brand: str, profiles_file: str = None) -> list:
+    """A brand's configured search profiles, or None to use the crawler's defaults"""
+    from search_profiles import DEFAULT_PROFILES_FILE, load_search_profiles
+    profiles_file = profiles_file or DEFAULT_PROFILES_FILE
+    if not Path(profiles_file).exists():
+        return None
+    return load_search_profiles(profiles_file).get(BRANDS.find(brand) or brand.lower())
+
+
+def get_crawler(brand: str, keys: dict, db_file: str, profiles_file: str = None,
+                **crawler_options) -> 'InventoryCrawler':
+    """Create a brand's crawler from the registry with the brand's search profiles"""
+    return BRANDS.crawler_class(brand)(
+        auth_token=keys['auth_token'],
+        radius=SEARCH_RADIUS,
+        db_file=db_file,
+        profiles=load_brand_profiles(brand, profiles_file),
+        **crawler_options
+    )
 
 
 def get_all_zip_codes(showrooms_config: dict) -> list:
@@ -51,24 +66,149 @@ def get_all_zip_codes(showrooms_config: dict) -> list:
     return all_zips
 
 
-def crawl_brand(brand: str, keys: dict, zip_codes: list, db_file: str):
+def create_email_reporter(keys: dict, metrics: RunMetrics = None,
+                          **report_options) -> 'EmailReporter':
+    """Create the email reporter from the SMTP credentials in the keys config"""
+    from reporter import EmailReporter
+    return EmailReporter(
+        smtp_server="smtp.gmail.com",
+        smtp_port=465,
+        smtp_user=keys['smtp_user'],
+        smtp_password=keys['smtp_password'],
+        metrics=metrics,
+        **report_options
+    )
+
+
+def parse_brand_intervals(values: list, brands: list, default: float) -> dict:
+    """Build per-brand crawl intervals from BRAND=SECONDS overrides"""
+    intervals = {brand: default for brand in brands}
+    for value in values:
+        brand, _, seconds = value.partition('=')
+        if brand.lower() not in intervals or not seconds:
+            raise ValueError(f"Invalid --brand-interval {value!r}; expected BRAND=SECONDS "
+                             f"for one of {', '.join(brands)}")
+        intervals[brand.lower()] = float(seconds)
+    return intervals
+
+
+def plan_zip_codes(zip_codes: list, radius: float = SEARCH_RADIUS) -> list:
+    """Reduce overlapping ZIP searches to a minimal covering set of search centres.
+
+    The plan is cached and only recomputed when the ZIP list or radius changes.
+    """
+    from zip_planner import cached_plan
+    plan = cached_plan(zip_codes, radius)
+    print(plan.get_summary())
+    return plan.zip_codes
+
+
+def crawl_brand(brand: str, keys: dict, zip_codes: list, db_file: str, **crawler_options):
     """Crawl inventory for a specific brand"""
     start_time = time.time()
-    crawler = get_crawler(brand, keys, db_file)
+    crawler = get_crawler(brand, keys, db_file, **crawler_options)
     crawler.crawl_zip_codes(zip_codes)
     duration = time.strftime('%H:%M:%S', time.gmtime(time.time() - start_time))
     return crawler.generate_report(duration)
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Crawl car inventory')
-    parser.add_argument('--brands', nargs='+', default=['bmw', 'mercedes'],
-                        help='Brands to crawl (default: all)')
-    args = parser.parse_args()
+def supported_brands(brands: list) -> list:
+    """The registered names of the given brands, warning about and dropping unknown ones"""
+    supported = []
+    for brand in brands:
+        name = BRANDS.find(brand)
+        if name is None:
+            logging.warning("Skipping unsupported brand %s", brand)
+        else:
+            supported.append(name)
+    return supported
 
-    # Set up paths
+
+def crawl_brands(brands: list, keys: dict, zip_codes: list, db_file: str,
+                 **crawler_options) -> list:
+    """Crawl several brands in parallel threads and return their reports"""
+    with ThreadPoolExecutor() as executor:
+        futures = [
+            executor.submit(crawl_brand, name, keys, zip_codes, db_file, **crawler_options)
+            for name in supported_brands(brands)
+        ]
+        return [future.result() for future in futures]
+
+
+def crawl_shard(brands: list, keys: dict, zip_codes: list, db_file: str,
+                cache_options: dict = None, **crawler_options) -> RunMetrics:
+    """Crawl one shard in a worker process and return its metrics"""
+    metrics = RunMetrics()
+    cache = ResponseCache(**cache_options) if cache_options else None
+    try:
+        crawl_brands(brands, keys, zip_codes, db_file,
+                     metrics=metrics, cache=cache, **crawler_options)
+    finally:
+        if cache is not None:
+            cache.close()
+    return metrics
+
+
+def run_local_shards(args: argparse.Namespace, keys: dict, zip_codes: list, db_file: str,
+                     crawler_options: dict) -> list:
+    """Crawl --shards shards in a process pool and return their database files"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from shards import shard_db_file, shard_zip_codes
+    count = args.shards
+    metrics = crawler_options['metrics']
+    cache = crawler_options['cache']
+    # Sessions, caches and metrics cannot cross processes; each worker makes its own
+    worker_options = {key: value for key, value in crawler_options.items()
+                      if key not in ('metrics', 'cache')}
+    # Rate limits are per process, so split the host budget between the shards
+    worker_options['requests_per_second'] = args.rate / count
+    cache_options = None
+    if cache is not None:
+        cache_options = {'path': cache.path, 'mode': cache.mode, 'ttl': cache.ttl}
+
+    shard_files = [shard_db_file(db_file, index, count) for index in range(1, count + 1)]
+    # Spawned workers do not inherit this process's database writer threads
+    with ProcessPoolExecutor(max_workers=count,
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [
+            executor.submit(crawl_shard, args.brands, keys,
+                            shard_zip_codes(zip_codes, index, count), shard_file,
+                            cache_options, **worker_options)
+            for index, shard_file in enumerate(shard_files, start=1)
+        ]
+        for future in futures:
+            metrics.merge(future.result())
+    return shard_files
+
+
+def merge_shards(shard_files: list, db_file: str, metrics: RunMetrics,
+                 profiles_file: str = None, since: float = None) -> list:
+    """Merge shard runs finished after `since` into the main database and report on them"""
+    from database import InventoryDatabase
+    from report import Report
+    from shards import ShardMerger
+    start_time = time.time()
+    db = InventoryDatabase(db_file, metrics=metrics)
+    run_ids = ShardMerger(db, since=since).merge(shard_files)
+    duration = time.strftime('%H:%M:%S', time.gmtime(time.time() - start_time))
+    reports = []
+    for brand, run_id in run_ids.items():
+        df = db.get_run_inventory(brand, run_id)
+        # Labelled the same way as an unsharded run's report
+        df['profile'] = BRANDS.crawler_class(brand).label_profiles(
+            df, load_brand_profiles(brand, profiles_file))
+        reports.append(Report.from_dataframe(df, brand, duration, metrics=metrics,
+                                             removed=db.get_removed_inventory(brand, run_id)))
+    return reports
+
+
+def run(args: argparse.Namespace, db_file: str, crawler_options: dict):
+    """Crawl, shard or merge as the arguments ask, then report and write the metrics"""
     base_path = Path(__file__).parent
-    db_file = str(base_path / 'vehicle_inventory.db')
+    metrics = crawler_options['metrics']
+    cache = crawler_options['cache']
+    metrics_dir = Path(args.metrics_dir or base_path / 'metrics')
 
     # Load configuration
     keys = load_config('config/keys.json')
@@ -76,61 +216,191 @@ def main():
 
     # Get all ZIP codes from the showrooms configuration
     all_zip_codes = get_all_zip_codes(showrooms_config)
+    if not args.no_coverage_plan:
+        all_zip_codes = plan_zip_codes(all_zip_codes)
+
+    report_options = {'mode': args.report_mode, 'max_rows': args.max_rows}
+    if args.daemon:
+        brands = supported_brands(args.brands)
+        if cache is not None and args.cache_ttl >= args.interval:
+            logging.warning("--cache-ttl %gs is not shorter than --interval %gs; cycles will "
+                            "replay cached responses", args.cache_ttl, args.interval)
+        # An interrupted cycle is picked up where it stopped
+        crawler_options['resume'] = True
+        from daemon import CrawlDaemon
+        CrawlDaemon(
+            brands,
+            lambda brand: get_crawler(brand, keys, db_file, **crawler_options),
+            all_zip_codes,
+            parse_brand_intervals(args.brand_interval, brands, args.interval),
+            jitter=args.jitter,
+            reporter=create_email_reporter(keys, metrics, **report_options),
+            to_emails=keys['to_emails'],
+            metrics=metrics,
+            metrics_dir=metrics_dir
+        ).run()
+        return
 
     # Track overall start time
     overall_start_time = time.time()
 
-    # Run crawlers in parallel
-    with ThreadPoolExecutor() as executor:
-        futures = []
-        for brand in args.brands:
-            if brand.lower() == 'bmw':
-                futures.append(executor.submit(
-                    crawl_brand,
-                    'bmw',
-                    keys,
-                    all_zip_codes,
-                    db_file
-                ))
-            elif brand.lower() == 'mercedes':
-                futures.append(executor.submit(
-                    crawl_brand,
-                    'mercedes',
-                    keys,
-                    all_zip_codes,
-                    db_file
-                ))
-
-        # Wait for all crawlers to complete and collect reports
-        reports = []
-        for future in futures:
-            report = future.result()
-            reports.append(report)
-            print(f"\nReport for {report.brand}:")
-            print(f"Duration: {report.duration}")
-            print("Summary:", report.get_summary())
-
-        # Send email with all reports
-        if reports:
-            email_reporter = EmailReporter(
-                smtp_server="smtp.gmail.com",
-                smtp_port=465,
-                smtp_user=keys['smtp_user'],
-                smtp_password=keys['smtp_password']
-            )
-            # Combine all reports into one DataFrame
-            all_data = pd.concat([report.get_dataframe()
-                                 for report in reports])
-            # Get unique brands from the reports
-            brands = sorted(set(report.brand for report in reports))
-            subject = f"Vehicle Inventory Report - {', '.join(brands)}"
-            email_reporter.send_report(
-                df=all_data,
-                duration=time.strftime('%H:%M:%S', time.gmtime(
-                    time.time() - overall_start_time)),
-                subject=subject,
-                to_emails=keys['to_emails']
-            )
+    if args.shard:
+        # One shard of a multi-node crawl; the merge step reports and emails
+        from shards import parse_shard, shard_db_file, shard_zip_codes
+        index, count = parse_shard(args.shard)
+        shard_file = shard_db_file(db_file, index, count)
+        zip_codes = shard_zip_codes(all_zip_codes, index, count)
+        print(f"Shard {index}/{count}: {len(zip_codes)} ZIPs into {shard_file}")
+        reports = crawl_brands(args.brands, keys, zip_codes, shard_file, **crawler_options)
+    elif args.shards > 1:
+        shard_files = run_local_shards(args, keys, all_zip_codes, db_file, crawler_options)
+        # Only the runs these workers just finished, not leftovers in the files
+        reports = merge_shards(shard_files, db_file, metrics, args.search_profiles,
+                               since=overall_start_time)
+    elif args.merge:
+        reports = merge_shards(args.merge, db_file, metrics, args.search_profiles,
+                               since=time.time() - args.merge_max_age)
+    else:
+        # Run crawlers in parallel
+        reports = crawl_brands(args.brands, keys, all_zip_codes, db_file, **crawler_options)
+
+    for report in reports:
+        print(f"\nReport for {report.brand}:")
+        print(f"Duration: {report.duration}")
+        print("Summary:", report.get_summary())
+
+    if cache is not None:
+        print(f"Response cache: {cache.hits} hits, {cache.misses} misses")
+
+    # Send email with all reports
+    if reports and not args.shard:
+        import pandas as pd
+        email_reporter = create_email_reporter(keys, metrics, **report_options)
+        # Combine all reports into one DataFrame
+        all_data = pd.concat([report.get_dataframe()
+                             for report in reports])
+        # Get unique brands from the reports
+        brands = sorted(set(report.brand for report in reports))
+        subject = f"Vehicle Inventory Report - {', '.join(brands)}"
+        email_reporter.send_report(
+            df=all_data,
+            duration=time.strftime('%H:%M:%S', time.gmtime(
+                time.time() - overall_start_time)),
+            subject=subject,
+            to_emails=keys['to_emails'],
+            removed=pd.concat([report.get_removed_dataframe() for report in reports])
+        )
+
+    json_path, prom_path = metrics.write(metrics_dir)
+    print(f"Metrics written to {json_path} and {prom_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crawl car inventory')
+    parser.add_argument('--brands', nargs='+', default=None,
+                        help='Brands to crawl (default: the brands in config/brands.json; '
+                             'installed plugin brands are crawled when named)')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='Maximum concurrent page requests per brand (default: 4)')
+    parser.add_argument('--rate', type=float, default=2.0,
+                        help='Maximum requests per second per API host (default: 2.0)')
+    parser.add_argument('--pool-size', type=int, default=None,
+                        help='HTTP keep-alive connections per crawler (default: --concurrency)')
+    parser.add_argument('--max-retries', type=int, default=3,
+                        help='Retries for 429/5xx responses with exponential backoff (default: 3)')
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='Vehicles written to the database per batch while crawling (default: 500)')
+    parser.add_argument('--cache-mode', choices=CACHE_MODES, default='off',
+                        help='record: reuse responses younger than --cache-ttl and store new ones; '
+                             'replay: serve only recorded responses, no network (default: off)')
+    parser.add_argument('--cache-ttl', type=float, default=900,
+                        help='Seconds a recorded response is reused in record mode (default: 900)')
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue each brand's last interrupted run, skipping ZIPs it completed")
+    parser.add_argument('--freshness-ttl', type=float, default=0,
+                        help='Skip ZIPs completed by any run within this many seconds (default: 0, off)')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Crawl low-yield ZIPs less often, based on the new VINs and price '
+                             'changes each ZIP contributed in earlier runs')
+    parser.add_argument('--sweep-every', type=int, default=6,
+                        help='With --adaptive, crawl every ZIP on every Nth run (default: 6)')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Stay resident and crawl each brand every --interval seconds, '
+                             'emailing only when a cycle finds changes')
+    parser.add_argument('--interval', type=float, default=3600,
+                        help='Seconds between crawl cycles in daemon mode (default: 3600)')
+    parser.add_argument('--brand-interval', action='append', default=[], metavar='BRAND=SECONDS',
+                        help='Per-brand interval override in daemon mode, e.g. bmw=1800')
+    parser.add_argument('--jitter', type=float, default=0.1,
+                        help='Random spread of each interval as a fraction of it (default: 0.1)')
+    parser.add_argument('--shard', default=None, metavar='INDEX/COUNT',
+                        help='Crawl only shard INDEX of COUNT (e.g. 2/4) into its own database '
+                             'file, for running shards on separate machines')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='Split the ZIPs into N shards crawled by a local process pool, '
+                             'then merge them into the main database (default: 1)')
+    parser.add_argument('--merge', nargs='+', default=None, metavar='SHARD_DB',
+                        help='Merge shard database files into the main database and report')
+    parser.add_argument('--merge-max-age', type=float, default=86400,
+                        help='With --merge, skip shard runs that finished more than this many '
+                             'seconds ago (default: 86400)')
+    parser.add_argument('--lean', action='store_true',
+                        help='Request only vehicle records, without facets and dealers')
+    parser.add_argument('--search-profiles', default=None, metavar='FILE',
+                        help='JSON search profiles per brand; compatible profiles share API '
+                             'calls (default: config/search_profiles.json)')
+    parser.add_argument('--report-mode', choices=REPORT_MODES, default='full',
+                        help='full: email the whole inventory inline; diff: email only new, '
+                             'repriced and removed vehicles with the snapshot as a .csv.gz '
+                             'attachment (default: full)')
+    parser.add_argument('--max-rows', type=int, default=500,
+                        help='Rows per table in a diff report email (default: 500)')
+    parser.add_argument('--metrics-dir', default=None,
+                        help='Directory for the JSON run record and Prometheus textfile '
+                             '(default: metrics/ next to app.py)')
+    parser.add_argument('--verbose', action='store_true',
+                        help='Log every fetched page')
+    parser.add_argument('--no-coverage-plan', action='store_true',
+                        help='Search every configured ZIP instead of a planned covering set')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    # Naming installed plugin brands avoids scanning every package on each run
+    args.brands = args.brands or BRANDS.configured_brands
+    metrics = RunMetrics()
+    scheduler = None
+    if args.adaptive:
+        from zip_scheduler import YieldScheduler
+        scheduler = YieldScheduler(sweep_every=args.sweep_every)
+    crawler_options = {
+        'concurrency': args.concurrency,
+        'requests_per_second': args.rate,
+        'pool_size': args.pool_size,
+        'max_retries': args.max_retries,
+        'batch_size': args.batch_size,
+        'resume': args.resume,
+        'freshness_ttl': args.freshness_ttl,
+        'scheduler': scheduler,
+        'profiles_file': args.search_profiles,
+        'lean': args.lean,
+        'metrics': metrics
+    }
+
+    # Set up paths
+    base_path = Path(__file__).parent
+    db_file = str(base_path / 'vehicle_inventory.db')
+
+    cache = None
+    if args.cache_mode != 'off':
+        cache = ResponseCache(str(base_path / 'http_cache.db'),
+                              mode=args.cache_mode, ttl=args.cache_ttl)
+    crawler_options['cache'] = cache
+
+    try:
+        run(args, db_file, crawler_options)
+    finally:
+        if cache is not None:
+            cache.close()
 
 
 if __name__ == '__main__':
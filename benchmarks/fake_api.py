@@ -0,0 +1,217 @@
+"""Local stand-in for the BMW and Mercedes inventory APIs.
+
+Serves the same request/response shapes that BMWCrawler and MercedesCrawler
+use, backed by a synthetic inventory, so crawls can be measured without
+touching the real services.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+BMW_PATH = '/vehicle'
+MERCEDES_PATH = '/api/inv/en_us/used/vehicles/search'
+
+BMW_MODELS = ['330i xDrive', 'M340i xDrive', '330e xDrive']
+MERCEDES_MODELS = ['C 300 4MATIC', 'E 350 4MATIC', 'GLC 300 4MATIC']
+DEALERS = 50
+
+
+class FakeInventory:
+    """Synthetic vehicles assigned to ZIP codes.
+
+    Every vehicle belongs to one ZIP. With probability `overlap` it is also
+    returned by the next ZIP in the list, which mimics neighbouring searches
+    whose radii share dealers.
+    """
+
+    def __init__(self, size: int, zip_codes: List[str], overlap: float = 0.3, seed: int = 0):
+        rng = random.Random(seed)
+        self.size = size
+        self.zip_codes = list(zip_codes)
+        self.by_zip: Dict[str, List[int]] = {zip_code: [] for zip_code in self.zip_codes}
+        self.prices = [round(rng.uniform(20000, 40000), 0) for _ in range(size)]
+        self.odometers = [round(rng.uniform(1000, 30000), 0) for _ in range(size)]
+        for index in range(size):
+            home = index % len(self.zip_codes)
+            self.by_zip[self.zip_codes[home]].append(index)
+            if len(self.zip_codes) > 1 and rng.random() < overlap:
+                neighbour = self.zip_codes[(home + 1) % len(self.zip_codes)]
+                self.by_zip[neighbour].append(index)
+        # The APIs are asked to sort by price
+        for indexes in self.by_zip.values():
+            indexes.sort(key=lambda i: self.prices[i])
+
+    def facets(self) -> List[dict]:
+        """Filter facets with a count per value, as the APIs add them when asked"""
+        return [{'name': f'Facet {facet}',
+                 'values': [{'value': f'Value {value}', 'count': (facet * value) % 97}
+                            for value in range(15)]}
+                for facet in range(25)]
+
+    def dealers(self, indexes: List[int]) -> List[dict]:
+        """The dealers selling the given vehicles"""
+        return [{'dealerId': dealer, 'name': f'Dealer {dealer}',
+                 'address': f'{dealer} Main Street', 'phone': f'555-{dealer:04d}',
+                 'latitude': 40.0 + dealer / 100, 'longitude': -88.0 - dealer / 100}
+                for dealer in sorted({index % DEALERS for index in indexes})]
+
+    def page(self, zip_code: str, start: int, count: int) -> List[int]:
+        """Vehicle indexes for one page of a ZIP search"""
+        return self.by_zip.get(zip_code, [])[start:start + count]
+
+    def total(self, zip_code: str) -> int:
+        return len(self.by_zip.get(zip_code, []))
+
+    def reprice(self, fraction: float, seed: int = 1):
+        """Drop the price of a fraction of vehicles, as between two real crawls"""
+        rng = random.Random(seed)
+        for index in rng.sample(range(self.size), int(self.size * fraction)):
+            self.prices[index] -= 500
+
+    def bmw_record(self, index: int) -> dict:
+        return {
+            'vin': f'WBA{index:014d}',
+            'model': BMW_MODELS[index % len(BMW_MODELS)],
+            'internetPrice': self.prices[index],
+            'odometer': self.odometers[index],
+            'drivetrain': 'AWD',
+            'vdpUrl': f'https://example.test/bmw/{index}',
+            'series': '3 Series',
+            'cpoStatus': 'CPO'
+        }
+
+    def mercedes_record(self, index: int) -> dict:
+        return {
+            'vin': f'W1K{index:014d}',
+            'modelName': MERCEDES_MODELS[index % len(MERCEDES_MODELS)],
+            'dsrp': self.prices[index],
+            'eLink': f'https://example.test/mercedes/{index}',
+            'usedVehicleAttributes': {'mileage': self.odometers[index]},
+            'properties': [
+                {'name': 'EXTERIOR_COLOR', 'value': 'Black'},
+                {'name': 'AUTOMATIC_TRANSMISSION', 'value': '4MATIC'}
+            ]
+        }
+
+
+class FakeInventoryServer:
+    """Threaded HTTP server speaking both inventory APIs.
+
+    `latency` seconds are added to every response, and `error_rate` of the
+    requests fail with 503 and Retry-After: 0 to exercise the retry path.
+    """
+
+    def __init__(self, inventory: FakeInventory, latency: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.inventory = inventory
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    @property
+    def bmw_url(self) -> str:
+        return self.base_url + BMW_PATH
+
+    @property
+    def mercedes_url(self) -> str:
+        return self.base_url + MERCEDES_PATH
+
+    def start(self) -> 'FakeInventoryServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'FakeInventoryServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if urlparse(self.path).path != BMW_PATH:
+                    return self._send(404, {})
+                if fake._should_fail():
+                    return self._send(503, {}, retry_after=True)
+                zip_code = body.get('postalCode')
+                count = int(body.get('PageSize', 100))
+                start = int(body.get('pageIndex', 0)) * count
+                indexes = fake.inventory.page(zip_code, start, count)
+                payload = {'totalCount': fake.inventory.total(zip_code),
+                           'vehicles': [fake.inventory.bmw_record(i) for i in indexes]}
+                if body.get('includeFacets', True):
+                    payload['facets'] = fake.inventory.facets()
+                if body.get('includeDealers', True):
+                    payload['dealers'] = fake.inventory.dealers(indexes)
+                self._send(200, payload)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != MERCEDES_PATH:
+                    return self._send(404, {})
+                if fake._should_fail():
+                    return self._send(503, {}, retry_after=True)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                zip_code = params.get('zip')
+                records = [fake.inventory.mercedes_record(i) for i in fake.inventory.page(
+                    zip_code, int(params.get('start', 0)), int(params.get('count', 100)))]
+                result = {'pagedVehicles': {
+                    'paging': {'totalCount': fake.inventory.total(zip_code)},
+                    'records': records
+                }}
+                if params.get('withFilters', 'true') == 'true':
+                    result['filters'] = fake.inventory.facets()
+                self._send(200, {'status': {'code': 200}, 'result': result})
+
+            def _send(self, status: int, payload: dict, retry_after: bool = False):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                if retry_after:
+                    self.send_header('Retry-After', '0')
+                self.end_headers()
+                self.wfile.write(data)
+                with fake._lock:
+                    fake.bytes_sent += len(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,194 @@
+"""Offline performance benchmarks for the crawl, database and report stages.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --sizes 1000 10000 100000 --compare
+
+Each run is appended to --results-file (default: benchmarks/results.jsonl,
+which git ignores), and --compare reports the change against the previous
+run made with the same parameters.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from app import crawl_brand
+from benchmarks.fake_api import FakeInventory, FakeInventoryServer
+from database import InventoryDatabase
+from models import BMWVehicleTransformer
+from reporter import EmailReporter
+
+RESULTS_FILE = Path(__file__).parent / 'results.jsonl'
+BRANDS = ('bmw', 'mercedes')
+
+
+def _zip_codes(count: int) -> List[str]:
+    return [str(60000 + i) for i in range(count)]
+
+
+def bench_crawl(brand: str, size: int, args: argparse.Namespace, lean: bool = False) -> dict:
+    """End-to-end crawl_brand against the fake API: fetch, transform and persist"""
+    zip_codes = _zip_codes(args.zips)
+    inventory = FakeInventory(size, zip_codes, overlap=args.overlap)
+    with FakeInventoryServer(inventory, latency=args.latency,
+                             error_rate=args.error_rate) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        url = server.bmw_url if brand == 'bmw' else server.mercedes_url
+        start = time.perf_counter()
+        report = crawl_brand(brand, {'auth_token': 'benchmark'}, zip_codes,
+                             str(Path(tmp) / 'bench.db'), url=url,
+                             concurrency=args.concurrency,
+                             requests_per_second=10000, burst=args.concurrency,
+                             backoff_factor=0, lean=lean)
+        seconds = time.perf_counter() - start
+        pages = report.metrics.counter_total('pages_decoded')
+        return {
+            'benchmark': f"crawl_brand[{brand}{',lean' if lean else ''}]",
+            'size': size,
+            'seconds': seconds,
+            'vehicles': report.total_vehicles,
+            'vehicles_per_second': report.total_vehicles / seconds,
+            'requests': server.requests,
+            'errors': server.errors,
+            'bytes': server.bytes_sent,
+            'bytes_per_page': report.metrics.counter_total('page_bytes') / pages,
+            'decode_ms_per_page': report.metrics.counter_total('page_decode_seconds') / pages * 1000
+        }
+
+
+def bench_database_and_report(size: int) -> List[dict]:
+    """update_inventory on a fresh database and on a repriced rerun, then render the report"""
+    inventory = FakeInventory(size, _zip_codes(1), overlap=0)
+    transformer = BMWVehicleTransformer()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db = InventoryDatabase(str(Path(tmp) / 'bench.db'))
+        for label in ('initial', 'rerun'):
+            if label == 'rerun':
+                inventory.reprice(0.1)
+            frame = transformer.transform_batch(
+                [inventory.bmw_record(i) for i in range(size)])
+            start = time.perf_counter()
+            df = db.update_inventory(frame, db.new_run_id())
+            results.append({
+                'benchmark': f'update_inventory[{label}]',
+                'size': size,
+                'seconds': time.perf_counter() - start
+            })
+
+    reporter = EmailReporter('localhost', 0, 'bench@example.test', '')
+    start = time.perf_counter()
+    html = reporter.render_report(df, '00:00:00')
+    results.append({
+        'benchmark': 'EmailReporter.render_report',
+        'size': size,
+        'seconds': time.perf_counter() - start,
+        'bytes': len(html)
+    })
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous(params: dict, results_file: Path) -> Optional[dict]:
+    """Return the most recent stored run made with the same parameters"""
+    if not results_file.exists():
+        return None
+    previous = None
+    with open(results_file) as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get('params') == params:
+                previous = record
+    return previous
+
+
+def compare(current: dict, previous: dict, threshold: float) -> bool:
+    """Print per-benchmark changes and return True if any slowed down beyond threshold percent"""
+    before = {(r['benchmark'], r['size']): r['seconds'] for r in previous['results']}
+    regressed = False
+    print(f"\nCompared with {previous['timestamp']} ({previous.get('commit') or 'unknown commit'}):")
+    for result in current['results']:
+        key = (result['benchmark'], result['size'])
+        if key not in before:
+            continue
+        change = (result['seconds'] - before[key]) / before[key] * 100
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f"  {key[0]:<32} {key[1]:>7}  {before[key]:8.3f}s -> "
+              f"{result['seconds']:8.3f}s  {change:+6.1f}%{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run offline crawl/database/report benchmarks')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000],
+                        help='Inventory sizes to benchmark (default: 1000 10000 100000)')
+    parser.add_argument('--brands', nargs='+', default=list(BRANDS), choices=BRANDS,
+                        help='Brands whose crawl path is benchmarked (default: all)')
+    parser.add_argument('--zips', type=int, default=20,
+                        help='Number of ZIP codes in the synthetic inventory (default: 20)')
+    parser.add_argument('--overlap', type=float, default=0.3,
+                        help='Fraction of vehicles also returned by a neighbouring ZIP (default: 0.3)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds of latency added to every fake API response (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of fake API requests answered with 503 (default: 0)')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='Crawler concurrency used for crawl benchmarks (default: 8)')
+    parser.add_argument('--results-file', type=Path, default=RESULTS_FILE,
+                        help='JSON lines file the run is appended to '
+                             '(default: benchmarks/results.jsonl)')
+    parser.add_argument('--compare', action='store_true',
+                        help='Compare against the previous run with the same parameters')
+    parser.add_argument('--threshold', type=float, default=20.0,
+                        help='Slowdown in percent reported as a regression (default: 20)')
+    args = parser.parse_args()
+
+    params = {key: getattr(args, key) for key in (
+        'brands', 'zips', 'overlap', 'latency', 'error_rate', 'concurrency')}
+    record = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'params': params,
+        'results': []
+    }
+    for size in args.sizes:
+        for brand in args.brands:
+            for lean in (False, True):
+                result = bench_crawl(brand, size, args, lean=lean)
+                record['results'].append(result)
+                print(f"{result['benchmark']:<32} {size:>7}  {result['seconds']:8.3f}s  "
+                      f"{result['vehicles_per_second']:10.0f} vehicles/s  {result['requests']} requests  "
+                      f"{result['bytes_per_page']:8.0f} B/page  "
+                      f"{result['decode_ms_per_page']:.3f} ms decode/page")
+        for result in bench_database_and_report(size):
+            record['results'].append(result)
+            print(f"{result['benchmark']:<32} {size:>7}  {result['seconds']:8.3f}s")
+
+    previous = load_previous(params, args.results_file) if args.compare else None
+    args.results_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.results_file, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+    if previous and compare(record, previous, args.threshold):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,49 @@
-from typing import List, Dict, Any
-from crawler import InventoryCrawler
+import logging
+from typing import Any, List, Optional
+from crawler import InventoryCrawler, InventoryPage, read_total
+from http_client import FetchError
 from models import BMWVehicleTransformer
-import requests
+from search_profiles import SearchProfile
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_URL = 'https://inventoryservices.bmwdealerprograms.com/vehicle'
+# Width of the API's price filter bands, e.g. "$20,000 - $29,999"
+PRICE_BAND = 10000
+
+
+def price_bands(min_price: Optional[float], max_price: float) -> List[str]:
+    """Price filter values for the bands overlapping [min_price, max_price]"""
+    low = int((min_price or 0) // PRICE_BAND * PRICE_BAND)
+    return [f"${band:,} - ${band + PRICE_BAND - 1:,}"
+            for band in range(low, int(max_price) + 1, PRICE_BAND)]
+
+
+def default_profile(series: str) -> SearchProfile:
+    """The CPO search the crawler used before profiles were configurable"""
+    return SearchProfile(name=series, series=(series,), drivetrains=('AWD',),
+                         min_price=20000, max_price=39999, max_odometer=30000)
 
 
 class BMWCrawler(InventoryCrawler):
-    def __init__(self, auth_token: str, series: str = '3 Series', radius: int = 50, db_file: str = 'vehicle_inventory.db'):
-        super().__init__(auth_token, BMWVehicleTransformer(), db_file)
-        self.url = 'https://inventoryservices.bmwdealerprograms.com/vehicle'
+    brand = 'BMW'
+    page_size = 100
+    local_dimensions = ('series', 'drivetrains', 'price', 'odometer')
+    # Prices are searched in whole $10k bands (price_bands)
+    inexact_dimensions = ('price',)
+
+    @classmethod
+    def default_profiles(cls) -> List[SearchProfile]:
+        return [default_profile('3 Series')]
+
+    def __init__(self, auth_token: str, series: str = '3 Series', radius: int = 50, db_file: str = 'vehicle_inventory.db', url: str = INVENTORY_URL, profiles: List[SearchProfile] = None, **kwargs):
+        profiles = profiles or [default_profile(series)]
+        for profile in profiles:
+            if profile.models or profile.years:
+                raise ValueError(
+                    f"BMW profile {profile.name!r}: models and years cannot be searched")
+        super().__init__(auth_token, BMWVehicleTransformer(), db_file, url=url,
+                         profiles=profiles, **kwargs)
         self.headers = {
             'Accept': 'application/json',
             'Content-Type': 'application/json',
@@ -16,31 +52,51 @@ class BMWCrawler(InventoryCrawler):
         }
         self.series = series
         self.radius = radius
+        # Set when lean responses turn out to omit the total, which the
+        # crawler needs to fetch a ZIP's pages in one wave
+        self.facets_for_total = False
+
+    @staticmethod
+    def search_filters(filters: SearchProfile) -> List[dict]:
+        """The request's filter list; every filter accepts several values"""
+        search = []
+        if filters.series:
+            search.append({"name": "Series", "values": list(filters.series)})
+        search.append({"name": "Type", "values": ["CPO"]})
+        if filters.max_odometer is not None:
+            search.append({"name": "Odometer", "values": [f"{filters.max_odometer:,.0f} or less"]})
+        if filters.max_price is not None:
+            search.append({"name": "Price", "values": price_bands(filters.min_price,
+                                                                   filters.max_price)})
+        if filters.drivetrains:
+            search.append({"name": "Drivetrain", "values": list(filters.drivetrains)})
+        return search
+
+    def check_response(self, data: Any):
+        """A page without a vehicles list is an error page"""
+        super().check_response(data)
+        if not isinstance(data.get('vehicles', []), list):
+            raise FetchError(f"No vehicles list from {self.url}", 200)
 
-    def fetch_inventory(self, zip_code: str, page_index: int) -> List[Dict[str, Any]]:
+    def fetch_page(self, zip_code: str, page_index: int, filters: SearchProfile) -> InventoryPage:
+        """Fetch a page of inventory; the total is the response's top-level totalCount"""
+        include_facets = not self.lean or self.facets_for_total
         body = {
             "pageIndex": page_index,
-            "PageSize": 100,
+            "PageSize": self.page_size,
             "postalCode": zip_code,
             "radius": self.radius,
             "sortBy": "price",
             "sortDirection": "asc",
             "formatResponse": False,
-            "includeFacets": True,
-            "includeDealers": True,
+            "includeFacets": include_facets,
+            "includeDealers": not self.lean,
             "includeVehicles": True,
-            "filters": [
-                {"name": "Series", "values": [self.series]},
-                {"name": "Type", "values": ["CPO"]},
-                {"name": "Odometer", "values": ["30,000 or less"]},
-                {"name": "Price", "values": [
-                    "$20,000 - $29,999", "$30,000 - $39,999"]},
-                {"name": "Drivetrain", "values": ["AWD"]}
-            ]
+            "filters": self.search_filters(filters)
         }
-        response = requests.post(self.url, headers=self.headers, json=body)
-        if response.status_code == 200:
-            return response.json().get('vehicles', [])
-        else:
-            print(f"Error {response.status_code} for ZIP {zip_code}")
-            return []
+        data = self._request('POST', headers=self.headers, json=body)
+        page = InventoryPage(data.get('vehicles', []), read_total(data.get('totalCount')))
+        if not include_facets and page.total is None and page.vehicles:
+            logger.info("BMW responses without facets omit the total; requesting facets again")
+            self.facets_for_total = True
+        return page
@@ -0,0 +1,63 @@
+"""Registry of the brands the crawler supports.
+
+Each brand maps to its crawler class as 'module:Class', either in
+config/brands.json or, for brands shipped in another package, through the
+'car_listings.brands' entry point group. A brand's crawler module, and the
+transformer and libraries it pulls in, is imported only when the brand is
+crawled.
+"""
+import importlib
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BRANDS_FILE = Path(__file__).parent / 'config' / 'brands.json'
+ENTRY_POINT_GROUP = 'car_listings.brands'
+
+
+class BrandRegistry:
+    """Resolves brand names to crawler classes, importing each class on first use"""
+
+    def __init__(self, crawlers: Dict[str, str]):
+        self.crawlers = {brand.lower(): target for brand, target in crawlers.items()}
+        # Known without scanning installed packages, so default runs stay fast
+        self.configured_brands = list(self.crawlers)
+        self._classes: Dict[str, type] = {}
+        self._entry_points_loaded = False
+
+    @classmethod
+    def load(cls, path: str = BRANDS_FILE) -> 'BrandRegistry':
+        """Read the configured brands; entry points are looked up only when needed"""
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def _load_entry_points(self):
+        # Scanning installed packages is slow, so it waits until a brand is needed
+        if not self._entry_points_loaded:
+            from importlib.metadata import entry_points
+            for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+                self.crawlers.setdefault(entry_point.name.lower(), entry_point.value)
+            self._entry_points_loaded = True
+
+    @property
+    def brands(self) -> List[str]:
+        """Every configured and installed brand; scans the installed packages"""
+        self._load_entry_points()
+        return list(self.crawlers)
+
+    def find(self, brand: str) -> Optional[str]:
+        """The registered name of a brand, matched case-insensitively, or None"""
+        brand = brand.lower()
+        if brand not in self.crawlers:
+            self._load_entry_points()
+        return brand if brand in self.crawlers else None
+
+    def crawler_class(self, brand: str) -> type:
+        """Import and return a brand's crawler class"""
+        name = self.find(brand)
+        if name is None:
+            raise ValueError(f"Unsupported brand: {brand}")
+        if name not in self._classes:
+            module_name, _, class_name = self.crawlers[name].partition(':')
+            self._classes[name] = getattr(importlib.import_module(module_name), class_name)
+        return self._classes[name]
@@ -1,49 +1,511 @@
 from abc import ABC, abstractmethod
-import requests
+import asyncio
+from dataclasses import dataclass
+import logging
+import math
 import time
-from typing import List, Dict, Any
-from models import Vehicle, VehicleTransformer
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+from urllib.parse import urlparse
+import pandas as pd
+import requests
+from models import VehicleTransformer
 from database import InventoryDatabase
+from http_cache import ResponseCache
+from http_client import JSON_DECODER, FetchError, create_session, decode_json
+from metrics import RunMetrics
+from rate_limiter import get_host_limiter
 from report import Report
+from search_profiles import SearchProfile, SearchQuery, label_profiles, plan_queries
+from zip_scheduler import YieldScheduler
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class InventoryPage:
+    """A page of raw vehicle records and the search's total result count, if known"""
+    vehicles: List[Dict[str, Any]]
+    total: Optional[int] = None
+    # Set by the crawler to the ZIP search that returned the page
+    zip_code: Optional[str] = None
+
+
+@dataclass
+class SearchResult:
+    """Vehicles one search of a ZIP returned, and whether any of its pages failed"""
+    vehicles: int = 0
+    failed: bool = False
+
+
+@dataclass
+class ZipCompleted:
+    """Queued after the last page of a ZIP whose pages were all fetched"""
+    zip_code: str
+    vehicles: int
+
+
+def read_total(value: Any) -> Optional[int]:
+    """The result total from the field a crawler's API reports it in; None if absent"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    return None
 
 
 class InventoryCrawler(ABC):
-    def __init__(self, auth_token: str, transformer: VehicleTransformer, db_file: str):
+    # Brand name stamped on every vehicle the crawler stores
+    brand: str = None
+    # Results requested per page, set by each crawler. Lowered to the API's
+    # page size if a first page shows the API caps pages below it
+    page_size: int = None
+    # Profile filters that can be checked on transformed vehicles, so searches
+    # differing only in them can be merged and their results split locally
+    local_dimensions: Tuple[str, ...] = ('price', 'odometer')
+    # Profile filters the API only approximates, e.g. by rounding them to
+    # coarser bands, so they are always re-checked on the fetched vehicles
+    inexact_dimensions: Tuple[str, ...] = ()
+
+    def __init__(self, auth_token: str, transformer: VehicleTransformer, db_file: str, url: str,
+                 concurrency: int = 4, requests_per_second: float = 2.0, burst: int = 2,
+                 pool_size: int = None, max_retries: int = 3, backoff_factor: float = 0.5,
+                 batch_size: int = 500, cache: ResponseCache = None, metrics: RunMetrics = None,
+                 resume: bool = False, freshness_ttl: float = 0,
+                 scheduler: YieldScheduler = None, profiles: List[SearchProfile] = None,
+                 lean: bool = False):
         self.auth_token = auth_token
+        # Ask the API only for the vehicle records, leaving out facets and dealers
+        self.lean = lean
+        # Every profile is searched in each ZIP, with compatible ones merged
+        self.profiles = profiles or self.default_profiles()
+        self.queries: List[SearchQuery] = plan_queries(self.profiles, self.local_dimensions)
         self.transformer = transformer
-        self.db = InventoryDatabase(db_file)
-        self.all_vehicles: Dict[str, Vehicle] = {}
+        # Shared with the database so one run record covers every stage
+        self.metrics = metrics or RunMetrics()
+        self.db = InventoryDatabase(db_file, metrics=self.metrics)
+        self.url = url
+        self.host = urlparse(url).netloc
+        # Vehicles are written to the database in batches of this size while
+        # crawling, so memory stays bounded no matter how large the inventory is
+        self.batch_size = max(1, batch_size)
+        self.run_id: Optional[str] = None
+        self.vehicles_stored = 0
+        # Maximum number of page requests in flight at once for this crawler
+        self.concurrency = max(1, concurrency)
+        # Pacing is shared by every crawler that talks to the same host
+        self.rate_limiter = get_host_limiter(self.host, requests_per_second, burst)
+        self._semaphore = None
+        # Keep-alive connections are reused across pages; size the pool so
+        # every concurrent request gets its own connection by default
+        self.session = create_session(
+            pool_size=pool_size or self.concurrency,
+            max_retries=max_retries,
+            backoff_factor=backoff_factor,
+            rate_limiter=self.rate_limiter
+        )
+        # Optional record/replay store for response bodies
+        self.cache = cache
+        self.failed_pages: List[Tuple[str, int, str]] = []
+        self._pages: Optional[asyncio.Queue] = None
+        # Continue the brand's last interrupted run instead of starting afresh
+        self.resume = resume
+        # Skip ZIPs that any run completed within this many seconds; 0 disables it
+        self.freshness_ttl = freshness_ttl
+        # Optional yield-driven ZIP selection; yields are only tracked when set
+        self.scheduler = scheduler
+        self._zip_requests: Counter = Counter()
+        self._zip_yields: Dict[str, List[int]] = {}
+        self._run_number = 0
+        # Whether the run searched every ZIP it was given; removals are only
+        # detected then, since a skipped ZIP's vehicles are not really gone
+        self.full_sweep = True
 
+    @classmethod
     @abstractmethod
-    def fetch_inventory(self, zip_code: str, page_index: int) -> List[Dict[str, Any]]:
-        """Fetch inventory for a specific zip code and page"""
+    def default_profiles(cls) -> List[SearchProfile]:
+        """The searches made when no profiles are configured"""
         pass
 
+    @classmethod
+    def label_profiles(cls, df: pd.DataFrame, profiles: List[SearchProfile] = None) -> pd.Series:
+        """Name the search profiles each stored vehicle belongs to; '' for none"""
+        profiles = profiles or cls.default_profiles()
+        return label_profiles(df, plan_queries(profiles, cls.local_dimensions),
+                              cls.local_dimensions, cls.inexact_dimensions)
+
+    @abstractmethod
+    def fetch_page(self, zip_code: str, page_index: int, filters: SearchProfile) -> InventoryPage:
+        """Fetch a page of a search, with the result total when the API reports it"""
+        pass
+
+    def fetch_inventory(self, zip_code: str, page_index: int,
+                        filters: SearchProfile = None) -> List[Dict[str, Any]]:
+        """Fetch inventory for a specific zip code and page of the first search"""
+        return self.fetch_page(zip_code, page_index, filters or self.queries[0].filters).vehicles
+
+    def check_response(self, data: Any):
+        """Raise FetchError for a decoded body the API sent with HTTP 200 but as an error.
+
+        Subclasses also check the keys fetch_page reads, so a malformed page
+        fails on its own instead of aborting the crawl.
+        """
+        if not isinstance(data, dict):
+            raise FetchError(f"Expected a JSON object from {self.url}, "
+                             f"got {type(data).__name__}", 200)
+
+    def _request(self, method: str, **kwargs) -> Any:
+        """Send a request and return the decoded JSON body, counting its size and decode time.
+
+        A network response is cached only once it decodes and passes
+        check_response, so error bodies are never replayed.
+        """
+        body, key = self._fetch_body(method, **kwargs)
+        start = time.perf_counter()
+        try:
+            data = decode_json(body)
+        except ValueError as e:
+            # Such as an HTML maintenance page sent with HTTP 200
+            raise FetchError(f"Invalid JSON from {self.url}: {e}", 200) from e
+        # The same labels on all three, so per-page bytes and decode time can
+        # be compared between lean and full fetches and between decoders
+        labels = {'brand': self.brand, 'lean': self.lean, 'decoder': JSON_DECODER}
+        self.metrics.inc('page_decode_seconds', time.perf_counter() - start, **labels)
+        self.metrics.inc('pages_decoded', **labels)
+        self.metrics.inc('page_bytes', len(body), **labels)
+        self.check_response(data)
+        if key is not None:
+            self.cache.put(key, body)
+        return data
+
+    def _fetch_body(self, method: str, **kwargs) -> Tuple[bytes, Optional[str]]:
+        """Return a response body from the cache or, paced by the host's rate limiter, the network.
+
+        Also returns the cache key a network body should be stored under, or
+        None when it came from the cache or caching is off.
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(method, self.url, kwargs.get('params'), kwargs.get('json'))
+            body = self.cache.get(key)
+            if body is not None:
+                self.metrics.inc('http_requests', brand=self.brand, host=self.host, outcome='cache')
+                return body, None
+            if self.cache.mode == 'replay':
+                raise FetchError(f"No recorded response for {method} {self.url}")
+
+        self.rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.url, **kwargs)
+        except requests.RequestException as e:
+            self.metrics.inc('http_requests', brand=self.brand, host=self.host, outcome='error')
+            raise FetchError(f"Request to {self.url} failed: {e}") from e
+        finally:
+            self.metrics.observe('http_request_seconds', time.perf_counter() - start,
+                                 brand=self.brand, host=self.host)
+
+        retries = getattr(response.raw, 'retries', None)
+        if retries is not None and retries.history:
+            self.metrics.inc('http_retries', len(retries.history), brand=self.brand, host=self.host)
+        self.metrics.inc('http_response_bytes', len(response.content),
+                         brand=self.brand, host=self.host)
+        if response.status_code != 200:
+            self.metrics.inc('http_requests', brand=self.brand, host=self.host, outcome='error')
+            raise FetchError(
+                f"HTTP {response.status_code} from {self.url}", response.status_code)
+        self.metrics.inc('http_requests', brand=self.brand, host=self.host, outcome='ok')
+        return response.content, key
+
+    async def fetch_page_async(self, zip_code: str, page_index: int,
+                               filters: SearchProfile = None) -> InventoryPage:
+        """Fetch a page in a worker thread without blocking the event loop"""
+        async with self._semaphore:
+            return await self._fetch_page_in_thread(zip_code, page_index, filters)
+
+    async def _fetch_page_in_thread(self, zip_code: str, page_index: int,
+                                    filters: SearchProfile = None) -> InventoryPage:
+        with self.metrics.stage('fetch', brand=self.brand):
+            return await asyncio.to_thread(self.fetch_page, zip_code, page_index,
+                                           filters or self.queries[0].filters)
+
+    async def fetch_inventory_async(self, zip_code: str, page_index: int,
+                                    filters: SearchProfile = None) -> List[Dict[str, Any]]:
+        """Async counterpart of fetch_inventory"""
+        return (await self.fetch_page_async(zip_code, page_index, filters)).vehicles
+
     def crawl_zip_codes(self, zip_codes: List[str]):
         """Crawl inventory for multiple zip codes"""
-        for index, zip_code in enumerate(zip_codes, start=1):
-            print(f"Fetching inventory for ZIP: {zip_code}")
-            page_index = 0
-            while True:
-                raw_vehicles = self.fetch_inventory(zip_code, page_index)
-                if not raw_vehicles:
-                    break
-
-                # Transform raw data into Vehicle objects and deduplicate using VIN
-                for raw_vehicle in raw_vehicles:
-                    vehicle = self.transformer.transform(raw_vehicle)
-                    self.all_vehicles[vehicle.vin] = vehicle
-
-                print(
-                    f"  Retrieved {len(raw_vehicles)} vehicles on page {page_index}")
-                page_index += 1
-                time.sleep(1)
-            print(f"ZIP code {index} done")
-            time.sleep(2)
+        with self.metrics.stage('crawl', brand=self.brand):
+            asyncio.run(self.crawl_zip_codes_async(zip_codes))
+
+    async def crawl_zip_codes_async(self, zip_codes: List[str]):
+        """Crawl inventory for multiple zip codes concurrently.
+
+        Fetched pages flow through a bounded queue to a single persister that
+        transforms them, deduplicates by VIN and writes them to the database in
+        batches, so a crash only loses the batch in progress. At most
+        `concurrency` ZIPs are crawled at a time, and a request slot is only
+        released once its page is queued, so the pages held in memory stay
+        bounded however many ZIPs the run has. Each ZIP is
+        checkpointed once its vehicles are stored, which lets an interrupted
+        run be resumed without fetching those ZIPs again.
+        """
+        zip_codes = self._start_run(zip_codes)
+        self.vehicles_stored = 0
+        self.failed_pages = []
+        self._zip_requests = Counter()
+        self._zip_yields = {}
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._pages = asyncio.Queue(maxsize=self.concurrency * 2)
+        persister = asyncio.create_task(self._persist_pages())
+        pending_zips = iter(enumerate(zip_codes, start=1))
+
+        async def crawl_zips():
+            for index, zip_code in pending_zips:
+                await self._crawl_zip_code(index, zip_code)
+
+        producers = asyncio.gather(*(
+            crawl_zips() for _ in range(min(self.concurrency, len(zip_codes)))))
+        await asyncio.wait({persister, producers}, return_when=asyncio.FIRST_COMPLETED)
+        if persister.done():
+            # The persister only stops early when a write failed
+            producers.cancel()
+            persister.result()
+        try:
+            await producers
+        finally:
+            await self._pages.put(None)
+            await persister
+        if self.scheduler is not None:
+            self._save_yields()
+        if self.detects_removals:
+            archived = await asyncio.to_thread(self.db.archive_removed, self.brand, self.run_id)
+            # A suspiciously small sweep neither removes vehicles nor becomes
+            # the baseline the next sweep is compared with
+            self.full_sweep = archived is not None
+        self.db.finish_run(self.run_id, full_sweep=self.detects_removals)
+
+    @property
+    def detects_removals(self) -> bool:
+        """Whether the run saw every listing, so vehicles it missed were really removed"""
+        return self.full_sweep and not self.failed_pages
+
+    def _start_run(self, zip_codes: List[str]) -> List[str]:
+        """Start or resume a run and return the ZIPs it still has to fetch"""
+        run_id = self.db.get_unfinished_run(self.brand) if self.resume else None
+        skip = set()
+        if run_id is not None:
+            skip = self.db.get_completed_zips(run_id)
+            logger.info("Resuming %s run %s with %d ZIPs already done",
+                        self.brand, run_id, len(skip & set(zip_codes)))
+            self.metrics.inc('zips_skipped', len(skip & set(zip_codes)),
+                             brand=self.brand, reason='resumed')
+        else:
+            run_id = self.db.start_run(self.brand)
+        self.run_id = run_id
+
+        fresh = set()
+        if self.freshness_ttl > 0:
+            fresh = self.db.get_fresh_zips(self.brand, self.freshness_ttl) - skip
+            fresh &= set(zip_codes)
+            if fresh:
+                logger.info("Skipping %d %s ZIPs crawled in the last %gs",
+                            len(fresh), self.brand, self.freshness_ttl)
+                self.metrics.inc('zips_skipped', len(fresh), brand=self.brand, reason='fresh')
+            skip |= fresh
+        self.full_sweep = not fresh
+        zip_codes = [zip_code for zip_code in zip_codes if zip_code not in skip]
+
+        if self.scheduler is not None:
+            self._run_number = self.db.get_run_number(self.brand, run_id)
+            schedule = self.scheduler.schedule(
+                zip_codes, self.db.get_zip_yields(self.brand), self._run_number)
+            logger.info("%s %s", self.brand, schedule.get_summary())
+            self.metrics.inc('zips_skipped', len(schedule.deferred),
+                             brand=self.brand, reason='low_yield')
+            zip_codes = schedule.zip_codes
+            self.full_sweep = self.full_sweep and not schedule.deferred
+        return zip_codes
+
+    @staticmethod
+    def _credit_vins(frame: pd.DataFrame, zip_code: str) -> pd.DataFrame:
+        """Pair the VINs of a page with the ZIP that returned them"""
+        return pd.DataFrame({'vin': frame['vin'].drop_duplicates(), 'zip_code': zip_code})
+
+    def _count_yields(self, changes: pd.DataFrame, credits: List[pd.DataFrame]):
+        """Add the new and repriced VINs of a stored batch to their ZIPs' yields.
+
+        A VIN is credited to the first ZIP that returned it: the first page of
+        the batch, unless an earlier batch of the run already stored it.
+        """
+        if changes.empty or not credits:
+            return
+        first_seen = changes.loc[~changes['seen_in_run'], ['vin', 'price_previous', 'price_change']]
+        credited = pd.concat(credits, ignore_index=True).drop_duplicates(
+            subset='vin').merge(first_seen, on='vin')
+        credited['new_vins'] = credited['price_previous'].isna()
+        credited['price_changes'] = credited['price_change'] != 0
+        totals = credited.groupby('zip_code')[['new_vins', 'price_changes']].sum()
+        for zip_code, new_vins, price_changes in totals.itertuples(name=None):
+            counts = self._zip_yields.setdefault(zip_code, [0, 0])
+            counts[0] += int(new_vins)
+            counts[1] += int(price_changes)
+
+    def _save_yields(self):
+        """Fold this run's per-ZIP yields into the scheduler's records"""
+        completed = self.db.get_completed_zips(self.run_id)
+        crawled = {
+            zip_code: (requests, *self._zip_yields.get(zip_code, (0, 0)))
+            for zip_code, requests in self._zip_requests.items()
+            if zip_code in completed
+        }
+        if crawled:
+            yields = self.scheduler.update(
+                self.db.get_zip_yields(self.brand), crawled, self._run_number)
+            self.db.save_zip_yields(self.brand, yields)
+
+    async def _persist_pages(self):
+        """Transform queued pages and persist them in batches until the crawl ends"""
+        frames: List[pd.DataFrame] = []
+        completed: List[ZipCompleted] = []
+        credits: List[pd.DataFrame] = []
+        pending = 0
+        while True:
+            page = await self._pages.get()
+            if page is None:
+                break
+            if isinstance(page, ZipCompleted):
+                # Checkpointed with the batch holding the ZIP's last vehicles
+                completed.append(page)
+                continue
+            with self.metrics.stage('transform', brand=self.brand):
+                frame = self.transformer.transform_batch(page.vehicles)
+            if self.scheduler is not None and len(frame):
+                credits.append(self._credit_vins(frame, page.zip_code))
+            frames.append(frame)
+            pending += len(frame)
+            if pending >= self.batch_size:
+                await self._flush(frames, completed, credits)
+                frames, completed, credits, pending = [], [], [], 0
+        if pending or completed:
+            await self._flush(frames, completed, credits)
+
+    async def _flush(self, frames: List[pd.DataFrame], completed: List[ZipCompleted],
+                     credits: List[pd.DataFrame]):
+        """Write a batch of page frames, then checkpoint the ZIPs it finished"""
+        if frames:
+            # Deduplicate using VIN within the batch; the database handles
+            # VINs that were already stored earlier in the same run
+            batch = pd.concat(frames, ignore_index=True).drop_duplicates(
+                subset='vin', keep='last')
+            changes = await asyncio.to_thread(self.db.update_inventory, batch, self.run_id)
+            self.vehicles_stored += len(batch)
+            self._count_yields(changes, credits)
+        if completed:
+            await asyncio.to_thread(
+                self.db.mark_zips_complete, self.brand, self.run_id,
+                [(zip_done.zip_code, zip_done.vehicles) for zip_done in completed])
+
+    async def _crawl_zip_code(self, index: int, zip_code: str):
+        """Run every planned search for a single zip code.
+
+        A ZIP with a failed page is not checkpointed, so a resumed run retries it.
+        """
+        logger.info("Fetching %s inventory for ZIP: %s", self.brand, zip_code)
+        searches = await asyncio.gather(*(
+            self._crawl_search(zip_code, query.filters) for query in self.queries))
+        if not any(search.failed for search in searches):
+            await self._pages.put(ZipCompleted(
+                zip_code, sum(search.vehicles for search in searches)))
+        logger.info("%s ZIP code %d done", self.brand, index)
+
+    async def _crawl_search(self, zip_code: str, filters: SearchProfile) -> SearchResult:
+        """Fetch every page of one search in a ZIP and count what it returned.
+
+        The first page's result total decides how many pages exist, and the
+        rest are fetched in one concurrent wave. When the API does not report
+        a total, or the wave returned fewer vehicles than it, pages are fetched
+        one by one until an empty page comes back; a short page is not taken
+        as the last, since APIs may cap pages below the size asked for.
+        """
+        first_page = await self._fetch_zip_page(zip_code, 0, filters)
+        if first_page is None:
+            return SearchResult(failed=True)
+        count, total = first_page
+        result = SearchResult(count)
+        if not count:
+            return result
+        page_index = 1
+        if total is not None:
+            if total <= count:
+                return result
+            if count < self.page_size:
+                logger.warning("%s API returned %d of %d results asked for; paging by %d",
+                               self.brand, count, self.page_size, count)
+                self.page_size = count
+            page_count = math.ceil(total / self.page_size)
+            wave = await asyncio.gather(*(
+                self._fetch_zip_page(zip_code, page_index, filters)
+                for page_index in range(1, page_count)
+            ))
+            result.failed = any(page is None for page in wave)
+            result.vehicles += sum(page[0] for page in wave if page is not None)
+            if result.failed or result.vehicles >= total:
+                return result
+            page_index = page_count
+        while True:
+            page = await self._fetch_zip_page(zip_code, page_index, filters)
+            if page is None:
+                result.failed = True
+                break
+            result.vehicles += page[0]
+            if not page[0]:
+                break
+            page_index += 1
+        return result
+
+    async def _fetch_zip_page(self, zip_code: str, page_index: int,
+                              filters: SearchProfile) -> Optional[Tuple[int, Optional[int]]]:
+        """Fetch one page and hand it to the persister.
+
+        Returns the page's vehicle count and reported total, or None if the
+        page failed; the page itself is only held by the persister's queue.
+        """
+        self._zip_requests[zip_code] += 1
+        async with self._semaphore:
+            try:
+                page = await self._fetch_page_in_thread(zip_code, page_index, filters)
+            except FetchError as e:
+                logger.warning("Failed %s %s page %d for ZIP %s: %s",
+                               self.brand, filters.name, page_index, zip_code, e)
+                self.metrics.inc('failed_pages', brand=self.brand, zip=zip_code)
+                self.failed_pages.append((zip_code, page_index, str(e)))
+                return None
+
+            page.zip_code = zip_code
+            count = len(page.vehicles)
+            self.metrics.inc('pages', brand=self.brand, zip=zip_code)
+            self.metrics.inc('vehicles_fetched', count, brand=self.brand, zip=zip_code)
+            # The slot is held until the page is queued, so a persister that
+            # falls behind stops new fetches instead of piling up pages
+            await self._pages.put(page)
+        logger.debug("Retrieved %d %s vehicles on page %d for ZIP %s",
+                     count, self.brand, page_index, zip_code)
+        return count, page.total
 
     def generate_report(self, duration: str) -> Report:
-        """Generate a report from the crawled inventory"""
-        df_with_changes = self.db.update_inventory(
-            list(self.all_vehicles.values()))
-        return Report.from_dataframe(df_with_changes, self.all_vehicles[list(
-            self.all_vehicles.keys())[0]].brand, duration)
+        """Generate a report from the vehicles this run stored in the database.
+
+        Vehicles are labelled with the profiles whose filters they match. Every
+        stored vehicle is reported, including any a merged search returned
+        for no profile, so the report always agrees with the database.
+        """
+        with self.metrics.stage('report', brand=self.brand):
+            df_with_changes = self.db.get_run_inventory(self.brand, self.run_id)
+            df_with_changes['profile'] = label_profiles(
+                df_with_changes, self.queries, self.local_dimensions, self.inexact_dimensions)
+            removed = None
+            if self.detects_removals:
+                removed = self.db.get_removed_inventory(self.brand, self.run_id)
+        return Report.from_dataframe(df_with_changes, self.brand, duration,
+                                     failed_pages=len(self.failed_pages),
+                                     metrics=self.metrics, removed=removed)
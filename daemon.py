@@ -0,0 +1,114 @@
+import logging
+import random
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from crawler import InventoryCrawler
+from metrics import RunMetrics
+from report import Report
+from reporter import EmailReporter
+
+logger = logging.getLogger(__name__)
+
+
+class CrawlDaemon:
+    """Keeps one crawler per brand resident and crawls each brand on its own interval.
+
+    Crawlers are created once, so their HTTP sessions, rate limiters and the
+    database writer connection stay warm between cycles. Each brand runs in its
+    own thread; a cycle's start is spread by `jitter` (a fraction of the
+    interval) so brands sharing a host do not fire together. A report is
+    emailed only when a cycle found new, removed or repriced vehicles.
+
+    SIGTERM and SIGINT stop the daemon after the cycles in progress finish.
+    """
+
+    def __init__(self, brands: List[str], crawler_factory: Callable[[str], InventoryCrawler],
+                 zip_codes: List[str], intervals: Dict[str, float], jitter: float = 0.1,
+                 reporter: EmailReporter = None, to_emails: List[str] = None,
+                 metrics: RunMetrics = None, metrics_dir: Optional[Path] = None):
+        self.brands = brands
+        self.crawler_factory = crawler_factory
+        self.zip_codes = zip_codes
+        self.intervals = intervals
+        self.jitter = jitter
+        self.reporter = reporter
+        self.to_emails = to_emails or []
+        # Counters accumulate over the daemon's lifetime, as Prometheus expects
+        self.metrics = metrics or RunMetrics()
+        self.metrics_dir = metrics_dir
+        self.cycles = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._rng = random.Random()
+
+    def run(self):
+        """Run until stopped; must be called from the main thread to receive signals"""
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._handle_signal)
+        threads = [threading.Thread(target=self._brand_loop, args=(brand,),
+                                    name=f'crawl:{brand}', daemon=True)
+                   for brand in self.brands]
+        for thread in threads:
+            thread.start()
+        logger.info("Daemon started for %s", ', '.join(self.brands))
+        # Join with a timeout so the main thread keeps handling signals
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=1)
+        logger.info("Daemon stopped after %d cycles", self.cycles)
+
+    def stop(self):
+        """Ask every brand loop to exit after its current cycle"""
+        self._stop.set()
+
+    def _handle_signal(self, signum, frame):
+        logger.info("Received %s, stopping after the current cycles",
+                    signal.Signals(signum).name)
+        self.stop()
+
+    def _next_delay(self, brand: str) -> float:
+        interval = self.intervals[brand]
+        return max(0.0, interval * (1 + self._rng.uniform(-self.jitter, self.jitter)))
+
+    def _brand_loop(self, brand: str):
+        """Crawl one brand every interval until the daemon stops"""
+        crawler = self.crawler_factory(brand)
+        # Spread the first cycles so brands do not all start at once
+        if self._stop.wait(self._rng.uniform(0, self.jitter * self.intervals[brand])):
+            return
+        while not self._stop.is_set():
+            try:
+                self.run_cycle(crawler)
+            except Exception:
+                # A failed cycle is retried on the next interval
+                logger.exception("%s crawl cycle failed", crawler.brand)
+                self.metrics.inc('daemon_cycle_failures', brand=crawler.brand)
+            self._stop.wait(self._next_delay(brand))
+
+    def run_cycle(self, crawler: InventoryCrawler) -> Report:
+        """Crawl every ZIP once for a brand and email the report if anything changed"""
+        start_time = time.time()
+        crawler.crawl_zip_codes(self.zip_codes)
+        duration = time.strftime('%H:%M:%S', time.gmtime(time.time() - start_time))
+        report = crawler.generate_report(duration)
+        logger.info("%s cycle finished in %s: %d vehicles, %d new, %d removed, %d price changes",
+                    report.brand, duration, report.total_vehicles, report.new_vehicles,
+                    report.removed_vehicles, report.price_changes)
+        self.metrics.inc('daemon_cycles', brand=report.brand)
+
+        if report.has_changes and self.reporter is not None and self.to_emails:
+            self.reporter.send_report(
+                df=report.get_dataframe(),
+                duration=duration,
+                subject=f"Vehicle Inventory Update - {report.brand}",
+                to_emails=self.to_emails,
+                removed=report.get_removed_dataframe()
+            )
+        with self._lock:
+            self.cycles += 1
+            if self.metrics_dir is not None:
+                self.metrics.write(self.metrics_dir)
+        return report
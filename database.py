@@ -1,130 +1,671 @@
+import logging
+import os
+import queue
 import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from contextlib import contextmanager
 import pandas as pd
-from typing import List, Dict, Any, Tuple
-from models import Vehicle
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple, Union
+from metrics import RunMetrics
+from models import VEHICLE_COLUMNS, Vehicle, vehicles_to_frame
 
+logger = logging.getLogger(__name__)
+
+# Per-connection tuning; WAL itself is persistent and set once in _init_db
+CONNECTION_PRAGMAS = (
+    'PRAGMA busy_timeout = 30000',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -20000'
+)
+
+INVENTORY_COLUMNS = VEHICLE_COLUMNS
+REPORT_COLUMNS = INVENTORY_COLUMNS + ['price_previous', 'price_change', 'price_change_pct']
+# Every inventory column, copied to the archive when a vehicle is removed
+ARCHIVE_COLUMNS = INVENTORY_COLUMNS + ['last_updated', 'price_previous', 'price_change',
+                                       'price_change_pct', 'last_seen_run']
+YIELD_COLUMNS = ['zip_code', 'score', 'low_streak', 'last_run',
+                 'requests', 'new_vins', 'price_changes']
+
+# Columns added after the original schema, with their declarations
+INVENTORY_MIGRATIONS = {
+    'price_previous': 'REAL',
+    'price_change': 'REAL DEFAULT 0',
+    'price_change_pct': 'REAL DEFAULT 0',
+    'last_seen_run': 'TEXT'
+}
+CRAWL_RUN_MIGRATIONS = {
+    'full_sweep': 'INTEGER DEFAULT 0',
+    'vehicles': 'INTEGER'   # Vehicles the run saw, set when it finishes
+}
+# A sweep that saw fewer vehicles than this fraction of the brand's previous
+# full sweep is treated as a broken response rather than mass removals
+MIN_SWEEP_FRACTION = 0.5
+
+
+def open_connection(db_file: str, **kwargs) -> sqlite3.Connection:
+    """Open a SQLite connection with the repo's standard pragmas applied"""
+    conn = sqlite3.connect(db_file, timeout=30, **kwargs)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class DatabaseWriter:
+    """Serializes all writes to a SQLite file through one connection on a dedicated thread.
+
+    Each submitted job runs inside its own BEGIN IMMEDIATE transaction, so
+    crawler threads never contend for the write lock with each other, and
+    writers in other processes wait on busy_timeout instead of failing.
+    """
 
-class InventoryDatabase:
     def __init__(self, db_file: str):
         self.db_file = db_file
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name=f'db-writer:{os.path.basename(db_file)}', daemon=True)
+        self._thread.start()
+
+    def submit(self, job: Callable[..., Any], *args) -> Future:
+        """Queue job(conn, *args) to run in a transaction; returns a Future with its result"""
+        future = Future()
+        self._queue.put((job, args, future))
+        return future
+
+    def close(self):
+        """Finish queued jobs and stop the writer thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        conn = open_connection(self.db_file, isolation_level=None)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                job, args, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                    result = job(conn, *args)
+                    conn.execute('COMMIT')
+                except BaseException as e:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+        finally:
+            conn.close()
+
+
+_writers: Dict[str, DatabaseWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(db_file: str) -> DatabaseWriter:
+    """Return the process-wide writer for a database file, starting it on first use"""
+    key = os.path.abspath(db_file)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = DatabaseWriter(db_file)
+            _writers[key] = writer
+        return writer
+
+
+class InventoryDatabase:
+    def __init__(self, db_file: str, metrics: RunMetrics = None):
+        self.db_file = db_file
+        self.metrics = metrics or RunMetrics()
+        self.writer = get_writer(db_file)
         self._init_db()
 
+    @contextmanager
+    def _connect(self):
+        """Open a short-lived tuned connection and close it afterwards"""
+        conn = open_connection(self.db_file)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
     def _init_db(self):
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''CREATE TABLE IF NOT EXISTS inventory (
-                vin TEXT PRIMARY KEY,
-                model TEXT,
-                price REAL,
-                odometer REAL,
-                drivetrain TEXT,
-                url TEXT,
-                brand TEXT,
-                series TEXT,           -- BMW specific
-                cpo_status TEXT,       -- BMW specific
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(vin, brand)     -- Allow same VIN for different brands
-            )''')
-            conn.commit()
-
-    def _vehicles_to_dataframe(self, vehicles: List[Vehicle]) -> pd.DataFrame:
-        """Convert Vehicle objects to DataFrame"""
-        return pd.DataFrame([{
-            'vin': v.vin,
-            'model': v.model,
-            'price': v.price,
-            'odometer': v.odometer,
-            'drivetrain': v.drivetrain,
-            'url': v.url,
-            'brand': v.brand,
-            'series': v.raw_data.get('series', ''),
-            'cpo_status': v.raw_data.get('cpoStatus', '')
-        } for v in vehicles])
-
-    def _get_previous_inventory(self, brand: str) -> pd.DataFrame:
-        """Get previous inventory for a specific brand"""
-        with sqlite3.connect(self.db_file) as conn:
+        """Create or migrate the schema.
+
+        WAL cannot be switched on inside a transaction, so it is set first; the
+        schema itself is built through the writer, in one BEGIN IMMEDIATE
+        transaction, so databases opened at the same time in other threads or
+        processes never run the same migration twice.
+        """
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode = WAL')
+        self.writer.submit(self._create_schema).result()
+
+    @classmethod
+    def _create_schema(cls, conn: sqlite3.Connection):
+        """Create missing tables, columns and indexes; runs inside the writer's transaction"""
+        cursor = conn.cursor()
+        cursor.execute('''CREATE TABLE IF NOT EXISTS inventory (
+            vin TEXT PRIMARY KEY,
+            model TEXT,
+            price REAL,
+            odometer REAL,
+            drivetrain TEXT,
+            url TEXT,
+            brand TEXT,
+            series TEXT,           -- BMW specific
+            cpo_status TEXT,       -- BMW specific
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(vin, brand)     -- Allow same VIN for different brands
+        )''')
+        cls._add_columns(cursor, 'inventory', INVENTORY_MIGRATIONS)
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_inventory_brand_vin
+            ON inventory(brand, vin)''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_inventory_brand_run
+            ON inventory(brand, last_seen_run)''')
+        # Sort orders of the query service, ending in vin for keyset pagination
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_inventory_brand_price
+            ON inventory(brand, price, vin)''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_inventory_brand_odometer
+            ON inventory(brand, odometer, vin)''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_inventory_price
+            ON inventory(price, vin)''')
+
+        history_exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'price_history'"
+        ).fetchone()
+        # One row per price/odometer change. The clustered primary key
+        # covers every per-VIN query, so lookups never touch other VINs.
+        cursor.execute('''CREATE TABLE IF NOT EXISTS price_history (
+            brand TEXT NOT NULL,
+            vin TEXT NOT NULL,
+            ts INTEGER NOT NULL,   -- Unix epoch seconds
+            price REAL,
+            odometer REAL,
+            PRIMARY KEY (brand, vin, ts)
+        ) WITHOUT ROWID''')
+        if not history_exists:
+            # Seed from the current snapshot so existing VINs have a baseline
+            cursor.execute('''INSERT OR IGNORE INTO price_history
+                SELECT brand, vin, CAST(strftime('%s', last_updated) AS INTEGER), price, odometer
+                FROM inventory''')
+
+        # A crawl run per brand; runs that never finished can be resumed
+        cursor.execute('''CREATE TABLE IF NOT EXISTS crawl_runs (
+            run_id TEXT PRIMARY KEY,
+            brand TEXT NOT NULL,
+            started INTEGER NOT NULL,  -- Unix epoch seconds
+            finished INTEGER           -- NULL while the run is in progress
+        )''')
+        cls._add_columns(cursor, 'crawl_runs', CRAWL_RUN_MIGRATIONS)
+        # One row per ZIP a run fetched completely and persisted
+        cursor.execute('''CREATE TABLE IF NOT EXISTS crawl_progress (
+            run_id TEXT NOT NULL,
+            zip_code TEXT NOT NULL,
+            brand TEXT NOT NULL,
+            completed INTEGER NOT NULL,  -- Unix epoch seconds
+            vehicles INTEGER NOT NULL,
+            PRIMARY KEY (run_id, zip_code)
+        ) WITHOUT ROWID''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_crawl_progress_brand_completed
+            ON crawl_progress(brand, completed)''')
+        # Vehicles that disappeared from the listings, moved out of inventory
+        # so the active table only holds what is currently for sale
+        cursor.execute('''CREATE TABLE IF NOT EXISTS inventory_archive (
+            vin TEXT NOT NULL,
+            model TEXT,
+            price REAL,
+            odometer REAL,
+            drivetrain TEXT,
+            url TEXT,
+            brand TEXT,
+            series TEXT,
+            cpo_status TEXT,
+            last_updated TIMESTAMP,
+            price_previous REAL,
+            price_change REAL,
+            price_change_pct REAL,
+            last_seen_run TEXT,
+            removed_run TEXT NOT NULL,
+            removed_at INTEGER NOT NULL  -- Unix epoch seconds
+        )''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_inventory_archive_run
+            ON inventory_archive(removed_run)''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_inventory_archive_brand_vin
+            ON inventory_archive(brand, vin)''')
+        # What each ZIP search contributed, for the adaptive scheduler
+        cursor.execute('''CREATE TABLE IF NOT EXISTS zip_yield (
+            brand TEXT NOT NULL,
+            zip_code TEXT NOT NULL,
+            score REAL NOT NULL,         -- Averaged new VINs + price changes per request
+            low_streak INTEGER NOT NULL, -- Consecutive crawls below the yield threshold
+            last_run INTEGER NOT NULL,   -- Run number of the brand's last crawl of the ZIP
+            requests INTEGER NOT NULL,   -- Counts from the last crawl
+            new_vins INTEGER NOT NULL,
+            price_changes INTEGER NOT NULL,
+            PRIMARY KEY (brand, zip_code)
+        ) WITHOUT ROWID''')
+
+    @staticmethod
+    def _add_columns(cursor: sqlite3.Cursor, table: str, migrations: Dict[str, str]):
+        """Add columns introduced after a table was first created.
+
+        The columns are read inside the caller's write transaction; a column
+        that exists anyway, added by an older writer outside that lock, counts
+        as migrated.
+        """
+        existing = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+        for column, declaration in migrations.items():
+            if column in existing:
+                continue
+            try:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+            except sqlite3.OperationalError as e:
+                if 'duplicate column name' not in str(e):
+                    raise
+
+    @staticmethod
+    def _stage_batch(conn: sqlite3.Connection, rows: List[Tuple]):
+        """Load the current batch into a connection-local temp table"""
+        conn.execute('''CREATE TEMP TABLE IF NOT EXISTS current_batch (
+            vin TEXT,
+            model TEXT,
+            price REAL,
+            odometer REAL,
+            drivetrain TEXT,
+            url TEXT,
+            brand TEXT,
+            series TEXT,
+            cpo_status TEXT,
+            seen_in_run INTEGER NOT NULL DEFAULT 0
+        )''')
+        conn.execute('DELETE FROM current_batch')
+        conn.executemany(
+            f"INSERT INTO current_batch ({', '.join(INVENTORY_COLUMNS)}) "
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    @staticmethod
+    def _mark_seen_in_run(conn: sqlite3.Connection, run_id: str):
+        """Flag staged VINs that an earlier batch of the same run already stored"""
+        conn.execute('''
+            UPDATE current_batch SET seen_in_run = EXISTS (
+                SELECT 1 FROM inventory i
+                WHERE i.brand = current_batch.brand AND i.vin = current_batch.vin
+                  AND i.last_seen_run IS :run_id
+            )
+        ''', {'run_id': run_id})
+
+    @staticmethod
+    def _record_price_history(conn: sqlite3.Connection):
+        """Append a history event for staged VINs that are new or changed price/odometer.
+
+        Events are keyed by the second, so of several changes to a VIN within
+        one second the last one is kept.
+        """
+        conn.execute('''
+            INSERT OR REPLACE INTO price_history (brand, vin, ts, price, odometer)
+            SELECT c.brand, c.vin, ?, c.price, c.odometer
+            FROM current_batch c
+            LEFT JOIN inventory i ON i.brand = c.brand AND i.vin = c.vin
+            WHERE i.vin IS NULL
+               OR i.price IS NOT c.price
+               OR i.odometer IS NOT c.odometer
+        ''', (int(time.time()),))
+
+    @staticmethod
+    def _upsert_batch(conn: sqlite3.Connection, run_id: str):
+        """Upsert the staged batch, computing price changes against the stored rows.
+
+        The baseline is the price before this run, so a VIN that shows up in
+        several batches of the same run keeps the change from its first sighting.
+        """
+        # "WHERE true" keeps SQLite from parsing ON CONFLICT as a join constraint
+        conn.execute('''
+            INSERT INTO inventory (
+                vin, model, price, odometer, drivetrain, url, brand, series, cpo_status,
+                price_previous, price_change, price_change_pct, last_seen_run
+            )
+            SELECT vin, model, price, odometer, drivetrain, url, brand, series, cpo_status,
+                   previous,
+                   COALESCE(price - previous, 0),
+                   COALESCE((price - previous) / previous * 100, 0),
+                   :run_id
+            FROM (
+                SELECT c.*,
+                       CASE WHEN i.last_seen_run IS :run_id THEN i.price_previous
+                            ELSE i.price END AS previous
+                FROM current_batch c
+                LEFT JOIN inventory i ON i.brand = c.brand AND i.vin = c.vin
+            ) WHERE true
+            ON CONFLICT(vin, brand) DO UPDATE SET
+                model = excluded.model,
+                price = excluded.price,
+                odometer = excluded.odometer,
+                drivetrain = excluded.drivetrain,
+                url = excluded.url,
+                series = excluded.series,
+                cpo_status = excluded.cpo_status,
+                price_previous = excluded.price_previous,
+                price_change = excluded.price_change,
+                price_change_pct = excluded.price_change_pct,
+                last_seen_run = excluded.last_seen_run,
+                last_updated = CURRENT_TIMESTAMP
+        ''', {'run_id': run_id})
+
+    @staticmethod
+    def _fetch_batch_changes(conn: sqlite3.Connection) -> Tuple[List[str], List[Tuple]]:
+        """Read back the staged VINs with their price changes, touching only matching (brand, vin) rows"""
+        cursor = conn.execute(f'''
+            SELECT {', '.join('i.' + column for column in REPORT_COLUMNS)}, c.seen_in_run
+            FROM current_batch c
+            JOIN inventory i ON i.brand = c.brand AND i.vin = c.vin
+            ORDER BY c.rowid
+        ''')
+        columns = [description[0] for description in cursor.description]
+        return columns, cursor.fetchall()
+
+    def _diff_and_upsert(self, conn: sqlite3.Connection, rows: List[Tuple],
+                         run_id: str) -> Tuple[List[str], List[Tuple]]:
+        """Stage, diff and upsert a batch; runs inside the writer's transaction"""
+        with self.metrics.stage('db_diff'):
+            self._stage_batch(conn, rows)
+            self._mark_seen_in_run(conn, run_id)
+            self._record_price_history(conn)
+        with self.metrics.stage('upsert'):
+            self._upsert_batch(conn, run_id)
+        with self.metrics.stage('db_diff'):
+            return self._fetch_batch_changes(conn)
+
+    @staticmethod
+    def new_run_id() -> str:
+        """Create an identifier for a crawl run; rows seen in the run are stamped with it"""
+        return uuid.uuid4().hex
+
+    def update_inventory(self, vehicles: Union[pd.DataFrame, List[Vehicle]],
+                         run_id: str = None) -> pd.DataFrame:
+        """Update inventory and return DataFrame with price changes.
+
+        `seen_in_run` tells whether an earlier batch of the same run already
+        stored the VIN. Accepts a frame from VehicleTransformer.transform_batch or a list of
+        Vehicle objects.
+        """
+        if len(vehicles) == 0:
+            return pd.DataFrame()
+
+        if not isinstance(vehicles, pd.DataFrame):
+            vehicles = vehicles_to_frame(vehicles)
+        # The last sighting of a VIN wins
+        df_current = vehicles.drop_duplicates(subset='vin', keep='last')
+        rows = list(df_current[INVENTORY_COLUMNS].itertuples(index=False, name=None))
+
+        # Diff against the stored prices and update the database in one transaction
+        columns, records = self.writer.submit(
+            self._diff_and_upsert, rows, run_id or self.new_run_id()).result()
+        changes = pd.DataFrame.from_records(records, columns=columns)
+        return changes.astype({'seen_in_run': bool})
+
+    def start_run(self, brand: str) -> str:
+        """Record the start of a new crawl run and return its id"""
+        run_id = self.new_run_id()
+        self.writer.submit(lambda conn: conn.execute(
+            'INSERT INTO crawl_runs (run_id, brand, started) VALUES (?, ?, ?)',
+            (run_id, brand, int(time.time())))).result()
+        return run_id
+
+    def finish_run(self, run_id: str, full_sweep: bool = False):
+        """Mark a crawl run as finished so it is no longer resumed, with the vehicles it saw"""
+        self.writer.submit(lambda conn: conn.execute(
+            """UPDATE crawl_runs SET finished = ?, full_sweep = ?,
+                      vehicles = (SELECT COUNT(*) FROM inventory
+                                  WHERE brand = crawl_runs.brand
+                                  AND last_seen_run = crawl_runs.run_id)
+               WHERE run_id = ?""",
+            (int(time.time()), int(full_sweep), run_id))).result()
+
+    def get_unfinished_run(self, brand: str) -> Optional[str]:
+        """Get the most recent run for a brand that was interrupted before finishing"""
+        with self._connect() as conn:
+            row = conn.execute(
+                """SELECT run_id FROM crawl_runs
+                   WHERE brand = ? AND finished IS NULL
+                   ORDER BY started DESC LIMIT 1""",
+                (brand,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_latest_runs(self) -> Dict[str, Tuple[str, bool, int]]:
+        """Get the most recent finished run of every brand, whether it was a full sweep,
+        and when it finished in Unix epoch seconds"""
+        with self._connect() as conn:
+            return {brand: (run_id, bool(full_sweep), finished)
+                    for brand, run_id, full_sweep, finished in conn.execute(
+                        """SELECT brand, run_id, full_sweep, finished FROM crawl_runs
+                           WHERE rowid IN (SELECT MAX(rowid) FROM crawl_runs
+                                           WHERE finished IS NOT NULL GROUP BY brand)""")}
+
+    @staticmethod
+    def _archive_unseen(conn: sqlite3.Connection, brand: str, run_id: str,
+                        min_fraction: float) -> Optional[Tuple[List[str], List[Tuple]]]:
+        """Move the brand's rows the run did not see into the archive and return them.
+
+        Returns None without archiving when the run saw no vehicles, or fewer
+        than `min_fraction` of the brand's previous full sweep.
+        """
+        seen = conn.execute(
+            'SELECT COUNT(*) FROM inventory WHERE brand = ? AND last_seen_run = ?',
+            (brand, run_id)).fetchone()[0]
+        previous = conn.execute(
+            """SELECT vehicles FROM crawl_runs
+               WHERE brand = ? AND run_id != ? AND full_sweep = 1 AND vehicles IS NOT NULL
+               ORDER BY rowid DESC LIMIT 1""",
+            (brand, run_id)).fetchone()
+        if seen == 0 or (previous is not None and seen < min_fraction * previous[0]):
+            logger.warning("Not archiving %s vehicles: run %s saw %d vehicles, the previous "
+                           "full sweep %s", brand, run_id, seen,
+                           previous[0] if previous else 'none')
+            return None
+        columns = ', '.join(ARCHIVE_COLUMNS)
+        # Anti-join on the (brand, last_seen_run) index: rows stamped by any
+        # other run, or never stamped, were not returned by this run
+        conn.execute(f"""
+            INSERT INTO inventory_archive ({columns}, removed_run, removed_at)
+            SELECT {columns}, :run_id, :now FROM inventory
+            WHERE brand = :brand AND last_seen_run IS NOT :run_id
+        """, {'brand': brand, 'run_id': run_id, 'now': int(time.time())})
+        conn.execute('DELETE FROM inventory WHERE brand = ? AND last_seen_run IS NOT ?',
+                     (brand, run_id))
+        cursor = conn.execute(
+            f"SELECT {', '.join(REPORT_COLUMNS)} FROM inventory_archive WHERE removed_run = ?",
+            (run_id,))
+        return [description[0] for description in cursor.description], cursor.fetchall()
+
+    def archive_removed(self, brand: str, run_id: str,
+                        min_fraction: float = MIN_SWEEP_FRACTION) -> Optional[pd.DataFrame]:
+        """Archive the brand's vehicles a full-sweep run no longer found and return them.
+
+        Only call this for runs that searched every ZIP without failures;
+        otherwise vehicles that were merely not searched would be archived.
+        Returns None when the run saw implausibly few vehicles, such as an
+        empty or changed response, and nothing was archived.
+        """
+        with self.metrics.stage('archive', brand=brand):
+            archived = self.writer.submit(
+                self._archive_unseen, brand, run_id, min_fraction).result()
+        if archived is None:
+            self.metrics.inc('archive_skipped', brand=brand)
+            return None
+        columns, records = archived
+        self.metrics.inc('vehicles_removed', len(records), brand=brand)
+        return pd.DataFrame.from_records(records, columns=columns)
+
+    def get_removed_inventory(self, brand: str, run_id: str) -> pd.DataFrame:
+        """Get the vehicles a run archived as removed"""
+        with self._connect() as conn:
             return pd.read_sql_query(
-                "SELECT * FROM inventory WHERE brand = ?",
+                f"SELECT {', '.join(REPORT_COLUMNS)} FROM inventory_archive "
+                "WHERE brand = ? AND removed_run = ?",
+                conn,
+                params=(brand, run_id)
+            )
+
+    def get_archived_inventory(self, brand: str) -> pd.DataFrame:
+        """Get every archived vehicle of a brand, most recently removed first"""
+        with self._connect() as conn:
+            df = pd.read_sql_query(
+                "SELECT * FROM inventory_archive WHERE brand = ? ORDER BY removed_at DESC",
                 conn,
                 params=(brand,)
             )
+        df['removed_at'] = pd.to_datetime(df['removed_at'], unit='s')
+        return df
 
-    def _calculate_price_changes(self, df_current: pd.DataFrame, df_previous: pd.DataFrame) -> pd.DataFrame:
-        """Calculate price changes between current and previous inventory"""
-        df_merged = df_current.merge(
-            df_previous[['vin', 'price']],
-            on='vin',
-            how='left',
-            suffixes=('', '_previous')
-        )
-
-        df_merged['price_change'] = df_merged['price'] - \
-            df_merged['price_previous']
-        df_merged['price_change_pct'] = (
-            df_merged['price_change'] / df_merged['price_previous']
-        ) * 100
-
-        df_merged['price_change'] = df_merged['price_change'].fillna(0)
-        df_merged['price_change_pct'] = df_merged['price_change_pct'].fillna(0)
-
-        return df_merged
-
-    def _update_database(self, df_current: pd.DataFrame):
-        """Update database with current inventory"""
-        with sqlite3.connect(self.db_file) as conn:
-            for _, row in df_current.iterrows():
-                conn.execute('''
-                    INSERT INTO inventory (
-                        vin, model, price, odometer, drivetrain, url, brand, series, cpo_status
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(vin, brand) DO UPDATE SET
-                        model = excluded.model,
-                        price = excluded.price,
-                        odometer = excluded.odometer,
-                        drivetrain = excluded.drivetrain,
-                        url = excluded.url,
-                        series = excluded.series,
-                        cpo_status = excluded.cpo_status,
-                        last_updated = CURRENT_TIMESTAMP
-                ''', (
-                    row['vin'], row['model'], row['price'], row['odometer'],
-                    row['drivetrain'], row['url'], row['brand'], row['series'],
-                    row['cpo_status']
-                ))
-            conn.commit()
-
-    def update_inventory(self, vehicles: List[Vehicle]) -> pd.DataFrame:
-        """Update inventory and return DataFrame with price changes"""
-        if not vehicles:
-            return pd.DataFrame()
+    def mark_zips_complete(self, brand: str, run_id: str, zip_vehicles: List[Tuple[str, int]]):
+        """Record ZIPs whose pages were all fetched and persisted by a run"""
+        now = int(time.time())
+        rows = [(run_id, zip_code, brand, now, vehicles) for zip_code, vehicles in zip_vehicles]
+        self.writer.submit(lambda conn: conn.executemany(
+            """INSERT OR REPLACE INTO crawl_progress
+               (run_id, zip_code, brand, completed, vehicles) VALUES (?, ?, ?, ?, ?)""",
+            rows)).result()
+
+    def get_completed_zips(self, run_id: str) -> Set[str]:
+        """Get the ZIPs a run has already completed"""
+        with self._connect() as conn:
+            return {row[0] for row in conn.execute(
+                'SELECT zip_code FROM crawl_progress WHERE run_id = ?', (run_id,))}
 
-        # Convert vehicles to DataFrame
-        df_current = self._vehicles_to_dataframe(vehicles)
+    def get_fresh_zips(self, brand: str, max_age: float) -> Set[str]:
+        """Get the ZIPs any run completed for a brand within the last max_age seconds"""
+        with self._connect() as conn:
+            return {row[0] for row in conn.execute(
+                """SELECT DISTINCT zip_code FROM crawl_progress
+                   WHERE brand = ? AND completed >= ?""",
+                (brand, int(time.time() - max_age)))}
 
-        # Get previous inventory
-        brand = vehicles[0].brand
-        df_previous = self._get_previous_inventory(brand)
+    def get_run_number(self, brand: str, run_id: str) -> int:
+        """Get a run's position among the brand's runs, counting from 1"""
+        with self._connect() as conn:
+            return conn.execute(
+                """SELECT COUNT(*) FROM crawl_runs
+                   WHERE brand = ? AND rowid <= (SELECT rowid FROM crawl_runs WHERE run_id = ?)""",
+                (brand, run_id)
+            ).fetchone()[0]
 
-        # Calculate price changes
-        df_with_changes = self._calculate_price_changes(
-            df_current, df_previous)
+    def get_zip_yields(self, brand: str) -> pd.DataFrame:
+        """Get the yield record of every ZIP crawled for a brand"""
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                f"SELECT {', '.join(YIELD_COLUMNS)} FROM zip_yield WHERE brand = ?",
+                conn,
+                params=(brand,)
+            )
 
-        # Update database
-        self._update_database(df_current)
+    def save_zip_yields(self, brand: str, yields: pd.DataFrame):
+        """Insert or replace yield records for a brand's ZIPs"""
+        rows = [(brand,) + row for row in yields[YIELD_COLUMNS].itertuples(index=False, name=None)]
+        self.writer.submit(lambda conn: conn.executemany(
+            f"""INSERT OR REPLACE INTO zip_yield (brand, {', '.join(YIELD_COLUMNS)})
+                VALUES ({', '.join('?' * (len(YIELD_COLUMNS) + 1))})""",
+            rows)).result()
 
-        return df_with_changes
+    def get_run_inventory(self, brand: str, run_id: str) -> pd.DataFrame:
+        """Get the vehicles seen by a crawl run, with their price changes"""
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                f"SELECT {', '.join(REPORT_COLUMNS)} FROM inventory "
+                "WHERE brand = ? AND last_seen_run = ?",
+                conn,
+                params=(brand, run_id)
+            )
 
     def get_all_inventory(self) -> pd.DataFrame:
         """Get all inventory across all brands"""
-        with sqlite3.connect(self.db_file) as conn:
+        with self._connect() as conn:
             return pd.read_sql_query("SELECT * FROM inventory", conn)
 
     def get_brand_inventory(self, brand: str) -> pd.DataFrame:
         """Get inventory for a specific brand"""
-        with sqlite3.connect(self.db_file) as conn:
+        with self._connect() as conn:
             return pd.read_sql_query(
                 "SELECT * FROM inventory WHERE brand = ?",
                 conn,
                 params=(brand,)
             )
+
+    def get_price_history(self, brand: str, vin: str) -> pd.DataFrame:
+        """Get every recorded price/odometer change for a vehicle, oldest first"""
+        with self._connect() as conn:
+            df = pd.read_sql_query(
+                """SELECT ts, price, odometer FROM price_history
+                   WHERE brand = ? AND vin = ? ORDER BY ts""",
+                conn,
+                params=(brand, vin)
+            )
+        df['ts'] = pd.to_datetime(df['ts'], unit='s')
+        return df
+
+    def get_min_prices(self, brand: str, days: int = 30) -> pd.DataFrame:
+        """Get the lowest price each current vehicle has had in the last N days.
+
+        A vehicle's price at the start of the window is its last event before
+        the window, so unchanged vehicles still count. Every lookup is a seek on
+        the (brand, vin, ts) key, so the cost follows the active inventory
+        rather than the size of the history.
+        """
+        window_start = int(time.time()) - days * 86400
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                """SELECT i.vin, i.model, i.price AS current_price,
+                          MIN(
+                              i.price,
+                              COALESCE((SELECT MIN(h.price) FROM price_history h
+                                        WHERE h.brand = i.brand AND h.vin = i.vin
+                                          AND h.ts >= :start), i.price),
+                              COALESCE((SELECT h.price FROM price_history h
+                                        WHERE h.brand = i.brand AND h.vin = i.vin
+                                          AND h.ts < :start
+                                        ORDER BY h.ts DESC LIMIT 1), i.price)
+                          ) AS min_price
+                   FROM inventory i
+                   WHERE i.brand = :brand""",
+                conn,
+                params={'brand': brand, 'start': window_start}
+            )
+
+    def get_price_drop_velocity(self, brand: str, days: int = 30) -> pd.DataFrame:
+        """Get how fast each current vehicle's price fell over the last N days, in dollars per day.
+
+        Vehicles first seen inside the window are measured from their first
+        price. Rows are sorted with the fastest drops first.
+        """
+        now = int(time.time())
+        window_start = now - days * 86400
+        with self._connect() as conn:
+            df = pd.read_sql_query(
+                """SELECT i.vin, i.model, i.price AS current_price,
+                          COALESCE((SELECT h.price FROM price_history h
+                                    WHERE h.brand = i.brand AND h.vin = i.vin
+                                      AND h.ts < :start
+                                    ORDER BY h.ts DESC LIMIT 1),
+                                   (SELECT h.price FROM price_history h
+                                    WHERE h.brand = i.brand AND h.vin = i.vin
+                                      AND h.ts >= :start
+                                    ORDER BY h.ts LIMIT 1)) AS start_price,
+                          COALESCE((SELECT MIN(h.ts) FROM price_history h
+                                    WHERE h.brand = i.brand AND h.vin = i.vin), :start) AS first_seen
+                   FROM inventory i
+                   WHERE i.brand = :brand""",
+                conn,
+                params={'brand': brand, 'start': window_start}
+            )
+        elapsed_days = (now - df['first_seen'].clip(lower=window_start)) / 86400
+        df['price_drop'] = (df['start_price'] - df['current_price']).fillna(0)
+        df['drop_per_day'] = df['price_drop'] / elapsed_days.clip(lower=1)
+        return df.drop(columns=['first_seen']).sort_values('drop_per_day', ascending=False)
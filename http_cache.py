@@ -0,0 +1,80 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Optional
+
+CACHE_MODES = ('off', 'record', 'replay')
+
+
+class ResponseCache:
+    """On-disk store of API response bodies keyed by request.
+
+    In 'record' mode responses younger than the TTL are served from the
+    store and everything fetched from the network is written back. In
+    'replay' mode only the store is used, whatever the age of its entries,
+    which makes a run deterministic and network-free. Opening a cache in
+    'record' mode deletes the entries older than the TTL, so the file only
+    holds responses that can still be served.
+    """
+
+    def __init__(self, path: str, mode: str = 'record', ttl: float = 900):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unsupported cache mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Shard worker processes share the file; writers wait for the lock
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            created REAL NOT NULL,     -- Unix epoch seconds
+            body BLOB NOT NULL         -- zlib-compressed response body
+        )''')
+        self._conn.commit()
+        if mode == 'record':
+            self.prune()
+
+    def prune(self) -> int:
+        """Delete entries older than the TTL and return how many were removed"""
+        with self._lock:
+            removed = self._conn.execute(
+                'DELETE FROM responses WHERE created < ?', (time.time() - self.ttl,)).rowcount
+            self._conn.commit()
+        return removed
+
+    @staticmethod
+    def make_key(method: str, url: str, params: Any = None, body: Any = None) -> str:
+        """Hash the parts of a request that determine its response"""
+        canonical = json.dumps([method.upper(), url, params, body],
+                               sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached body for a request, or None on a miss"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT created, body FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or (self.mode == 'record' and time.time() - row[0] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return zlib.decompress(row[1])
+
+    def put(self, key: str, body: bytes):
+        """Store a response body, replacing any older copy"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, created, body) VALUES (?, ?, ?)',
+                (key, time.time(), zlib.compress(body)))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
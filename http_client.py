@@ -0,0 +1,81 @@
+import json
+from typing import Any, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from rate_limiter import TokenBucket
+
+try:
+    import orjson
+except ImportError:  # In requirements.txt; without it the standard library decoder is used
+    orjson = None
+
+# Responses worth retrying: throttling and transient server-side failures
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Name of the decoder decode_json uses, for metrics labels
+JSON_DECODER = 'orjson' if orjson is not None else 'json'
+
+
+class FetchError(Exception):
+    """Raised when a page could not be fetched, even after retries"""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class PacedRetry(Retry):
+    """Retry that takes a token from the host's rate limiter before every retried attempt.
+
+    urllib3 retries inside a single session.request call, so without this a
+    throttled request would be resent without being counted against the host.
+    """
+
+    def __init__(self, *args, rate_limiter: Optional[TokenBucket] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter
+
+    def new(self, **kw: Any) -> 'PacedRetry':
+        # urllib3 builds a fresh Retry for each attempt; carry the limiter over
+        kw.setdefault('rate_limiter', self.rate_limiter)
+        return super().new(**kw)
+
+    def sleep(self, response=None):
+        super().sleep(response)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+
+def create_session(pool_size: int = 10, max_retries: int = 3, backoff_factor: float = 0.5,
+                   headers: dict = None,
+                   rate_limiter: Optional[TokenBucket] = None) -> requests.Session:
+    """Create a keep-alive session with a connection pool and retry/backoff.
+
+    Retries use exponential backoff (backoff_factor * 2 ** attempt) and honour
+    the server's Retry-After header on 429/503 responses. With a rate_limiter,
+    every retry also waits for a token, like the first attempt does.
+    """
+    retry = PacedRetry(
+        rate_limiter=rate_limiter,
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({'GET', 'POST'}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size,
+                          pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def decode_json(body: bytes) -> Any:
+    """Decode a JSON response body, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
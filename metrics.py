@@ -0,0 +1,194 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+# Prefix for every exported Prometheus metric name
+METRIC_PREFIX = 'car_listings_'
+# Upper bounds in seconds for request latency histograms
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Labels kept in the JSON run record but summed away in the Prometheus
+# textfile, where every distinct value would become its own time series
+RECORD_ONLY_LABELS = ('zip',)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels, extra: Dict[str, str] = None) -> str:
+    pairs = list(labels) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            'buckets': dict(zip((str(b) for b in self.buckets), self.counts)),
+            'count': self.count,
+            'sum': self.sum
+        }
+
+
+class RunMetrics:
+    """Thread-safe counters, latency histograms and stage timers for one run"""
+
+    def __init__(self):
+        self.started = datetime.now()
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._stages: Dict[Labels, float] = {}
+
+    def __getstate__(self) -> dict:
+        # Locks cannot be pickled; shard processes send their metrics back this way
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def merge(self, other: 'RunMetrics'):
+        """Add another run's counters, histograms and stage times to this one"""
+        with self._lock:
+            for key, value in other._counters.items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, histogram in other._histograms.items():
+                merged = self._histograms.get(key)
+                if merged is None:
+                    merged = self._histograms[key] = Histogram(histogram.buckets)
+                merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                merged.count += histogram.count
+                merged.sum += histogram.sum
+            for key, seconds in other._stages.items():
+                self._stages[key] = self._stages.get(key, 0.0) + seconds
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Add to a counter"""
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record a value in a histogram"""
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def stage(self, stage: str, **labels) -> Iterator[None]:
+        """Time a block and add it to the stage's total.
+
+        Stages that run concurrently, such as page fetches, add up their busy
+        time, so the total can exceed the wall-clock time of the run.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            key = _labels(dict(labels, stage=stage))
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._stages[key] = self._stages.get(key, 0.0) + elapsed
+
+    def counter_total(self, name: str, **labels) -> float:
+        """Sum a counter over every label set that matches the given labels"""
+        wanted = set(_labels(labels))
+        with self._lock:
+            return sum(value for (counter, counter_labels), value in self._counters.items()
+                       if counter == name and wanted <= set(counter_labels))
+
+    def to_dict(self) -> dict:
+        """Build the JSON run record"""
+        with self._lock:
+            return {
+                'started': self.started.isoformat(timespec='seconds'),
+                'finished': datetime.now().isoformat(timespec='seconds'),
+                'stages': [dict(labels, seconds=seconds)
+                           for labels, seconds in self._stages.items()],
+                'counters': [dict(labels, name=name, value=value)
+                             for (name, labels), value in self._counters.items()],
+                'histograms': [dict(labels, name=name, **histogram.to_dict())
+                               for (name, labels), histogram in self._histograms.items()]
+            }
+
+    def to_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format.
+
+        Counters are summed over RECORD_ONLY_LABELS, so per-ZIP counts are
+        exported per brand.
+        """
+        lines: List[str] = []
+        with self._lock:
+            counters: Dict[Tuple[str, Labels], float] = {}
+            for (name, labels), value in self._counters.items():
+                key = (name, tuple(pair for pair in labels if pair[0] not in RECORD_ONLY_LABELS))
+                counters[key] = counters.get(key, 0) + value
+            for name in sorted({name for name, _ in counters}):
+                metric = f'{METRIC_PREFIX}{name}_total'
+                lines.append(f'# TYPE {metric} counter')
+                for (counter, labels), value in counters.items():
+                    if counter == name:
+                        lines.append(f'{metric}{_format_labels(labels)} {value:g}')
+            for name in sorted({name for name, _ in self._histograms}):
+                metric = f'{METRIC_PREFIX}{name}'
+                lines.append(f'# TYPE {metric} histogram')
+                for (histogram_name, labels), histogram in self._histograms.items():
+                    if histogram_name != name:
+                        continue
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{metric}_bucket{_format_labels(labels, {"le": f"{bound:g}"})} {count}')
+                    lines.append(f'{metric}_bucket{_format_labels(labels, {"le": "+Inf"})} {histogram.count}')
+                    lines.append(f'{metric}_sum{_format_labels(labels)} {histogram.sum:.6f}')
+                    lines.append(f'{metric}_count{_format_labels(labels)} {histogram.count}')
+            if self._stages:
+                metric = f'{METRIC_PREFIX}stage_seconds'
+                lines.append(f'# TYPE {metric} gauge')
+                for labels, seconds in self._stages.items():
+                    lines.append(f'{metric}{_format_labels(labels)} {seconds:.6f}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, directory: str) -> Tuple[Path, Path]:
+        """Write the JSON run record and the Prometheus textfile; returns both paths"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        json_path = directory / f"run-{self.started.strftime('%Y%m%d-%H%M%S')}.json"
+        with open(json_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        # Write then rename so a scraper never reads a half-written file
+        prom_path = directory / 'metrics.prom'
+        tmp_path = prom_path.with_suffix('.prom.tmp')
+        tmp_path.write_text(self.to_prometheus())
+        tmp_path.replace(prom_path)
+        return json_path, prom_path
@@ -1,6 +1,11 @@
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from abc import ABC, abstractmethod
+import pandas as pd
+
+# Columns of the frames produced by VehicleTransformer.transform_batch
+VEHICLE_COLUMNS = ['vin', 'model', 'price', 'odometer', 'drivetrain', 'url',
+                   'brand', 'series', 'cpo_status']
 
 
 @dataclass
@@ -23,6 +28,39 @@ class VehicleTransformer(ABC):
         """Transform raw vehicle data into our standard Vehicle format"""
         pass
 
+    def transform_batch(self, raw_records: List[Dict[str, Any]]) -> pd.DataFrame:
+        """Transform a page of raw records into a frame with VEHICLE_COLUMNS.
+
+        Subclasses override this to build the columns directly; the default
+        goes through transform() one record at a time.
+        """
+        return vehicles_to_frame([self.transform(raw) for raw in raw_records])
+
+
+def vehicles_to_frame(vehicles: List[Vehicle]) -> pd.DataFrame:
+    """Convert Vehicle objects to a frame with VEHICLE_COLUMNS"""
+    return pd.DataFrame({
+        'vin': [v.vin for v in vehicles],
+        'model': [v.model for v in vehicles],
+        'price': pd.Series([v.price for v in vehicles], dtype='float64'),
+        'odometer': pd.Series([v.odometer for v in vehicles], dtype='float64'),
+        'drivetrain': [v.drivetrain for v in vehicles],
+        'url': [v.url for v in vehicles],
+        'brand': [v.brand for v in vehicles],
+        'series': [v.raw_data.get('series', '') for v in vehicles],
+        'cpo_status': [v.raw_data.get('cpoStatus', '') for v in vehicles]
+    }, columns=VEHICLE_COLUMNS)
+
+
+def _pluck(raw_records: List[Dict[str, Any]], key: str, default: Any = None) -> list:
+    """Pull one field out of every record as a column"""
+    return [record.get(key, default) for record in raw_records]
+
+
+def _numeric(values: list) -> pd.Series:
+    """Convert a column to float64, turning unparseable values into NaN"""
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').astype('float64')
+
 
 class BMWVehicleTransformer(VehicleTransformer):
     def transform(self, raw_data: Dict[str, Any]) -> Vehicle:
@@ -37,6 +75,19 @@ class BMWVehicleTransformer(VehicleTransformer):
             raw_data=raw_data
         )
 
+    def transform_batch(self, raw_records: List[Dict[str, Any]]) -> pd.DataFrame:
+        return pd.DataFrame({
+            'vin': _pluck(raw_records, 'vin'),
+            'model': _pluck(raw_records, 'model'),
+            'price': _numeric(_pluck(raw_records, 'internetPrice')),
+            'odometer': _numeric(_pluck(raw_records, 'odometer')),
+            'drivetrain': _pluck(raw_records, 'drivetrain'),
+            'url': _pluck(raw_records, 'vdpUrl'),
+            'brand': 'BMW',
+            'series': pd.Series(_pluck(raw_records, 'series', ''), dtype=object).fillna(''),
+            'cpo_status': pd.Series(_pluck(raw_records, 'cpoStatus', ''), dtype=object).fillna('')
+        }, columns=VEHICLE_COLUMNS)
+
 
 class MercedesVehicleTransformer(VehicleTransformer):
     def transform(self, raw_data: Dict[str, Any]) -> Vehicle:
@@ -60,3 +111,34 @@ class MercedesVehicleTransformer(VehicleTransformer):
             brand='Mercedes',
             raw_data=raw_data
         )
+
+    def transform_batch(self, raw_records: List[Dict[str, Any]]) -> pd.DataFrame:
+        mileage = [(record.get('usedVehicleAttributes') or {}).get('mileage', 0)
+                   for record in raw_records]
+        return pd.DataFrame({
+            'vin': _pluck(raw_records, 'vin'),
+            'model': _pluck(raw_records, 'modelName'),
+            'price': _numeric(_pluck(raw_records, 'dsrp')),
+            'odometer': _numeric(mileage).fillna(0),
+            'drivetrain': self._drivetrains(raw_records),
+            'url': _pluck(raw_records, 'eLink'),
+            'brand': 'Mercedes',
+            'series': '',
+            'cpo_status': ''
+        }, columns=VEHICLE_COLUMNS)
+
+    @staticmethod
+    def _drivetrains(raw_records: List[Dict[str, Any]]) -> pd.Series:
+        """Look up AUTOMATIC_TRANSMISSION for the whole page in one exploded frame"""
+        drivetrain = pd.Series('Unknown', index=range(len(raw_records)), dtype=object)
+        properties = pd.Series(_pluck(raw_records, 'properties'),
+                               dtype=object).explode().dropna()
+        if properties.empty:
+            return drivetrain
+        properties = pd.DataFrame(properties.tolist(), index=properties.index)
+        if 'name' not in properties or 'value' not in properties:
+            return drivetrain
+        values = properties.loc[properties['name'] == 'AUTOMATIC_TRANSMISSION', 'value']
+        values = values.groupby(level=0).first().dropna()
+        drivetrain.loc[values.index] = values
+        return drivetrain
@@ -0,0 +1,255 @@
+"""Read-only query interface over the inventory database.
+
+Serve JSON over HTTP:
+
+    python query_service.py serve --port 8080
+    curl 'http://127.0.0.1:8080/vehicles?brand=BMW&max_price=30000&sort=price&limit=50'
+
+or query from the command line:
+
+    python query_service.py query --brand BMW --max-price 30000 --drivetrain AWD
+
+Results are pages of at most `limit` rows. A page that has more rows after it
+returns a `next` cursor; pass it back as `after` to get the following page.
+"""
+import argparse
+import base64
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from database import REPORT_COLUMNS, open_connection
+
+DEFAULT_DB_FILE = Path(__file__).parent / 'vehicle_inventory.db'
+RESULT_COLUMNS = REPORT_COLUMNS + ['last_updated']
+# Sortable columns; each has an index ending in vin so pages are seeks, not scans
+SORT_COLUMNS = ('price', 'odometer')
+MAX_LIMIT = 1000
+
+
+def _parse_bool(value: str) -> bool:
+    return value.lower() in ('1', 'true', 'yes')
+
+
+# Converters for the query parameters that are not strings
+PARAM_TYPES = {
+    'min_price': float,
+    'max_price': float,
+    'min_odometer': float,
+    'max_odometer': float,
+    'limit': int,
+    'descending': _parse_bool
+}
+
+
+@dataclass(frozen=True)
+class InventoryQuery:
+    """Filters, sort order and page position of an inventory query"""
+    brand: Optional[str] = None
+    model: Optional[str] = None        # Case-insensitive prefix, e.g. 'M340'
+    drivetrain: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    min_odometer: Optional[float] = None
+    max_odometer: Optional[float] = None
+    sort: str = 'price'
+    descending: bool = False
+    limit: int = 50
+    after: Optional[str] = None        # Cursor from the previous page
+
+    def __post_init__(self):
+        if self.sort not in SORT_COLUMNS:
+            raise ValueError(f"Unsupported sort column: {self.sort}")
+        if not 1 <= self.limit <= MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    @classmethod
+    def from_params(cls, params: Dict[str, str]) -> 'InventoryQuery':
+        """Build a query from string parameters such as a URL query string"""
+        names = {f.name for f in fields(cls)}
+        values: Dict[str, Any] = {}
+        for name, value in params.items():
+            if name not in names:
+                raise ValueError(f"Unknown parameter: {name}")
+            if value != '':
+                values[name] = PARAM_TYPES.get(name, str)(value)
+        return cls(**values)
+
+
+def encode_cursor(sort_value: float, vin: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_value, vin]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        sort_value, vin = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return sort_value, vin
+
+
+class InventoryQueryService:
+    """Answers inventory queries from a read-only connection with an LRU result cache.
+
+    The cache is cleared whenever SQLite's data_version changes, which
+    happens when another connection, such as a crawl, commits to the file.
+    """
+
+    def __init__(self, db_file: str = DEFAULT_DB_FILE, cache_size: int = 256):
+        self.db_file = str(db_file)
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = open_connection(f'file:{self.db_file}?mode=ro', uri=True,
+                                     check_same_thread=False)
+        self._data_version = None
+
+    def _check_data_version(self):
+        version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if version != self._data_version:
+            self._cache.clear()
+            self._data_version = version
+
+    def query(self, query: InventoryQuery) -> Dict[str, Any]:
+        """Return one page of vehicles matching the query and the cursor of the next page"""
+        with self._lock:
+            self._check_data_version()
+            result = self._cache.get(query)
+            if result is not None:
+                self._cache.move_to_end(query)
+                self.hits += 1
+                return result
+            self.misses += 1
+            result = self._execute(query)
+            self._cache[query] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return result
+
+    def _execute(self, query: InventoryQuery) -> Dict[str, Any]:
+        # Rows without a value in the sort column cannot be paged by keyset
+        conditions = [f'{query.sort} IS NOT NULL']
+        params: List[Any] = []
+        for column, operator, value in (
+                ('brand', '=', query.brand),
+                ('drivetrain', '=', query.drivetrain),
+                ('price', '>=', query.min_price),
+                ('price', '<=', query.max_price),
+                ('odometer', '>=', query.min_odometer),
+                ('odometer', '<=', query.max_odometer)):
+            if value is not None:
+                conditions.append(f'{column} {operator} ?')
+                params.append(value)
+        if query.model is not None:
+            conditions.append("model LIKE ? ESCAPE '\\'")
+            params.append(query.model.replace('\\', '\\\\').replace('%', '\\%')
+                          .replace('_', '\\_') + '%')
+        direction = 'DESC' if query.descending else 'ASC'
+        if query.after is not None:
+            conditions.append(f"({query.sort}, vin) {'<' if query.descending else '>'} (?, ?)")
+            params.extend(decode_cursor(query.after))
+
+        cursor = self._conn.execute(
+            f"SELECT {', '.join(RESULT_COLUMNS)} FROM inventory "
+            f"WHERE {' AND '.join(conditions)} "
+            f"ORDER BY {query.sort} {direction}, vin {direction} LIMIT ?",
+            params + [query.limit + 1])
+        rows = [dict(zip(RESULT_COLUMNS, row)) for row in cursor.fetchall()]
+        next_cursor = None
+        if len(rows) > query.limit:
+            rows = rows[:query.limit]
+            next_cursor = encode_cursor(rows[-1][query.sort], rows[-1]['vin'])
+        return {'vehicles': rows, 'next': next_cursor}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def make_server(service: InventoryQueryService, host: str = '127.0.0.1',
+                port: int = 8080) -> ThreadingHTTPServer:
+    """HTTP server answering GET /vehicles?<query> with JSON"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/health':
+                return self._send(200, {'status': 'ok', 'cache_hits': service.hits,
+                                        'cache_misses': service.misses})
+            if url.path != '/vehicles':
+                return self._send(404, {'error': 'not found'})
+            try:
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                result = service.query(InventoryQuery.from_params(params))
+            except ValueError as e:
+                return self._send(400, {'error': str(e)})
+            self._send(200, result)
+
+        def _send(self, status: int, payload: dict):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the vehicle inventory (read-only)')
+    parser.add_argument('--db', default=str(DEFAULT_DB_FILE), help='Inventory database file')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help='Serve queries as JSON over HTTP')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8080)
+    serve.add_argument('--cache-size', type=int, default=256,
+                       help='Query results kept in the LRU cache (default: 256)')
+
+    query = commands.add_parser('query', help='Print one page of matching vehicles as JSON lines')
+    for field in fields(InventoryQuery):
+        if field.name == 'descending':
+            query.add_argument('--descending', action='store_true')
+        else:
+            query.add_argument('--' + field.name.replace('_', '-'), dest=field.name, default=None)
+    args = parser.parse_args()
+
+    service = InventoryQueryService(args.db, cache_size=getattr(args, 'cache_size', 256))
+    if args.command == 'serve':
+        server = make_server(service, args.host, args.port)
+        print(f"Serving {args.db} on http://{args.host}:{server.server_port}/vehicles")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            service.close()
+        return
+
+    params = {field.name: getattr(args, field.name) for field in fields(InventoryQuery)
+              if getattr(args, field.name) is not None}
+    params['descending'] = str(args.descending)
+    result = service.query(InventoryQuery.from_params(params))
+    for vehicle in result['vehicles']:
+        print(json.dumps(vehicle))
+    if result['next']:
+        print(f"# next page: --after {result['next']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import threading
+import time
+from typing import Dict
+
+
+class TokenBucket:
+    """Thread-safe token bucket used to pace requests against a single API host"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = max(float(capacity), 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token and return how long the caller has to wait before using it.
+
+        The bucket is allowed to go negative so that concurrent callers queue up
+        behind each other instead of all waking at the same moment.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """Block the current thread until a request may be sent"""
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+_host_limiters: Dict[str, TokenBucket] = {}
+_host_limiters_lock = threading.Lock()
+
+
+def get_host_limiter(host: str, rate: float, capacity: float = 1.0) -> TokenBucket:
+    """Return the shared limiter for a host, creating it on first use.
+
+    Every crawler talking to the same host shares one bucket, so the host's
+    request budget holds no matter how many crawlers or threads are running.
+    Asking for a host's limiter with a different rate or burst raises
+    ValueError rather than silently pacing at the first caller's rate.
+    """
+    with _host_limiters_lock:
+        limiter = _host_limiters.get(host)
+        if limiter is None:
+            limiter = TokenBucket(rate, capacity)
+            _host_limiters[host] = limiter
+        elif (limiter.rate, limiter.capacity) != (rate, max(float(capacity), 1.0)):
+            raise ValueError(
+                f"{host} is already paced at {limiter.rate}/s with burst {limiter.capacity:g}, "
+                f"not {rate}/s with burst {capacity}")
+        return limiter
@@ -1,7 +1,21 @@
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List
-import pandas as pd
+from typing import TYPE_CHECKING, Dict, List
+from metrics import RunMetrics
+
+if TYPE_CHECKING:  # Only for annotations, so importing reports does not load pandas
+    import pandas as pd
+
+# How a report is emailed: the whole inventory inline, or only the changes
+REPORT_MODES = ('full', 'diff')
+
+
+def _profile_counts(df: 'pd.DataFrame') -> Dict[str, int]:
+    """Vehicles per profile from a 'profile' column of ', '-joined names"""
+    if 'profile' not in df or not len(df):
+        return {}
+    names = df['profile'].str.split(', ').explode()
+    return names[names != ''].value_counts().to_dict()
 
 
 @dataclass
@@ -13,12 +27,20 @@ class Report:
     total_vehicles: int
     price_changes: int
     average_price: float
-    _dataframe: pd.DataFrame = field(
+    failed_pages: int = 0
+    new_vehicles: int = 0
+    removed_vehicles: int = 0
+    # Vehicles per search profile; a vehicle can belong to several
+    profile_counts: Dict[str, int] = field(default_factory=dict)
+    metrics: RunMetrics = field(default=None, repr=False)
+    _dataframe: 'pd.DataFrame' = field(
         default=None, repr=False)  # Private field for DataFrame
+    _removed: 'pd.DataFrame' = field(default=None, repr=False)
 
     @classmethod
-    def from_dataframe(cls, df: pd.DataFrame, brand: str, duration: str) -> 'Report':
-        """Create a Report instance from a DataFrame"""
+    def from_dataframe(cls, df: 'pd.DataFrame', brand: str, duration: str, failed_pages: int = 0,
+                       metrics: RunMetrics = None, removed: 'pd.DataFrame' = None) -> 'Report':
+        """Create a Report instance from a DataFrame and the vehicles removed since the last run"""
         return cls(
             brand=brand,
             timestamp=datetime.now(),
@@ -26,7 +48,13 @@ class Report:
             total_vehicles=len(df),
             price_changes=len(df[df['price_change'] != 0]),
             average_price=df['price'].mean(),
-            _dataframe=df
+            failed_pages=failed_pages,
+            new_vehicles=int(df['price_previous'].isna().sum()) if 'price_previous' in df else 0,
+            removed_vehicles=0 if removed is None else len(removed),
+            profile_counts=_profile_counts(df),
+            metrics=metrics,
+            _dataframe=df,
+            _removed=removed
         )
 
     def get_summary(self) -> str:
@@ -35,10 +63,25 @@ class Report:
         {self.brand} Inventory Report Summary:
         - Total Vehicles: {self.total_vehicles}
         - Vehicles with Price Changes: {self.price_changes}
+        - New Vehicles: {self.new_vehicles}
+        - Removed Vehicles: {self.removed_vehicles}
         - Average Price: ${self.average_price:,.2f}
+        - Profiles: {', '.join(f'{name} ({count})' for name, count in self.profile_counts.items()) or 'n/a'}
+        - Failed Pages: {self.failed_pages}
         - Report Duration: {self.duration}
         """
 
-    def get_dataframe(self) -> pd.DataFrame:
+    @property
+    def has_changes(self) -> bool:
+        """Whether the run found new, removed or repriced vehicles"""
+        return self.price_changes > 0 or self.new_vehicles > 0 or self.removed_vehicles > 0
+
+    def get_dataframe(self) -> 'pd.DataFrame':
         """Get the formatted DataFrame for email"""
         return self._dataframe
+
+    def get_removed_dataframe(self) -> 'pd.DataFrame':
+        """Get the vehicles that disappeared since the previous run"""
+        if self._removed is None:
+            return self._dataframe.iloc[0:0]
+        return self._removed
@@ -1,47 +1,87 @@
-import smtplib
+import gzip
+from datetime import datetime
+from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from typing import List
+import numpy as np
 import pandas as pd
+from metrics import RunMetrics
+from report import REPORT_MODES
+
+# Columns shown in the emailed tables
+TABLE_COLUMNS = ['brand', 'model', 'price', 'price_change', 'price_change_pct',
+                 'odometer', 'drivetrain', 'url']
+REMOVED_COLUMNS = ['brand', 'model', 'price', 'odometer', 'drivetrain', 'url']
+
+STYLE = """
+        <style>
+          table.inventory-table { border-collapse: collapse; width: 100%; }
+          table.inventory-table td, table.inventory-table th { border: 1px solid #ddd; padding: 8px; }
+          table.inventory-table th { background-color: #f2f2f2; text-align: center; }
+        </style>"""
+
+
+def _thousands(values: pd.Series) -> pd.Series:
+    """Format absolute values as whole numbers with thousands separators; NaN becomes ''"""
+    digits = np.char.mod('%d', np.abs(values.fillna(0).to_numpy(dtype=float)).round())
+    formatted = pd.Series(digits, index=values.index).str.replace(
+        r'(\d)(?=(\d{3})+$)', r'\1,', regex=True)
+    return formatted.where(values.notna(), '')
+
+
+def _signed(values: pd.Series) -> pd.Series:
+    values = values.fillna(0)
+    return pd.Series(np.where(values < 0, '-', '+'), index=values.index) + _thousands(values)
+
+
+def format_vehicles(df: pd.DataFrame) -> pd.DataFrame:
+    """Format prices, changes and odometers for display with vectorized string operations"""
+    df = df.copy()
+    df['price'] = ('$' + _thousands(df['price'])).where(df['price'].notna(), '')
+    df['price_change'] = _signed(df['price_change'])
+    df['price_change_pct'] = np.char.mod(
+        '%+.2f%%', df['price_change_pct'].fillna(0).to_numpy(dtype=float))
+    df['odometer'] = _thousands(df['odometer'])
+    return df
 
 
 class EmailReporter:
-    def __init__(self, smtp_server: str, smtp_port: int, smtp_user: str, smtp_password: str):
+    """Renders and emails inventory reports.
+
+    In 'full' mode the whole run inventory is rendered inline. In 'diff' mode
+    only new, repriced and removed vehicles are shown, each table capped at
+    `max_rows`, and the full snapshot is attached as a gzipped CSV, so the
+    message size stays flat as the inventory grows.
+    """
+
+    def __init__(self, smtp_server: str, smtp_port: int, smtp_user: str, smtp_password: str,
+                 metrics: RunMetrics = None, mode: str = 'full', max_rows: int = 500):
+        if mode not in REPORT_MODES:
+            raise ValueError(f"Unsupported report mode: {mode}")
         self.smtp_server = smtp_server
         self.smtp_port = smtp_port
         self.smtp_user = smtp_user
         self.smtp_password = smtp_password
+        self.metrics = metrics or RunMetrics()
+        self.mode = mode
+        self.max_rows = max_rows
 
-    def send_report(self, df: pd.DataFrame, duration: str, subject: str, to_emails: List[str]):
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = subject
-        msg['From'] = self.smtp_user
-        msg['To'] = ', '.join(to_emails)
-
+    def render_report(self, df: pd.DataFrame, duration: str) -> str:
+        """Render the inventory report as an HTML document"""
         # Deduplicate records based on VIN and brand
         df = df.drop_duplicates(subset=['vin', 'brand'])
 
         # Format DataFrame
-        df = df.sort_values(by='price', ascending=True)
-        df['price'] = df['price'].apply(lambda x: f"${x:,.0f}")
-        df['price_change'] = df['price_change'].apply(lambda x: f"{x:+,.0f}")
-        df['price_change_pct'] = df['price_change_pct'].apply(
-            lambda x: f"{x:+.2f}%")
-        df['odometer'] = df['odometer'].apply(lambda x: f"{x:,.0f}")
+        df = format_vehicles(df.sort_values(by='price', ascending=True))
 
         # Create HTML table
-        html_table = df[['brand', 'model', 'price', 'price_change', 'price_change_pct',
-                        'odometer', 'drivetrain', 'url']].to_html(
+        html_table = df[TABLE_COLUMNS].to_html(
             index=False, justify='center', border=1, classes='inventory-table')
 
         html_body = f"""
         <html>
-        <head>
-        <style>
-          table.inventory-table {{ border-collapse: collapse; width: 100%; }}
-          table.inventory-table td, table.inventory-table th {{ border: 1px solid #ddd; padding: 8px; }}
-          table.inventory-table th {{ background-color: #f2f2f2; text-align: center; }}
-        </style>
+        <head>{STYLE}
         </head>
         <body>
           <h2>Vehicle Inventory Report</h2>
@@ -50,11 +90,75 @@ class EmailReporter:
         </body>
         </html>
         """
+        return html_body
+
+    def _render_section(self, title: str, df: pd.DataFrame, columns: List[str]) -> str:
+        """Render one capped table of the differential report"""
+        if df.empty:
+            return f"<h3>{title} (0)</h3>"
+        shown = format_vehicles(df.head(self.max_rows))
+        section = f"<h3>{title} ({len(df)})</h3>\n" + shown[columns].to_html(
+            index=False, justify='center', border=1, classes='inventory-table')
+        if len(df) > self.max_rows:
+            section += (f"<p>Showing {self.max_rows} of {len(df)}; "
+                        "the full snapshot is attached.</p>")
+        return section
+
+    def render_changes(self, df: pd.DataFrame, duration: str, removed: pd.DataFrame = None) -> str:
+        """Render only new, repriced and removed vehicles as an HTML document"""
+        df = df.drop_duplicates(subset=['vin', 'brand'])
+        is_new = df['price_previous'].isna()
+        new = df[is_new].sort_values(by='price')
+        # Biggest drops first
+        changed = df[~is_new & (df['price_change'] != 0)].sort_values(by='price_change')
+        if removed is None:
+            removed = df.iloc[0:0]
+        sections = '\n'.join([
+            self._render_section('Price Changes', changed, TABLE_COLUMNS),
+            self._render_section('New Vehicles', new, TABLE_COLUMNS),
+            self._render_section('Removed Vehicles', removed.sort_values(by='price'),
+                                 REMOVED_COLUMNS)
+        ])
+        return f"""
+        <html>
+        <head>{STYLE}
+        </head>
+        <body>
+          <h2>Vehicle Inventory Changes</h2>
+          <p>{len(df)} vehicles in inventory.</p>
+          {sections}
+          <p><em>Runtime Duration: {duration}</em></p>
+        </body>
+        </html>
+        """
+
+    @staticmethod
+    def snapshot_attachment(df: pd.DataFrame) -> MIMEApplication:
+        """Compress the full inventory snapshot as a CSV attachment"""
+        filename = f"inventory-{datetime.now().strftime('%Y%m%d-%H%M%S')}.csv.gz"
+        data = gzip.compress(df.to_csv(index=False).encode(), compresslevel=6)
+        attachment = MIMEApplication(data, Name=filename)
+        attachment['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return attachment
+
+    def send_report(self, df: pd.DataFrame, duration: str, subject: str, to_emails: List[str],
+                    removed: pd.DataFrame = None):
+        msg = MIMEMultipart('mixed' if self.mode == 'diff' else 'alternative')
+        msg['Subject'] = subject
+        msg['From'] = self.smtp_user
+        msg['To'] = ', '.join(to_emails)
 
-        msg.attach(MIMEText(html_body, 'html'))
+        with self.metrics.stage('email_render'):
+            if self.mode == 'diff':
+                msg.attach(MIMEText(self.render_changes(df, duration, removed), 'html'))
+                msg.attach(self.snapshot_attachment(df))
+            else:
+                msg.attach(MIMEText(self.render_report(df, duration), 'html'))
 
-        with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port) as smtp:
-            smtp.login(self.smtp_user, self.smtp_password)
-            smtp.send_message(msg)
+        with self.metrics.stage('email_send'):
+            import smtplib  # Deferred; only runs that send mail need it
+            with smtplib.SMTP_SSL(self.smtp_server, self.smtp_port) as smtp:
+                smtp.login(self.smtp_user, self.smtp_password)
+                smtp.send_message(msg)
 
         print(f"Email sent to {msg['To']}")
@@ -0,0 +1,151 @@
+import json
+from dataclasses import dataclass, field, fields, replace
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+DEFAULT_PROFILES_FILE = Path(__file__).parent / 'config' / 'search_profiles.json'
+
+# Filter dimensions and the frame column each is checked against locally
+SET_DIMENSIONS = {'series': 'series', 'models': None, 'drivetrains': 'drivetrain', 'years': None}
+RANGE_DIMENSIONS = {'price': ('min_price', 'max_price'), 'odometer': (None, 'max_odometer')}
+
+
+@dataclass(frozen=True)
+class SearchProfile:
+    """A named set of inventory filters; empty sets and None bounds mean 'any'"""
+    name: str
+    series: Tuple[str, ...] = ()
+    models: Tuple[str, ...] = ()       # API model codes
+    drivetrains: Tuple[str, ...] = ()
+    years: Tuple[int, ...] = ()
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    max_odometer: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'SearchProfile':
+        names = {f.name for f in fields(cls)}
+        unknown = set(data) - names
+        if unknown:
+            raise ValueError(f"Unknown search profile keys: {', '.join(sorted(unknown))}")
+        return cls(**{key: tuple(value) if isinstance(value, list) else value
+                      for key, value in data.items()})
+
+
+@dataclass
+class SearchQuery:
+    """One API search whose filters cover one or more profiles exactly"""
+    filters: SearchProfile
+    profiles: List[SearchProfile] = field(default_factory=list)
+
+
+def load_search_profiles(path: str = DEFAULT_PROFILES_FILE) -> Dict[str, List[SearchProfile]]:
+    """Load search profiles per lower-case brand name"""
+    with open(path) as f:
+        config = json.load(f)
+    return {brand.lower(): [SearchProfile.from_dict(profile) for profile in profiles]
+            for brand, profiles in config.items()}
+
+
+def _range(profile: SearchProfile, dimension: str) -> Tuple[float, float]:
+    low_key, high_key = RANGE_DIMENSIONS[dimension]
+    low = getattr(profile, low_key) if low_key else None
+    high = getattr(profile, high_key)
+    return (-np.inf if low is None else low, np.inf if high is None else high)
+
+
+def _differing(a: SearchProfile, b: SearchProfile) -> List[str]:
+    dimensions = [d for d in SET_DIMENSIONS if set(getattr(a, d)) != set(getattr(b, d))]
+    return dimensions + [d for d in RANGE_DIMENSIONS if _range(a, d) != _range(b, d)]
+
+
+def _merge(a: SearchProfile, b: SearchProfile, dimension: str) -> Optional[SearchProfile]:
+    """Filters returning exactly the union of a and b, which differ only in `dimension`"""
+    name = f'{a.name}+{b.name}'
+    if dimension in SET_DIMENSIONS:
+        values_a, values_b = getattr(a, dimension), getattr(b, dimension)
+        # An empty set already means 'any value'
+        union = () if not values_a or not values_b else tuple(dict.fromkeys(values_a + values_b))
+        return replace(a, name=name, **{dimension: union})
+    (low_a, high_a), (low_b, high_b) = _range(a, dimension), _range(b, dimension)
+    if max(low_a, low_b) > min(high_a, high_b) + 1:
+        return None  # A gap between the ranges would be fetched too
+    low_key, high_key = RANGE_DIMENSIONS[dimension]
+    merged = {high_key: None if np.isinf(max(high_a, high_b)) else max(high_a, high_b)}
+    if low_key:
+        merged[low_key] = None if np.isinf(min(low_a, low_b)) else min(low_a, low_b)
+    return replace(a, name=name, **merged)
+
+
+def plan_queries(profiles: List[SearchProfile], local_dimensions: Tuple[str, ...]) -> List[SearchQuery]:
+    """Merge profiles into as few API searches as possible.
+
+    Two searches merge when their filters differ in a single dimension, so
+    the merged search returns exactly the union of their results, and that
+    dimension can be checked on the fetched vehicles (`local_dimensions`), so
+    the results can be split back into profiles afterwards.
+    """
+    queries = [SearchQuery(profile, [profile]) for profile in profiles]
+    merged = True
+    while merged:
+        merged = False
+        for i, first in enumerate(queries):
+            for second in queries[i + 1:]:
+                differing = _differing(first.filters, second.filters)
+                if len(differing) > 1 or (differing and differing[0] not in local_dimensions):
+                    continue
+                filters = (_merge(first.filters, second.filters, differing[0])
+                           if differing else first.filters)
+                if filters is None:
+                    continue
+                first.filters = filters
+                first.profiles += second.profiles
+                queries.remove(second)
+                merged = True
+                break
+            if merged:
+                break
+    return queries
+
+
+def match_profiles(df: pd.DataFrame, profiles: List[SearchProfile],
+                   local_dimensions: Tuple[str, ...]) -> pd.Series:
+    """Name the profiles each vehicle belongs to, joined by ', '; '' when it matches none.
+
+    Only `local_dimensions` are checked; the API already applied the rest,
+    and a missing value (NaN, None or '') matches since the API returned the
+    vehicle for it.
+    """
+    names = pd.Series('', index=df.index, dtype=object)
+    for profile in profiles:
+        matches = pd.Series(True, index=df.index)
+        for dimension in local_dimensions:
+            if dimension in SET_DIMENSIONS:
+                values = getattr(profile, dimension)
+                if values:
+                    column = df[SET_DIMENSIONS[dimension]]
+                    matches &= column.isin(values) | column.isna() | (column == '')
+            else:
+                low, high = _range(profile, dimension)
+                matches &= df[dimension].between(low, high) | df[dimension].isna()
+        names = names.where(~matches, names + np.where(names == '', '', ', ') + profile.name)
+    return names
+
+
+def label_profiles(df: pd.DataFrame, queries: List[SearchQuery],
+                   local_dimensions: Tuple[str, ...],
+                   inexact_dimensions: Tuple[str, ...] = ()) -> pd.Series:
+    """Name the profiles each vehicle of a run belongs to.
+
+    When the run made a single search for a single profile, the API applied
+    that profile's filters, so only `inexact_dimensions` are re-checked:
+    filters the API only approximates, which are checked in every case.
+    """
+    profiles = [profile for query in queries for profile in query.profiles]
+    if len(profiles) == 1:
+        return match_profiles(df, profiles, inexact_dimensions)
+    dimensions = local_dimensions + tuple(d for d in inexact_dimensions
+                                          if d not in local_dimensions)
+    return match_profiles(df, profiles, dimensions)
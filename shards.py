@@ -0,0 +1,88 @@
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+import pandas as pd
+from database import INVENTORY_COLUMNS, InventoryDatabase
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse a shard spec such as '2/4' into (index, count), with index counted from 1"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard {value!r}; expected INDEX/COUNT such as 1/4")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard {value!r}; INDEX must be between 1 and COUNT")
+    return index, count
+
+
+def shard_zip_codes(zip_codes: List[str], index: int, count: int) -> List[str]:
+    """Pick shard `index` of `count` from a ZIP list.
+
+    ZIPs are dealt round-robin, so every node that starts from the same list
+    gets disjoint shards of near-equal size that together cover the list.
+    """
+    return list(dict.fromkeys(zip_codes))[index - 1::count]
+
+
+def shard_db_file(db_file: str, index: int, count: int) -> str:
+    """Database file a shard writes to, next to the main database"""
+    path = Path(db_file)
+    return str(path.with_name(f'{path.stem}.shard-{index}-of-{count}{path.suffix}'))
+
+
+class ShardMerger:
+    """Merges shard databases into the main inventory database.
+
+    Each shard's latest finished run is read back and written through the
+    main database's update_inventory, one merge run per brand, so price
+    changes and price history are computed against the main history rather
+    than the shard's own. VINs returned by more than one shard are kept once.
+    When every shard's run of a brand was a full sweep, the brand's vehicles
+    no shard returned are archived as removed.
+
+    Runs that finished before `since` (Unix epoch seconds), such as those
+    left in a stale shard file by an earlier crawl, are skipped with a
+    warning; a brand missing from any shard is then not archived.
+    """
+
+    def __init__(self, db: InventoryDatabase, since: float = None):
+        self.db = db
+        self.since = since
+
+    def merge(self, shard_files: List[str]) -> Dict[str, str]:
+        """Merge shard files and return the main database's run id for each brand"""
+        frames: Dict[str, List[pd.DataFrame]] = {}
+        full_sweeps: Dict[str, int] = {}
+        for shard_file in shard_files:
+            shard = InventoryDatabase(shard_file)
+            latest_runs = shard.get_latest_runs()
+            if not latest_runs:
+                logger.warning("Shard %s has no finished runs; skipping it", shard_file)
+            for brand, (run_id, full_sweep, finished) in latest_runs.items():
+                if self.since is not None and finished < self.since:
+                    logger.warning("Skipping %s run %s in shard %s: it finished %s, before this "
+                                   "merge window", brand, run_id, shard_file,
+                                   time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(finished)))
+                    continue
+                frames.setdefault(brand, []).append(shard.get_run_inventory(brand, run_id))
+                full_sweeps[brand] = full_sweeps.get(brand, 0) + full_sweep
+
+        run_ids = {}
+        for brand, brand_frames in frames.items():
+            vehicles = pd.concat(brand_frames, ignore_index=True).drop_duplicates(
+                subset='vin', keep='last')
+            run_id = self.db.start_run(brand)
+            with self.db.metrics.stage('merge', brand=brand):
+                self.db.update_inventory(vehicles[INVENTORY_COLUMNS], run_id)
+            full_sweep = full_sweeps[brand] == len(shard_files)
+            if full_sweep:
+                full_sweep = self.db.archive_removed(brand, run_id) is not None
+            self.db.finish_run(run_id, full_sweep=full_sweep)
+            logger.info("Merged %d %s vehicles from %d shards",
+                        len(vehicles), brand, len(brand_frames))
+            run_ids[brand] = run_id
+        return run_ids
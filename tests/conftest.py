@@ -0,0 +1,84 @@
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import pandas as pd
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from crawler import InventoryCrawler, InventoryPage  # noqa: E402
+from database import INVENTORY_COLUMNS  # noqa: E402
+from http_client import FetchError  # noqa: E402
+from models import BMWVehicleTransformer  # noqa: E402
+from search_profiles import SearchProfile  # noqa: E402
+import rate_limiter  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def host_limiters(monkeypatch):
+    """Give each test its own host limiters, so tests may pace the same host differently"""
+    monkeypatch.setattr(rate_limiter, '_host_limiters', {})
+
+
+def api_records(vins: Iterable[str], price: float = 25000) -> List[dict]:
+    """BMW API vehicle records, as a page of the inventory service returns them"""
+    return [{'vin': vin, 'model': '330i', 'internetPrice': price, 'odometer': 10,
+             'drivetrain': 'AWD', 'vdpUrl': '', 'series': '3 Series', 'cpoStatus': 'CPO'}
+            for vin in vins]
+
+
+def vehicles_frame(vins: Iterable[str], price=25000.0, odometer=1000.0,
+                   **columns) -> pd.DataFrame:
+    """Transformed vehicles for update_inventory; any column may be a scalar or a list"""
+    return pd.DataFrame({
+        'vin': list(vins),
+        'model': '330i xDrive',
+        'price': price,
+        'odometer': odometer,
+        'drivetrain': 'AWD',
+        'url': 'https://example.test',
+        'brand': 'BMW',
+        'series': '3 Series',
+        'cpo_status': 'CPO',
+        **columns
+    })[INVENTORY_COLUMNS]
+
+
+class StubCrawler(InventoryCrawler):
+    """Serves each ZIP's API records from `pages` instead of the network.
+
+    Records are served in pages of `page_size`, or of `page_cap` when an API
+    caps pages below the size asked for, with the ZIP's total unless
+    `report_total` is off. Pages listed in `failing` as (zip_code, page_index)
+    raise FetchError, and every request raises `error` while it is set.
+    Requests are recorded in `requested` as (zip_code, page_index).
+    """
+    brand = 'BMW'
+    page_size = 100
+
+    def __init__(self, db_file: str, pages: Dict[str, List[dict]], page_cap: int = None,
+                 report_total: bool = True, failing: Iterable[Tuple[str, int]] = (), **kwargs):
+        super().__init__('token', BMWVehicleTransformer(), db_file, url='http://api.test/vehicle',
+                         requests_per_second=1000, burst=100, **kwargs)
+        self.pages = pages
+        self.page_cap = page_cap
+        self.report_total = report_total
+        self.failing = set(failing)
+        self.error: Optional[Exception] = None
+        self.requested: List[Tuple[str, int]] = []
+
+    @classmethod
+    def default_profiles(cls) -> List[SearchProfile]:
+        return [SearchProfile(name='all')]
+
+    def fetch_page(self, zip_code: str, page_index: int, filters: SearchProfile) -> InventoryPage:
+        self.requested.append((zip_code, page_index))
+        if self.error is not None:
+            raise self.error
+        if (zip_code, page_index) in self.failing:
+            raise FetchError('HTTP 500 from api.test', 500)
+        records = self.pages[zip_code]
+        size = min(self.page_size, self.page_cap or self.page_size)
+        total = len(records) if self.report_total else None
+        return InventoryPage(records[page_index * size:(page_index + 1) * size], total)
@@ -0,0 +1,37 @@
+from conftest import vehicles_frame
+from database import InventoryDatabase
+
+
+def _sweep(db: InventoryDatabase, count: int):
+    run_id = db.start_run('BMW')
+    if count:
+        vins = [f'VIN{i:05d}' for i in range(count)]
+        vehicles = vehicles_frame(vins, price=[25000.0 + i for i in range(count)])
+        db.update_inventory(vehicles, run_id)
+    archived = db.archive_removed('BMW', run_id)
+    db.finish_run(run_id, full_sweep=archived is not None)
+    return archived
+
+
+def test_sweep_archives_vehicles_it_no_longer_saw(tmp_path):
+    db = InventoryDatabase(str(tmp_path / 'inventory.db'))
+    assert len(_sweep(db, 10)) == 0
+    removed = _sweep(db, 8)
+    assert sorted(removed['vin']) == ['VIN00008', 'VIN00009']
+    assert len(db.get_brand_inventory('BMW')) == 8
+
+
+def test_empty_sweep_archives_nothing(tmp_path):
+    db = InventoryDatabase(str(tmp_path / 'inventory.db'))
+    _sweep(db, 10)
+    assert _sweep(db, 0) is None
+    assert len(db.get_brand_inventory('BMW')) == 10
+
+
+def test_sweep_far_smaller_than_the_previous_archives_nothing(tmp_path):
+    db = InventoryDatabase(str(tmp_path / 'inventory.db'))
+    _sweep(db, 10)
+    assert _sweep(db, 3) is None
+    assert len(db.get_brand_inventory('BMW')) == 10
+    # The skipped sweep is not the baseline for the next one
+    assert len(_sweep(db, 6)) == 4
@@ -0,0 +1,23 @@
+import json
+from benchmarks.run_benchmarks import compare, load_previous
+
+
+def _record(timestamp: str, params: dict, seconds: float) -> dict:
+    return {'timestamp': timestamp, 'commit': 'abc1234', 'params': params,
+            'results': [{'benchmark': 'crawl[bmw]', 'size': 1000, 'seconds': seconds}]}
+
+
+def test_load_previous_returns_the_latest_run_with_the_same_params(tmp_path):
+    results_file = tmp_path / 'results.jsonl'
+    assert load_previous({'zips': 20}, results_file) is None
+    records = [_record('t1', {'zips': 20}, 1.0), _record('t2', {'zips': 40}, 2.0),
+               _record('t3', {'zips': 20}, 3.0)]
+    results_file.write_text(''.join(json.dumps(record) + '\n' for record in records))
+    assert load_previous({'zips': 20}, results_file)['timestamp'] == 't3'
+
+
+def test_compare_flags_slowdowns_beyond_the_threshold(capsys):
+    previous = _record('t1', {}, 1.0)
+    assert not compare(_record('t2', {}, 1.1), previous, threshold=20)
+    assert compare(_record('t3', {}, 1.5), previous, threshold=20)
+    assert 'REGRESSION' in capsys.readouterr().out
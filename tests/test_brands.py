@@ -0,0 +1,53 @@
+import logging
+import pytest
+import app
+import brands
+from brands import BrandRegistry
+
+
+@pytest.fixture
+def scans(monkeypatch):
+    """Record entry point scans, serving one installed plugin brand"""
+    calls = []
+
+    class EntryPoint:
+        name, value = 'Audi', 'audi_crawler:AudiCrawler'
+
+    def entry_points(group):
+        calls.append(group)
+        return [EntryPoint()]
+
+    monkeypatch.setattr('importlib.metadata.entry_points', entry_points)
+    return calls
+
+
+def test_configured_brands_do_not_scan_entry_points(scans):
+    registry = BrandRegistry({'BMW': 'bmw_crawler:BMWCrawler'})
+    assert registry.configured_brands == ['bmw']
+    assert registry.find('bmw') == 'bmw'
+    assert scans == []
+
+
+def test_unknown_brands_scan_entry_points_once(scans):
+    registry = BrandRegistry({'BMW': 'bmw_crawler:BMWCrawler'})
+    assert registry.find('AUDI') == 'audi'
+    assert registry.find('tesla') is None
+    assert registry.brands == ['bmw', 'audi']
+    assert scans == [brands.ENTRY_POINT_GROUP]
+    assert registry.configured_brands == ['bmw']
+
+
+def test_crawler_class_is_imported_on_first_use(scans):
+    registry = BrandRegistry.load()
+    crawler_class = registry.crawler_class('BMW')
+    assert crawler_class.__name__ == 'BMWCrawler'
+    assert registry.crawler_class('bmw') is crawler_class
+    with pytest.raises(ValueError, match='Unsupported brand'):
+        registry.crawler_class('tesla')
+
+
+def test_supported_brands_warns_about_unknown_brands(scans, monkeypatch, caplog):
+    monkeypatch.setattr(app, 'BRANDS', BrandRegistry({'BMW': 'bmw_crawler:BMWCrawler'}))
+    with caplog.at_level(logging.WARNING):
+        assert app.supported_brands(['BMW', 'tesla', 'Audi']) == ['bmw', 'audi']
+    assert 'Skipping unsupported brand tesla' in caplog.text
@@ -0,0 +1,55 @@
+import threading
+from typing import List
+from conftest import StubCrawler, api_records
+from daemon import CrawlDaemon
+
+
+def _crawler(db_file: str) -> StubCrawler:
+    """Serves the same two vehicles in 60601 every cycle"""
+    return StubCrawler(db_file, {'60601': api_records(['V0', 'V1'])})
+
+
+class Outbox:
+    def __init__(self):
+        self.sent: List[dict] = []
+
+    def send_report(self, **kwargs):
+        self.sent.append(kwargs)
+
+
+def test_a_report_is_emailed_only_when_a_cycle_changed_something(tmp_path):
+    crawler = _crawler(str(tmp_path / 'inventory.db'))
+    outbox = Outbox()
+    daemon = CrawlDaemon(['bmw'], lambda brand: crawler, ['60601'], {'bmw': 60},
+                         reporter=outbox, to_emails=['team@example.test'],
+                         metrics=crawler.metrics, metrics_dir=tmp_path / 'metrics')
+    assert daemon.run_cycle(crawler).new_vehicles == 2
+    daemon.run_cycle(crawler)
+    crawler.pages['60601'] = api_records(['V0', 'V1'], 24000)
+    assert daemon.run_cycle(crawler).price_changes == 2
+    assert [mail['subject'] for mail in outbox.sent] == ['Vehicle Inventory Update - BMW'] * 2
+    assert daemon.cycles == 3
+    assert crawler.metrics.counter_total('daemon_cycles', brand='BMW') == 3
+    assert (tmp_path / 'metrics' / 'metrics.prom').exists()
+
+
+def test_a_failed_cycle_is_retried_on_the_next_interval(tmp_path):
+    crawler = _crawler(str(tmp_path / 'inventory.db'))
+    crawler.error = RuntimeError('database is locked')
+    daemon = CrawlDaemon(['bmw'], lambda brand: crawler, ['60601'], {'bmw': 0.01}, jitter=0)
+    run_cycle = daemon.run_cycle
+
+    def cycle(crawler):
+        if daemon.metrics.counter_total('daemon_cycle_failures') >= 2:
+            crawler.error = None
+        report = run_cycle(crawler)
+        daemon.stop()
+        return report
+
+    daemon.run_cycle = cycle
+    thread = threading.Thread(target=daemon._brand_loop, args=('bmw',))
+    thread.start()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert daemon.metrics.counter_total('daemon_cycle_failures', brand='BMW') == 2
+    assert daemon.cycles == 1
@@ -0,0 +1,190 @@
+import multiprocessing
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import pytest
+from conftest import vehicles_frame
+from database import (CRAWL_RUN_MIGRATIONS, INVENTORY_MIGRATIONS, InventoryDatabase,
+                      get_writer)
+
+# The inventory table as the first release created it, before any migration
+BASELINE_SCHEMA = '''CREATE TABLE inventory (
+    vin TEXT PRIMARY KEY,
+    model TEXT,
+    price REAL,
+    odometer REAL,
+    drivetrain TEXT,
+    url TEXT,
+    brand TEXT,
+    series TEXT,
+    cpo_status TEXT,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(vin, brand)
+)'''
+
+
+def _baseline_db(path) -> str:
+    with sqlite3.connect(str(path)) as conn:
+        conn.execute(BASELINE_SCHEMA)
+        conn.execute("INSERT INTO inventory (vin, brand, price) VALUES ('OLD1', 'BMW', 30000)")
+    return str(path)
+
+
+def _columns(db_file: str, table: str) -> set:
+    with sqlite3.connect(db_file) as conn:
+        return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _open(db_file: str) -> str:
+    InventoryDatabase(db_file)
+    return db_file
+
+
+def _open_together(db_file: str, count: int = 4) -> list:
+    """Open the database from several threads at once and return their errors"""
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def open_db():
+        barrier.wait()
+        try:
+            InventoryDatabase(db_file)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=open_db) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+@pytest.mark.parametrize('baseline', [True, False])
+def test_databases_opened_together_migrate_once(tmp_path, baseline):
+    for attempt in range(10):
+        path = tmp_path / f'inventory-{attempt}.db'
+        db_file = _baseline_db(path) if baseline else str(path)
+        assert _open_together(db_file) == []
+        assert set(INVENTORY_MIGRATIONS) <= _columns(db_file, 'inventory')
+
+
+def test_crawl_runs_of_an_older_schema_migrate_once(tmp_path):
+    db_file = _baseline_db(tmp_path / 'inventory.db')
+    with sqlite3.connect(db_file) as conn:
+        conn.execute('''CREATE TABLE crawl_runs (run_id TEXT PRIMARY KEY, brand TEXT NOT NULL,
+                                                 started INTEGER NOT NULL, finished INTEGER)''')
+        conn.execute("INSERT INTO crawl_runs VALUES ('r1', 'BMW', 1, 2)")
+    assert _open_together(db_file) == []
+    assert set(CRAWL_RUN_MIGRATIONS) <= _columns(db_file, 'crawl_runs')
+    # An old finished run is not mistaken for a full sweep
+    assert InventoryDatabase(db_file).get_latest_runs() == {'BMW': ('r1', False, 2)}
+
+
+def test_processes_opening_a_baseline_database_migrate_once(tmp_path):
+    db_file = _baseline_db(tmp_path / 'inventory.db')
+    with ProcessPoolExecutor(3, mp_context=multiprocessing.get_context('spawn')) as executor:
+        assert list(executor.map(_open, [db_file] * 3)) == [db_file] * 3
+    assert set(INVENTORY_MIGRATIONS) <= _columns(db_file, 'inventory')
+    db = InventoryDatabase(db_file)
+    assert db.get_brand_inventory('BMW')['vin'].tolist() == ['OLD1']
+
+
+def test_concurrent_batches_are_serialized_through_one_writer(tmp_path):
+    db_file = str(tmp_path / 'inventory.db')
+    databases = [InventoryDatabase(db_file) for _ in range(4)]
+    assert len({id(db.writer) for db in databases}) == 1
+    assert databases[0].writer is get_writer(db_file)
+
+    def write(index: int, db: InventoryDatabase):
+        for batch in range(5):
+            db.update_inventory(vehicles_frame(f'V{index}-{batch}-{i}' for i in range(50)))
+
+    threads = [threading.Thread(target=write, args=(index, db))
+               for index, db in enumerate(databases)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(databases[0].get_brand_inventory('BMW')) == 4 * 5 * 50
+
+
+def test_failed_job_rolls_back_and_reports_its_error(tmp_path):
+    db = InventoryDatabase(str(tmp_path / 'inventory.db'))
+
+    def job(conn):
+        conn.execute("INSERT INTO inventory (vin, brand, price) VALUES ('V1', 'BMW', 1)")
+        conn.execute('SELECT * FROM missing_table')
+
+    with pytest.raises(sqlite3.OperationalError):
+        db.writer.submit(job).result()
+    assert db.get_brand_inventory('BMW').empty
+    # The writer keeps serving later jobs
+    db.update_inventory(vehicles_frame(['V2']))
+    assert list(db.get_brand_inventory('BMW')['vin']) == ['V2']
+
+
+def _changes(df: pd.DataFrame) -> dict:
+    return {vin: (previous, change, round(pct, 2)) for vin, previous, change, pct in
+            df[['vin', 'price_previous', 'price_change', 'price_change_pct']].itertuples(
+                index=False, name=None)}
+
+
+def test_price_changes_are_computed_against_the_stored_price(tmp_path):
+    db = InventoryDatabase(str(tmp_path / 'inventory.db'))
+    first = db.update_inventory(vehicles_frame(['V1', 'V2'], price=20000), db.new_run_id())
+    assert first['price_previous'].isna().all()
+    assert (first['price_change'] == 0).all()
+
+    repriced = pd.concat([vehicles_frame(['V1'], price=19000), vehicles_frame(['V2'], price=20000),
+                          vehicles_frame(['V3'], price=30000)])
+    changes = _changes(db.update_inventory(repriced, db.new_run_id()))
+    assert changes['V1'] == (20000, -1000, -5.0)
+    assert changes['V2'] == (20000, 0, 0)
+    assert changes['V3'][1:] == (0, 0)
+
+
+def test_later_batches_of_a_run_keep_the_change_from_before_the_run(tmp_path):
+    db = InventoryDatabase(str(tmp_path / 'inventory.db'))
+    db.update_inventory(vehicles_frame(['V1'], price=20000), db.new_run_id())
+    run_id = db.new_run_id()
+    db.update_inventory(vehicles_frame(['V1'], price=18000), run_id)
+    changes = _changes(db.update_inventory(vehicles_frame(['V1'], price=18000), run_id))
+    assert changes['V1'] == (20000, -2000, -10.0)
+
+
+def test_price_history_records_only_new_or_changedvehicles_frame(tmp_path, monkeypatch):
+    db = InventoryDatabase(str(tmp_path / 'inventory.db'))
+    clock = iter(range(1_700_000_000, 1_700_000_000 + 400_000, 86400))
+    monkeypatch.setattr('database.time.time', lambda: next(clock))
+    db.update_inventory(vehicles_frame(['V1', 'V2'], price=20000))
+    db.update_inventory(vehicles_frame(['V1', 'V2'], price=20000))
+    db.update_inventory(pd.concat([vehicles_frame(['V1'], price=19000),
+                                   vehicles_frame(['V2'], price=20000, odometer=1500)]))
+    history = db.get_price_history('BMW', 'V1')
+    assert history['price'].tolist() == [20000, 19000]
+    assert history['ts'].is_monotonic_increasing
+    assert db.get_price_history('BMW', 'V2')['odometer'].tolist() == [1000, 1500]
+
+
+def test_the_last_price_change_within_a_second_is_kept(tmp_path, monkeypatch):
+    db = InventoryDatabase(str(tmp_path / 'inventory.db'))
+    monkeypatch.setattr('database.time.time', lambda: 1_700_000_000)
+    db.update_inventory(vehicles_frame(['V1'], price=20000))
+    db.update_inventory(vehicles_frame(['V1'], price=19000))
+    history = db.get_price_history('BMW', 'V1')
+    assert history['price'].tolist() == [19000]
+    assert db.get_min_prices('BMW', days=1)['min_price'].tolist() == [19000]
+
+
+def test_min_prices_include_the_price_before_the_window(tmp_path, monkeypatch):
+    db = InventoryDatabase(str(tmp_path / 'inventory.db'))
+    now = 1_700_000_000
+    for days_ago, price in ((40, 18000), (20, 21000), (5, 22000)):
+        monkeypatch.setattr('database.time.time', lambda: now - days_ago * 86400)
+        db.update_inventory(vehicles_frame(['V1'], price=price))
+    monkeypatch.setattr('database.time.time', lambda: now)
+    # 18000 was replaced 20 days ago, before which it was the current price
+    assert db.get_min_prices('BMW', days=30)['min_price'].tolist() == [18000]
+    assert db.get_min_prices('BMW', days=10)['min_price'].tolist() == [21000]
@@ -0,0 +1,56 @@
+import json
+import time
+from types import SimpleNamespace
+import pytest
+from http_cache import ResponseCache
+from http_client import FetchError
+from mercedes_crawler import MercedesCrawler
+
+
+def test_record_mode_prunes_expired_entries(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = ResponseCache(path, ttl=60)
+    cache.put('old', b'{}')
+    cache._conn.execute("UPDATE responses SET created = ? WHERE key = 'old'", (time.time() - 120,))
+    cache.put('new', b'{}')
+    cache._conn.commit()
+    cache.close()
+
+    cache = ResponseCache(path, ttl=60)
+    assert cache.get('old') is None
+    assert cache.get('new') == b'{}'
+    assert cache._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0] == 1
+
+
+def test_replay_mode_keeps_expired_entries(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = ResponseCache(path, ttl=0)
+    cache.put('old', b'{}')
+    cache.close()
+    assert ResponseCache(path, mode='replay', ttl=0).get('old') == b'{}'
+
+
+def _crawler(tmp_path, payload: dict) -> MercedesCrawler:
+    crawler = MercedesCrawler(db_file=str(tmp_path / 'inventory.db'), url='http://api.test/search',
+                              cache=ResponseCache(str(tmp_path / 'cache.db')),
+                              requests_per_second=1000, burst=10)
+    body = json.dumps(payload).encode()
+    crawler.session.request = lambda method, url, **kwargs: SimpleNamespace(
+        status_code=200, content=body, raw=None)
+    return crawler
+
+
+def test_error_bodies_are_not_cached(tmp_path):
+    crawler = _crawler(tmp_path, {'status': {'code': 500}})
+    with pytest.raises(FetchError):
+        crawler.fetch_inventory('60601', 0)
+    assert crawler.cache._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0] == 0
+
+
+def test_accepted_bodies_are_cached(tmp_path):
+    crawler = _crawler(tmp_path, {'status': {'code': 200}, 'result': {'pagedVehicles': {
+        'paging': {'totalCount': 0}, 'records': []}}})
+    assert crawler.fetch_inventory('60601', 0) == []
+    assert crawler.cache._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0] == 1
+    assert crawler.fetch_inventory('60601', 0) == []
+    assert crawler.cache.hits == 1
@@ -0,0 +1,122 @@
+import json
+from types import SimpleNamespace
+import pytest
+from benchmarks.fake_api import FakeInventory, FakeInventoryServer
+from bmw_crawler import BMWCrawler
+from http_client import FetchError, create_session
+from mercedes_crawler import MercedesCrawler
+from rate_limiter import TokenBucket
+
+ZIP_CODES = ['60601', '60602', '60603']
+
+
+@pytest.fixture
+def inventory():
+    return FakeInventory(250, ZIP_CODES, overlap=0.3)
+
+
+def _crawler(crawler_class, url: str, db_file: str, **options):
+    return crawler_class('token', db_file=db_file, url=url, requests_per_second=1000,
+                         burst=10, backoff_factor=0, **options)
+
+
+def test_session_retries_transient_errors(inventory):
+    with FakeInventoryServer(inventory, error_rate=1.0) as server:
+        session = create_session(pool_size=2, max_retries=2, backoff_factor=0)
+        response = session.post(server.bmw_url, json={'postalCode': '60601'})
+        # The first attempt and two retries, then the last 503 is returned
+        assert response.status_code == 503
+        assert server.requests == 3
+
+
+class CountingBucket(TokenBucket):
+    def __init__(self, rate: float, capacity: float = 1.0):
+        super().__init__(rate, capacity)
+        self.tokens_taken = 0
+
+    def acquire(self):
+        self.tokens_taken += 1
+        super().acquire()
+
+
+def test_every_retried_attempt_takes_a_token(inventory):
+    limiter = CountingBucket(1000, 10)
+    with FakeInventoryServer(inventory, error_rate=1.0) as server:
+        session = create_session(pool_size=2, max_retries=3, backoff_factor=0,
+                                 rate_limiter=limiter)
+        limiter.acquire()
+        session.post(server.bmw_url, json={'postalCode': '60601'})
+        assert server.requests == 4
+    assert limiter.tokens_taken == server.requests
+
+
+def test_crawler_retries_are_paced_by_the_host_limiter(inventory, tmp_path, monkeypatch):
+    limiter = CountingBucket(1000, 10)
+    monkeypatch.setattr('crawler.get_host_limiter', lambda host, rate, capacity: limiter)
+    with FakeInventoryServer(inventory, error_rate=0.3, seed=1) as server:
+        crawler = _crawler(BMWCrawler, server.bmw_url, str(tmp_path / 'inventory.db'),
+                           max_retries=10)
+        crawler.crawl_zip_codes(ZIP_CODES)
+        assert server.errors > 0
+        assert limiter.tokens_taken == server.requests
+
+
+@pytest.mark.parametrize('crawler_class', [BMWCrawler, MercedesCrawler])
+def test_crawl_recovers_from_throttling(inventory, tmp_path, crawler_class):
+    with FakeInventoryServer(inventory, error_rate=0.3, seed=1) as server:
+        url = server.bmw_url if crawler_class is BMWCrawler else server.mercedes_url
+        crawler = _crawler(crawler_class, url, str(tmp_path / 'inventory.db'), max_retries=10)
+        crawler.crawl_zip_codes(ZIP_CODES)
+        assert server.errors > 0
+    assert crawler.failed_pages == []
+    assert crawler.metrics.counter_total('http_retries') == server.errors
+    assert len(crawler.db.get_brand_inventory(crawler.brand)) == inventory.size
+
+
+def test_exhausted_retries_raise_fetch_error(inventory, tmp_path):
+    with FakeInventoryServer(inventory, error_rate=1.0) as server:
+        crawler = _crawler(BMWCrawler, server.bmw_url, str(tmp_path / 'inventory.db'),
+                           max_retries=1)
+        with pytest.raises(FetchError) as error:
+            crawler.fetch_inventory('60601', 0)
+    assert error.value.status_code == 503
+    assert crawler.metrics.counter_total('http_requests', outcome='error') == 1
+
+
+def _serve(crawler, bodies: dict):
+    """Answer every request with HTTP 200 and the body for the request's ZIP"""
+    def request(method, url, **kwargs):
+        zip_code = (kwargs.get('json') or {}).get('postalCode') or kwargs['params']['zip']
+        return SimpleNamespace(status_code=200, content=bodies[zip_code], raw=None)
+
+    crawler.session.request = request
+
+
+MERCEDES_PAGE = json.dumps({'status': {'code': 200}, 'result': {'pagedVehicles': {
+    'paging': {'totalCount': 1},
+    'records': [{'vin': 'M1', 'modelName': 'C 300', 'dsrp': 30000}]}}}).encode()
+
+
+@pytest.mark.parametrize('crawler_class, body', [
+    (BMWCrawler, b'<html><body>Down for maintenance</body></html>'),
+    (BMWCrawler, b'["not", "an", "object"]'),
+    (BMWCrawler, b'{"vehicles": null}'),
+    (MercedesCrawler, b'<html><body>Down for maintenance</body></html>'),
+    (MercedesCrawler, b'{"result": {}}'),
+    (MercedesCrawler, b'{"status": {"code": 200}, "result": {"pagedVehicles": {}}}'),
+])
+def test_malformed_200_body_raises_fetch_error(tmp_path, crawler_class, body):
+    crawler = _crawler(crawler_class, 'http://api.test/search', str(tmp_path / 'inventory.db'))
+    _serve(crawler, {'60601': body})
+    with pytest.raises(FetchError) as error:
+        crawler.fetch_inventory('60601', 0)
+    assert error.value.status_code in (200, None)
+
+
+def test_a_maintenance_page_fails_only_its_zip(tmp_path):
+    crawler = _crawler(MercedesCrawler, 'http://api.test/search', str(tmp_path / 'inventory.db'))
+    _serve(crawler, {'60601': MERCEDES_PAGE, '60602': b'<html>Maintenance</html>'})
+    crawler.crawl_zip_codes(['60601', '60602'])
+    assert [(zip_code, page) for zip_code, page, _ in crawler.failed_pages] == [('60602', 0)]
+    assert crawler.db.get_completed_zips(crawler.run_id) == {'60601'}
+    assert crawler.vehicles_stored == 1
@@ -0,0 +1,34 @@
+import json
+import pickle
+from metrics import RunMetrics
+
+
+def test_textfile_sums_zip_labels_per_brand():
+    metrics = RunMetrics()
+    for zip_code in ('60601', '60602', '60603'):
+        metrics.inc('pages', 2, brand='BMW', zip=zip_code)
+    metrics.inc('pages', brand='Mercedes', zip='60601')
+    text = metrics.to_prometheus()
+    assert 'zip=' not in text
+    assert 'car_listings_pages_total{brand="BMW"} 6' in text
+    assert 'car_listings_pages_total{brand="Mercedes"} 1' in text
+
+
+def test_run_record_keeps_zip_labels(tmp_path):
+    metrics = RunMetrics()
+    metrics.inc('pages', brand='BMW', zip='60601')
+    metrics.inc('pages', brand='BMW', zip='60602')
+    json_path, prom_path = metrics.write(str(tmp_path))
+    record = json.loads(json_path.read_text())
+    assert sorted(counter['zip'] for counter in record['counters']) == ['60601', '60602']
+    assert prom_path.read_text() == metrics.to_prometheus()
+
+
+def test_merge_adds_shard_metrics():
+    metrics, shard = RunMetrics(), RunMetrics()
+    metrics.inc('pages', brand='BMW')
+    shard.inc('pages', 2, brand='BMW')
+    shard.observe('request_seconds', 0.2, brand='BMW')
+    metrics.merge(pickle.loads(pickle.dumps(shard)))
+    assert metrics.counter_total('pages', brand='BMW') == 3
+    assert 'car_listings_request_seconds_count{brand="BMW"} 1' in metrics.to_prometheus()
@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+from benchmarks.fake_api import FakeInventory
+from models import (VEHICLE_COLUMNS, BMWVehicleTransformer, MercedesVehicleTransformer,
+                    vehicles_to_frame)
+
+INVENTORY = FakeInventory(20, ['60601', '60602'])
+
+# Fields the record-at-a-time transform() cannot handle; the batch path tolerates them
+BMW_GAPS = [
+    {'vin': 'B1', 'model': '330i', 'internetPrice': None, 'odometer': 'n/a'},
+    {'vin': 'B2', 'model': 'M340i', 'internetPrice': '31000', 'odometer': 12,
+     'series': None, 'cpoStatus': None},
+]
+MERCEDES_GAPS = [
+    {'vin': 'M1', 'modelName': 'C 300', 'dsrp': 41000, 'usedVehicleAttributes': None,
+     'properties': None},
+    {'vin': 'M2', 'modelName': 'E 350', 'dsrp': None, 'usedVehicleAttributes': {},
+     'properties': [{'name': 'COLOR', 'value': 'Black'}]},
+    {'vin': 'M3', 'modelName': 'GLC 300', 'dsrp': 52000,
+     'usedVehicleAttributes': {'mileage': 800},
+     'properties': [{'name': 'AUTOMATIC_TRANSMISSION', 'value': '4MATIC'}]},
+]
+
+@pytest.mark.parametrize('transformer, records', [
+    (BMWVehicleTransformer(), [INVENTORY.bmw_record(i) for i in range(20)]),
+    (MercedesVehicleTransformer(), [INVENTORY.mercedes_record(i) for i in range(20)]),
+])
+def test_transform_batch_matches_transform(transformer, records):
+    expected = vehicles_to_frame([transformer.transform(record) for record in records])
+    batch = transformer.transform_batch(records)
+    assert list(batch.columns) == VEHICLE_COLUMNS
+    pd.testing.assert_frame_equal(batch, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize('transformer', [BMWVehicleTransformer(), MercedesVehicleTransformer()])
+def test_empty_page_gives_an_empty_frame(transformer):
+    batch = transformer.transform_batch([])
+    assert batch.empty and list(batch.columns) == VEHICLE_COLUMNS
+
+
+def test_bmw_gaps_become_nan_and_empty_strings():
+    batch = BMWVehicleTransformer().transform_batch(BMW_GAPS)
+    assert batch['price'].isna().tolist() == [True, False]
+    assert batch['odometer'].isna().tolist() == [True, False]
+    assert batch['series'].tolist() == ['', '']
+    assert batch['cpo_status'].tolist() == ['', '']
+
+
+def test_mercedes_gaps_fall_back_to_defaults():
+    batch = MercedesVehicleTransformer().transform_batch(MERCEDES_GAPS)
+    assert batch['drivetrain'].tolist() == ['Unknown', 'Unknown', '4MATIC']
+    assert batch['odometer'].tolist() == [0, 0, 800]
@@ -0,0 +1,36 @@
+import pytest
+from conftest import StubCrawler, api_records
+
+# Two full pages of 100 and a short third one
+RECORDS = api_records(f'VIN{i:05d}' for i in range(250))
+
+
+def _crawler(db_file: str, cap: int, report_total: bool) -> StubCrawler:
+    """Serves RECORDS for 60601, capping pages like a real API might"""
+    return StubCrawler(db_file, {'60601': RECORDS}, page_cap=cap, report_total=report_total)
+
+
+def _requested_pages(crawler: StubCrawler) -> list:
+    return [page_index for _, page_index in crawler.requested]
+
+
+@pytest.mark.parametrize('report_total', [True, False])
+@pytest.mark.parametrize('cap', [100, 40])
+def test_every_page_is_fetched(tmp_path, cap, report_total):
+    crawler = _crawler(str(tmp_path / 'inventory.db'), cap, report_total)
+    crawler.crawl_zip_codes(['60601'])
+    assert crawler.vehicles_stored == 250
+    assert crawler.db.get_completed_zips(crawler.run_id) == {'60601'}
+
+
+def test_total_fetches_pages_in_one_wave_without_probing(tmp_path):
+    crawler = _crawler(str(tmp_path / 'inventory.db'), 100, True)
+    crawler.crawl_zip_codes(['60601'])
+    assert sorted(_requested_pages(crawler)) == [0, 1, 2]
+
+
+def test_short_page_without_total_is_not_the_last(tmp_path):
+    crawler = _crawler(str(tmp_path / 'inventory.db'), 40, False)
+    crawler.crawl_zip_codes(['60601'])
+    # Pages of 40 until the empty seventh page
+    assert _requested_pages(crawler) == list(range(8))
@@ -0,0 +1,29 @@
+import json
+from types import SimpleNamespace
+from bmw_crawler import BMWCrawler
+from http_client import JSON_DECODER, decode_json
+
+
+def test_decode_json_matches_the_standard_library():
+    body = json.dumps({'vehicles': [{'vin': 'V1', 'internetPrice': 25000.5}], 'totalCount': 1})
+    assert decode_json(body.encode()) == json.loads(body)
+
+
+def test_page_metrics_share_labels(tmp_path):
+    crawler = BMWCrawler('token', db_file=str(tmp_path / 'inventory.db'),
+                         url='http://api.test/vehicle', lean=True,
+                         requests_per_second=1000, burst=10)
+    body = json.dumps({'totalCount': 1, 'vehicles': [{'vin': 'V1'}]}).encode()
+    sent = []
+
+    def request(method, url, **kwargs):
+        sent.append(kwargs['json'])
+        return SimpleNamespace(status_code=200, content=body, raw=None)
+
+    crawler.session.request = request
+    crawler.fetch_inventory('60601', 0)
+    assert not sent[0]['includeFacets'] and not sent[0]['includeDealers']
+    labels = {'brand': 'BMW', 'lean': True, 'decoder': JSON_DECODER}
+    assert crawler.metrics.counter_total('pages_decoded', **labels) == 1
+    assert crawler.metrics.counter_total('page_bytes', **labels) == len(body)
+    assert crawler.metrics.counter_total('page_decode_seconds', **labels) > 0
@@ -0,0 +1,84 @@
+import threading
+import weakref
+from typing import Dict, List
+from conftest import StubCrawler, api_records
+from crawler import InventoryPage
+from search_profiles import SearchProfile
+
+
+class PagedCrawler(StubCrawler):
+    """Serves pages of 50, recording the size of every batch and the pages still alive"""
+    page_size = 50
+
+    def __init__(self, db_file: str, pages: Dict[str, List[dict]], **kwargs):
+        super().__init__(db_file, pages, **kwargs)
+        self.batches: List[int] = []
+        # Pages not yet freed, and the most seen at once
+        self.live_pages = 0
+        self.peak_live_pages = 0
+        self._live_lock = threading.Lock()
+        update_inventory = self.db.update_inventory
+
+        def record_batch(vehicles, run_id=None):
+            self.batches.append(len(vehicles))
+            return update_inventory(vehicles, run_id)
+
+        self.db.update_inventory = record_batch
+
+    def fetch_page(self, zip_code: str, page_index: int, filters: SearchProfile) -> InventoryPage:
+        page = super().fetch_page(zip_code, page_index, filters)
+        with self._live_lock:
+            self.live_pages += 1
+            self.peak_live_pages = max(self.peak_live_pages, self.live_pages)
+        weakref.finalize(page, self._page_freed)
+        return page
+
+    def _page_freed(self):
+        with self._live_lock:
+            self.live_pages -= 1
+
+
+def test_pages_are_written_in_bounded_batches(tmp_path):
+    by_zip = {str(60600 + z): api_records([f'V{z}-{i}' for i in range(120)]) for z in range(5)}
+    crawler = PagedCrawler(str(tmp_path / 'inventory.db'), by_zip, batch_size=100)
+    crawler.crawl_zip_codes(list(by_zip))
+    assert len(crawler.batches) > 1
+    # A batch is flushed once it reaches batch_size, so it overshoots by less than a page
+    assert max(crawler.batches) < 100 + PagedCrawler.page_size
+    assert crawler.vehicles_stored == sum(crawler.batches) == 600
+    assert crawler.db.get_completed_zips(crawler.run_id) == set(by_zip)
+
+
+def test_vins_returned_by_several_zips_are_stored_once(tmp_path):
+    shared = [f'S{i}' for i in range(30)]
+    by_zip = {'60601': api_records(shared + ['A1']), '60602': api_records(shared + ['B1'])}
+    crawler = PagedCrawler(str(tmp_path / 'inventory.db'), by_zip, batch_size=1000)
+    crawler.crawl_zip_codes(list(by_zip))
+    assert crawler.batches == [32]
+    assert len(crawler.db.get_run_inventory('BMW', crawler.run_id)) == 32
+
+
+def test_zip_with_a_failed_page_is_not_checkpointed(tmp_path):
+    by_zip = {'60601': api_records([f'A{i}' for i in range(80)]),
+              '60602': api_records([f'B{i}' for i in range(80)])}
+    crawler = PagedCrawler(str(tmp_path / 'inventory.db'), by_zip, failing={('60602', 1)},
+                           batch_size=10)
+    crawler.crawl_zip_codes(list(by_zip))
+    assert crawler.failed_pages == [('60602', 1, 'HTTP 500 from api.test')]
+    assert crawler.db.get_completed_zips(crawler.run_id) == {'60601'}
+    # The pages that did arrive are still stored
+    assert crawler.vehicles_stored == 80 + 50
+
+
+def test_pages_held_in_memory_do_not_grow_with_the_zip_count(tmp_path):
+    peaks = []
+    for zip_count in (10, 80):
+        by_zip = {str(60000 + z): api_records([f'V{z}-{i}' for i in range(250)])
+                  for z in range(zip_count)}
+        crawler = PagedCrawler(str(tmp_path / f'inventory-{zip_count}.db'), by_zip,
+                               batch_size=100, concurrency=4)
+        crawler.crawl_zip_codes(list(by_zip))
+        assert crawler.vehicles_stored == zip_count * 250
+        peaks.append(crawler.peak_live_pages)
+    # One page per request slot, the queue of 2 * concurrency and the persister's page
+    assert max(peaks) <= 3 * 4 + 1
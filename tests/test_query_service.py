@@ -0,0 +1,101 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import pandas as pd
+import pytest
+from conftest import vehicles_frame
+from database import InventoryDatabase
+from query_service import InventoryQuery, InventoryQueryService, make_server
+
+
+def _vehicles(count: int) -> pd.DataFrame:
+    return vehicles_frame(
+        [f'VIN{i:03d}' for i in range(count)],
+        # Many equal prices, so pages must break ties on VIN
+        price=[20000.0 + (i % 7) * 1000 for i in range(count)],
+        odometer=[None if i % 10 == 0 else float(i * 100) for i in range(count)],
+        model=['M340i' if i % 3 == 0 else 'M3_CS' if i % 3 == 1 else 'M3XCS'
+               for i in range(count)],
+        drivetrain=['AWD' if i % 2 else 'RWD' for i in range(count)])
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    db_file = str(tmp_path / 'inventory.db')
+    InventoryDatabase(db_file).update_inventory(_vehicles(95))
+    return db_file
+
+
+@pytest.fixture
+def service(db_file):
+    service = InventoryQueryService(db_file)
+    yield service
+    service.close()
+
+
+def _walk(service: InventoryQueryService, **filters) -> list:
+    vins, after = [], None
+    while True:
+        page = service.query(InventoryQuery(limit=10, after=after, **filters))
+        assert len(page['vehicles']) <= 10
+        vins += [vehicle['vin'] for vehicle in page['vehicles']]
+        after = page['next']
+        if after is None:
+            return vins
+
+
+@pytest.mark.parametrize('sort', ['price', 'odometer'])
+@pytest.mark.parametrize('descending', [False, True])
+def test_cursor_pages_walk_every_row_once_in_order(service, sort, descending):
+    df = _vehicles(95).dropna(subset=[sort])
+    expected = df.sort_values([sort, 'vin'], ascending=not descending)['vin'].tolist()
+    assert _walk(service, sort=sort, descending=descending) == expected
+
+
+def test_filters_and_literal_model_prefix(service):
+    vins = _walk(service, model='m3_', drivetrain='AWD', min_price=22000, max_price=24000)
+    df = _vehicles(95)
+    expected = df[df['model'].str.startswith('M3_') & (df['drivetrain'] == 'AWD') &
+                  df['price'].between(22000, 24000)]
+    assert sorted(vins) == sorted(expected['vin'])
+
+
+def test_cache_is_cleared_when_the_database_changes(db_file, service):
+    query = InventoryQuery(brand='BMW', limit=5)
+    first = service.query(query)
+    assert service.query(query) is first
+    assert (service.hits, service.misses) == (1, 1)
+    cheaper = _vehicles(1).assign(vin='CHEAP', price=1000.0)
+    InventoryDatabase(db_file).update_inventory(cheaper)
+    assert service.query(query)['vehicles'][0]['vin'] == 'CHEAP'
+    assert service.misses == 2
+
+
+def test_invalid_queries_are_rejected():
+    with pytest.raises(ValueError, match='Unsupported sort column'):
+        InventoryQuery(sort='vin')
+    with pytest.raises(ValueError, match='limit'):
+        InventoryQuery.from_params({'limit': '5000'})
+    with pytest.raises(ValueError, match='Unknown parameter'):
+        InventoryQuery.from_params({'colour': 'blue'})
+
+
+def test_http_server(service):
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    try:
+        with urllib.request.urlopen(f'{base}/vehicles?brand=BMW&limit=3&descending=true') as r:
+            page = json.load(r)
+        assert [v['price'] for v in page['vehicles']] == [26000.0] * 3
+        after = f"{base}/vehicles?limit=3&descending=true&after={page['next']}"
+        with urllib.request.urlopen(after) as r:
+            assert len(json.load(r)['vehicles']) == 3
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f'{base}/vehicles?after=not-a-cursor')
+        assert error.value.code == 400
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,66 @@
+import threading
+import time
+import pytest
+import rate_limiter
+from rate_limiter import TokenBucket, get_host_limiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', clock)
+    return clock
+
+
+def test_burst_is_free_then_callers_queue_behind_each_other(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert [bucket._reserve() for _ in range(3)] == [0, 0, 0]
+    assert [bucket._reserve() for _ in range(3)] == [0.5, 1.0, 1.5]
+
+
+def test_tokens_refill_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=2)
+    bucket._reserve(), bucket._reserve()
+    clock.now += 0.5
+    assert bucket._reserve() == 0
+    assert bucket._reserve() == 0.5
+    clock.now += 60
+    assert [bucket._reserve() for _ in range(3)] == [0, 0, 0.5]
+
+
+def test_rate_must_be_positive():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_threads_share_the_rate():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    threads = [threading.Thread(target=bucket.acquire) for _ in range(11)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # The first token is free; the other ten wait for 1/50 s each
+    assert time.monotonic() - start >= 0.19
+
+
+def test_crawlers_of_one_host_share_a_limiter():
+    first = get_host_limiter('limiter.test', 5, 2)
+    assert get_host_limiter('limiter.test', 5, 2) is first
+    assert get_host_limiter('other.test', 5, 2) is not first
+
+
+@pytest.mark.parametrize('rate, capacity', [(100, 2), (5, 10)])
+def test_a_host_cannot_be_paced_at_two_rates(rate, capacity):
+    get_host_limiter('limiter.test', 5, 2)
+    with pytest.raises(ValueError):
+        get_host_limiter('limiter.test', rate, capacity)
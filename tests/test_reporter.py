@@ -0,0 +1,83 @@
+import gzip
+import io
+import numpy as np
+import pandas as pd
+import pytest
+from reporter import EmailReporter, format_vehicles
+
+
+def _inventory() -> pd.DataFrame:
+    return pd.DataFrame({
+        'vin': ['N1', 'N2', 'C1', 'C2', 'U1'],
+        'brand': 'BMW',
+        'model': ['330i', 'M340i', '330e', '330i', 'X3'],
+        'price': [31000.0, 52500.0, 28999.0, 1234567.0, np.nan],
+        'price_previous': [np.nan, np.nan, 30000.0, 1200000.0, 40000.0],
+        'price_change': [0.0, 0.0, -1001.0, 34567.0, 0.0],
+        'price_change_pct': [0.0, 0.0, -3.3367, 2.8806, 0.0],
+        'odometer': [1200.0, 15.0, 40210.0, np.nan, 999.0],
+        'drivetrain': 'AWD',
+        'url': 'https://example.test'
+    })
+
+
+def _reporter(**options) -> EmailReporter:
+    return EmailReporter('smtp.example.test', 465, 'bot@example.test', 'secret', **options)
+
+
+def test_format_vehicles():
+    formatted = format_vehicles(_inventory())
+    assert formatted['price'].tolist() == ['$31,000', '$52,500', '$28,999', '$1,234,567', '']
+    assert formatted['price_change'].tolist() == ['+0', '+0', '-1,001', '+34,567', '+0']
+    assert formatted['price_change_pct'].tolist()[2:4] == ['-3.34%', '+2.88%']
+    assert formatted['odometer'].tolist() == ['1,200', '15', '40,210', '', '999']
+
+
+def test_changes_report_lists_only_changed_vehicles_with_capped_tables():
+    removed = _inventory().iloc[:1].assign(model='X5', price=61000.0)
+    html = _reporter(mode='diff', max_rows=1).render_changes(_inventory(), '00:01:00', removed)
+    assert 'Price Changes (2)' in html and 'New Vehicles (2)' in html
+    assert 'Removed Vehicles (1)' in html and '$61,000' in html
+    # Biggest drop first, and capped at one row
+    assert '-1,001' in html and '+34,567' not in html
+    assert html.count('Showing 1 of 2') == 2
+    # Unchanged vehicles are left out
+    assert 'X3' not in html
+
+
+def test_snapshot_attachment_holds_the_whole_inventory():
+    attachment = EmailReporter.snapshot_attachment(_inventory())
+    data = gzip.decompress(attachment.get_payload(decode=True))
+    assert pd.read_csv(io.BytesIO(data))['vin'].tolist() == ['N1', 'N2', 'C1', 'C2', 'U1']
+    assert attachment.get_filename().endswith('.csv.gz')
+
+
+@pytest.mark.parametrize('mode, parts', [('full', ['text/html']),
+                                         ('diff', ['text/html', 'application/octet-stream'])])
+def test_send_report(monkeypatch, mode, parts):
+    sent = []
+
+    class SMTP:
+        def __init__(self, server, port):
+            assert (server, port) == ('smtp.example.test', 465)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            pass
+
+        def login(self, user, password):
+            pass
+
+        def send_message(self, msg):
+            sent.append(msg)
+
+    monkeypatch.setattr('smtplib.SMTP_SSL', SMTP)
+    _reporter(mode=mode).send_report(_inventory(), '00:01:00', 'Inventory', ['a@example.test'])
+    assert [part.get_content_type() for part in sent[0].get_payload()] == parts
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError, match='Unsupported report mode'):
+        _reporter(mode='summary')
@@ -0,0 +1,60 @@
+import sqlite3
+from conftest import StubCrawler, api_records
+
+ZIP_CODES = ['60601', '60602', '60603']
+
+
+def _crawler(db_file: str, **kwargs) -> StubCrawler:
+    """Serves two vehicles per ZIP"""
+    pages = {zip_code: api_records([f'{zip_code}-{i}' for i in range(2)])
+             for zip_code in ZIP_CODES}
+    return StubCrawler(db_file, pages, **kwargs)
+
+
+def _requested_zips(crawler: StubCrawler) -> list:
+    return sorted(zip_code for zip_code, _ in crawler.requested)
+
+
+def test_resume_fetches_only_the_zips_left_by_an_interrupted_run(tmp_path):
+    db_file = str(tmp_path / 'inventory.db')
+    crawler = _crawler(db_file, resume=True)
+    # A run that checkpointed one ZIP before it was stopped
+    interrupted = crawler.db.start_run('BMW')
+    crawler.db.mark_zips_complete('BMW', interrupted, [('60601', 2)])
+
+    crawler.crawl_zip_codes(ZIP_CODES)
+    assert crawler.run_id == interrupted
+    assert _requested_zips(crawler) == ['60602', '60603']
+    assert crawler.db.get_completed_zips(interrupted) == set(ZIP_CODES)
+    assert crawler.db.get_unfinished_run('BMW') is None
+
+
+def test_without_resume_a_new_run_fetches_everything(tmp_path):
+    crawler = _crawler(str(tmp_path / 'inventory.db'))
+    interrupted = crawler.db.start_run('BMW')
+    crawler.db.mark_zips_complete('BMW', interrupted, [('60601', 2)])
+    crawler.crawl_zip_codes(ZIP_CODES)
+    assert crawler.run_id != interrupted
+    assert _requested_zips(crawler) == ZIP_CODES
+
+
+def test_fresh_zips_are_skipped_and_the_run_is_partial(tmp_path):
+    db_file = str(tmp_path / 'inventory.db')
+    _crawler(db_file).crawl_zip_codes(ZIP_CODES[:2])
+
+    crawler = _crawler(db_file, freshness_ttl=3600)
+    crawler.crawl_zip_codes(ZIP_CODES)
+    assert crawler.requested == [('60603', 0)]
+    assert not crawler.full_sweep
+    assert crawler.metrics.counter_total('zips_skipped', reason='fresh') == 2
+    # Vehicles of the skipped ZIPs are not archived as removed
+    assert len(crawler.db.get_brand_inventory('BMW')) == 6
+
+
+def test_checkpoints_count_the_vehicles_of_every_page(tmp_path):
+    crawler = _crawler(str(tmp_path / 'inventory.db'))
+    crawler.crawl_zip_codes(ZIP_CODES)
+    with sqlite3.connect(crawler.db.db_file) as conn:
+        counts = dict(conn.execute('SELECT zip_code, vehicles FROM crawl_progress '
+                                   'WHERE run_id = ?', (crawler.run_id,)))
+    assert counts == {zip_code: 2 for zip_code in ZIP_CODES}
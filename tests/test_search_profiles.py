@@ -0,0 +1,69 @@
+import pandas as pd
+from bmw_crawler import BMWCrawler
+from search_profiles import SearchProfile, label_profiles, match_profiles, plan_queries
+
+LOCAL = BMWCrawler.local_dimensions
+
+
+def _profile(name, series, min_price=20000, max_price=39999):
+    return SearchProfile(name=name, series=(series,), drivetrains=('AWD',),
+                         min_price=min_price, max_price=max_price, max_odometer=30000)
+
+
+def _vehicles(**columns):
+    defaults = {'series': '3 Series', 'drivetrain': 'AWD', 'price': 25000.0, 'odometer': 1000.0}
+    size = len(next(iter(columns.values())))
+    return pd.DataFrame({key: columns.get(key, [value] * size) for key, value in defaults.items()})
+
+
+def test_profiles_differing_in_one_local_dimension_merge():
+    profiles = [_profile(series, series) for series in ('2 Series', '3 Series', 'X3')]
+    queries = plan_queries(profiles, LOCAL)
+    assert len(queries) == 1
+    assert queries[0].filters.series == ('2 Series', '3 Series', 'X3')
+
+
+def test_profiles_differing_in_two_dimensions_stay_apart():
+    profiles = [_profile('3', '3 Series'), _profile('cheap X3', 'X3', 10000, 19999)]
+    assert len(plan_queries(profiles, LOCAL)) == 2
+
+
+def test_price_ranges_with_a_gap_stay_apart():
+    profiles = [_profile('low', '3 Series', 0, 9999), _profile('high', '3 Series', 20000, 29999)]
+    assert len(plan_queries(profiles, LOCAL)) == 2
+
+
+def test_missing_values_match():
+    df = _vehicles(series=['3 Series', '', None, '3'])
+    names = match_profiles(df, [_profile('3 Series', '3 Series')], LOCAL)
+    assert names.tolist() == ['3 Series', '3 Series', '3 Series', '']
+
+
+def test_vehicles_are_split_between_merged_profiles():
+    df = _vehicles(series=['3 Series', 'X3', '3 Series'], price=[25000.0, 30000.0, 35000.0])
+    profiles = [_profile('3 low', '3 Series', 20000, 29999),
+                _profile('3 high', '3 Series', 30000, 39999), _profile('X3', 'X3')]
+    queries = plan_queries(profiles, LOCAL)
+    assert len(queries) == 1
+    assert label_profiles(df, queries, LOCAL).tolist() == ['3 low', 'X3', '3 high']
+
+
+def test_single_profile_search_is_not_rechecked():
+    df = _vehicles(series=['3', ''], drivetrain=['xDrive', ''])
+    queries = plan_queries([_profile('3 Series', '3 Series')], LOCAL)
+    assert label_profiles(df, queries, LOCAL).tolist() == ['3 Series', '3 Series']
+
+
+def test_inexact_filters_of_a_single_profile_search_are_rechecked():
+    # The $20k-$39,999 bands of a $25k-$35k profile also return these neighbours
+    df = _vehicles(series=['3', '3', '3'], price=[21000.0, 30000.0, 38000.0])
+    profile = _profile('3 Series', '3 Series', 25000, 35000)
+    queries = plan_queries([profile], LOCAL)
+    labels = label_profiles(df, queries, LOCAL, BMWCrawler.inexact_dimensions)
+    assert labels.tolist() == ['', '3 Series', '']
+    assert BMWCrawler.label_profiles(df, [profile]).tolist() == ['', '3 Series', '']
+
+
+def test_crawler_labels_with_its_default_profiles():
+    df = _vehicles(series=['3', '3 Series'])
+    assert BMWCrawler.label_profiles(df).tolist() == ['3 Series', '3 Series']
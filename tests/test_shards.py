@@ -0,0 +1,54 @@
+import sqlite3
+import time
+import pytest
+from conftest import vehicles_frame
+from database import InventoryDatabase
+from shards import ShardMerger, parse_shard, shard_db_file, shard_zip_codes
+
+
+def _shard(path, vins) -> str:
+    db = InventoryDatabase(str(path))
+    run_id = db.start_run('BMW')
+    db.update_inventory(vehicles_frame(vins), run_id)
+    db.finish_run(run_id, full_sweep=True)
+    return str(path)
+
+
+def test_parse_shard():
+    assert parse_shard('2/4') == (2, 4)
+    for value in ('0/4', '5/4', 'x', '1/0'):
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+
+def test_shards_are_disjoint_and_cover_the_list():
+    zip_codes = [str(60000 + i) for i in range(10)]
+    shards = [shard_zip_codes(zip_codes, index, 3) for index in (1, 2, 3)]
+    assert sorted(sum(shards, [])) == zip_codes
+    assert shard_db_file('/data/inventory.db', 2, 3) == '/data/inventory.shard-2-of-3.db'
+
+
+def test_merge_dedupes_vins_across_shards(tmp_path):
+    files = [_shard(tmp_path / 'a.db', ['V1', 'V2']), _shard(tmp_path / 'b.db', ['V2', 'V3'])]
+    db = InventoryDatabase(str(tmp_path / 'main.db'))
+    run_ids = ShardMerger(db).merge(files)
+    assert sorted(db.get_run_inventory('BMW', run_ids['BMW'])['vin']) == ['V1', 'V2', 'V3']
+
+
+def test_stale_shard_runs_are_skipped_and_nothing_is_archived(tmp_path):
+    db = InventoryDatabase(str(tmp_path / 'main.db'))
+    run_id = db.start_run('BMW')
+    db.update_inventory(vehicles_frame(['V1', 'V2', 'V3', 'V4']), run_id)
+    db.finish_run(run_id, full_sweep=True)
+
+    since = time.time() - 60
+    fresh = _shard(tmp_path / 'a.db', ['V1', 'V2', 'V3'])
+    stale = _shard(tmp_path / 'b.db', ['V4'])
+    with sqlite3.connect(stale) as conn:
+        conn.execute('UPDATE crawl_runs SET finished = ?', (since - 3600,))
+
+    run_ids = ShardMerger(db, since=since).merge([fresh, stale])
+    assert sorted(db.get_run_inventory('BMW', run_ids['BMW'])['vin']) == ['V1', 'V2', 'V3']
+    # Without every shard's sweep, V4 is not taken as removed
+    assert 'V4' in set(db.get_brand_inventory('BMW')['vin'])
+    assert db.get_removed_inventory('BMW', run_ids['BMW']).empty
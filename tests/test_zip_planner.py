@@ -0,0 +1,67 @@
+import csv
+import gzip
+import json
+import pytest
+import zip_planner
+from zip_planner import ZipCoveragePlanner, cached_plan
+
+# Points roughly 10 miles apart along a meridian
+CENTROIDS = [('00001', 40.000, -88.0), ('00002', 40.145, -88.0), ('00003', 40.290, -88.0),
+             ('00004', 40.435, -88.0), ('00005', 40.580, -88.0)]
+
+
+@pytest.fixture
+def centroids_file(tmp_path):
+    path = tmp_path / 'centroids.csv.gz'
+    with gzip.open(path, 'wt', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['zip', 'lat', 'lon'])
+        writer.writerows(CENTROIDS)
+    return str(path)
+
+
+def _reachable(planner: ZipCoveragePlanner, zip_codes, radius: float) -> set:
+    return {z for origin in zip_codes for z in planner.zips
+            if zip_planner._haversine(planner.lat[planner.index[origin]],
+                                      planner.lon[planner.index[origin]],
+                                      planner.lat[planner.index[z]],
+                                      planner.lon[planner.index[z]]) <= radius}
+
+
+def test_plan_covers_the_same_area_with_fewer_searches(centroids_file):
+    planner = ZipCoveragePlanner(centroids_file)
+    zip_codes = [z for z, _, _ in CENTROIDS]
+    plan = planner.plan(zip_codes, radius=15)
+    assert len(plan.zip_codes) < len(zip_codes)
+    assert _reachable(planner, plan.zip_codes, 15) == _reachable(planner, zip_codes, 15)
+
+
+def test_unknown_zips_are_kept(centroids_file):
+    plan = ZipCoveragePlanner(centroids_file).plan(['00001', '99999'], radius=15)
+    assert plan.unknown_zips == ['99999']
+    assert '99999' in plan.zip_codes and '00001' in plan.zip_codes
+
+
+def test_cached_plan_is_reused_until_the_inputs_change(centroids_file, tmp_path, monkeypatch):
+    cache_file = tmp_path / 'plan.json'
+    zip_codes = [z for z, _, _ in CENTROIDS]
+    plan = cached_plan(zip_codes, 15, cache_file=cache_file, centroids_file=centroids_file)
+    assert json.loads(cache_file.read_text())['plan']['zip_codes'] == plan.zip_codes
+
+    calls = []
+    original = ZipCoveragePlanner.plan
+    monkeypatch.setattr(ZipCoveragePlanner, 'plan',
+                        lambda self, *args: calls.append(args) or original(self, *args))
+    assert cached_plan(zip_codes, 15, cache_file=cache_file,
+                       centroids_file=centroids_file) == plan
+    assert calls == []
+    cached_plan(zip_codes, 25, cache_file=cache_file, centroids_file=centroids_file)
+    cached_plan(zip_codes[:3], 25, cache_file=cache_file, centroids_file=centroids_file)
+    assert len(calls) == 2
+
+
+def test_unreadable_cache_is_replanned(centroids_file, tmp_path):
+    cache_file = tmp_path / 'plan.json'
+    cache_file.write_text('{not json')
+    plan = cached_plan(['00001'], 15, cache_file=cache_file, centroids_file=centroids_file)
+    assert plan.zip_codes == ['00001']
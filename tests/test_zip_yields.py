@@ -0,0 +1,85 @@
+from typing import Dict, List
+import pandas as pd
+from conftest import StubCrawler, api_records
+from database import InventoryDatabase
+from models import BMWVehicleTransformer
+from zip_scheduler import YieldScheduler
+
+
+def test_update_inventory_flags_vins_stored_earlier_in_the_run(tmp_path):
+    db = InventoryDatabase(str(tmp_path / 'inventory.db'))
+    transformer = BMWVehicleTransformer()
+    run_id = db.new_run_id()
+    first = db.update_inventory(transformer.transform_batch(api_records(['V1', 'V2'])), run_id)
+    second = db.update_inventory(transformer.transform_batch(api_records(['V2', 'V3'])), run_id)
+    assert not first['seen_in_run'].any()
+    assert dict(zip(second['vin'], second['seen_in_run'])) == {'V2': True, 'V3': False}
+    # A later run starts afresh
+    third = db.update_inventory(transformer.transform_batch(api_records(['V1'])), db.new_run_id())
+    assert not third['seen_in_run'].any()
+
+
+def test_each_vin_is_credited_to_one_zip(tmp_path):
+    pages = {'60601': api_records(['V1', 'V2', 'V3']),
+             '60602': api_records(['V2', 'V3', 'V4']),
+             '60603': api_records(['V3', 'V4', 'V5'])}
+    # One page per batch, so shared VINs span batches and only the database knows them
+    crawler = StubCrawler(str(tmp_path / 'inventory.db'), pages, batch_size=1,
+                         concurrency=1, scheduler=YieldScheduler())
+    crawler.crawl_zip_codes(list(pages))
+    credited = {zip_code: counts[0] for zip_code, counts in crawler._zip_yields.items()}
+    assert sum(credited.values()) == 5
+    assert set(credited) <= set(pages)
+
+
+def test_vins_repeated_within_a_batch_are_credited_once(tmp_path):
+    pages = {'60601': api_records(['V1', 'V2']), '60602': api_records(['V1', 'V2'])}
+    crawler = StubCrawler(str(tmp_path / 'inventory.db'), pages, batch_size=100,
+                         concurrency=1, scheduler=YieldScheduler())
+    crawler.crawl_zip_codes(list(pages))
+    assert sum(counts[0] for counts in crawler._zip_yields.values()) == 2
+    yields = crawler.db.get_zip_yields('BMW')
+    assert isinstance(yields, pd.DataFrame) and set(yields['zip_code']) == set(pages)
+
+
+def _history(scheduler: YieldScheduler, runs: List[Dict[str, tuple]]) -> pd.DataFrame:
+    """Fold (requests, new VINs, price changes) per ZIP for runs 1, 2, ... into yield records"""
+    yields = pd.DataFrame(columns=['zip_code', 'score', 'low_streak', 'last_run',
+                                   'requests', 'new_vins', 'price_changes'])
+    for run_number, crawled in enumerate(runs, start=1):
+        updated = scheduler.update(yields, crawled, run_number)
+        yields = pd.concat([yields[~yields['zip_code'].isin(updated['zip_code'])], updated],
+                           ignore_index=True)
+    return yields
+
+
+def test_low_yield_zips_are_deferred_with_a_doubling_gap():
+    scheduler = YieldScheduler(sweep_every=100, min_yield=0.5, max_interval=4)
+    yields = _history(scheduler, [{'hot': (1, 5, 0), 'cold': (1, 0, 0)}])
+    # One low crawl: crawled again two runs later
+    assert scheduler.schedule(['hot', 'cold'], yields, 2).deferred == ['cold']
+    assert scheduler.schedule(['hot', 'cold'], yields, 3).zip_codes == ['hot', 'cold']
+    yields = _history(scheduler, [{'hot': (1, 5, 0), 'cold': (1, 0, 0)},
+                                  {'hot': (1, 5, 0)}, {'hot': (1, 5, 0), 'cold': (1, 0, 0)}])
+    # Two low crawls in a row: four runs later, capped by max_interval
+    assert 'cold' in scheduler.schedule(['cold'], yields, 6).deferred
+    assert scheduler.schedule(['cold'], yields, 7).zip_codes == ['cold']
+    assert scheduler.interval(10) == 4
+
+
+def test_a_yielding_crawl_resets_the_gap():
+    scheduler = YieldScheduler(sweep_every=100, min_yield=0.5)
+    yields = _history(scheduler, [{'z': (1, 0, 0)}, {'z': (1, 0, 0)}, {'z': (2, 3, 1)}])
+    record = yields.set_index('zip_code').loc['z']
+    assert record['low_streak'] == 0
+    assert record['score'] == 0.5 * 2 + 0.5 * 0
+
+
+def test_new_zips_come_first_and_sweeps_crawl_everything():
+    scheduler = YieldScheduler(sweep_every=3, min_yield=0.5)
+    yields = _history(scheduler, [{'good': (1, 4, 0), 'better': (1, 8, 0), 'cold': (1, 0, 0)}])
+    schedule = scheduler.schedule(['good', 'better', 'cold', 'new'], yields, 2)
+    assert schedule.zip_codes == ['new', 'better', 'good']
+    assert not schedule.full_sweep
+    sweep = scheduler.schedule(['good', 'better', 'cold', 'new'], yields, 3)
+    assert sweep.full_sweep and sweep.deferred == [] and len(sweep.zip_codes) == 4
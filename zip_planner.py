@@ -0,0 +1,151 @@
+import csv
+import gzip
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import List
+import numpy as np
+
+# ZIP centroids from GeoNames (https://www.geonames.org/, CC BY 4.0)
+DEFAULT_CENTROIDS_FILE = Path(__file__).parent / 'config' / 'zip_centroids.csv.gz'
+# The last plan made, reused while the ZIP list, radius and centroids are unchanged
+DEFAULT_PLAN_CACHE_FILE = Path(__file__).parent / 'zip_plan_cache.json'
+EARTH_RADIUS_MILES = 3958.8
+# Rows of the candidate/target distance matrix computed at a time
+_CHUNK_SIZE = 512
+
+
+@dataclass
+class CoveragePlan:
+    """Search centres chosen to cover the same area as the original ZIP list"""
+    zip_codes: List[str]
+    original_count: int
+    radius: float
+    unknown_zips: List[str] = field(default_factory=list)
+
+    @property
+    def saved_requests(self) -> int:
+        """ZIP searches avoided compared with searching every original ZIP"""
+        return self.original_count - len(self.zip_codes)
+
+    def get_summary(self) -> str:
+        """Get a human-readable summary of the plan"""
+        summary = (f"Coverage plan: {len(self.zip_codes)} search centres instead of "
+                   f"{self.original_count} ZIPs at {self.radius:g} miles "
+                   f"({self.saved_requests} fewer searches)")
+        if self.unknown_zips:
+            summary += f", {len(self.unknown_zips)} ZIPs without centroids kept as-is"
+        return summary
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in miles between points given in radians"""
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+class ZipCoveragePlanner:
+    """Plans a minimal set of radius searches that returns the same dealers.
+
+    The inventory APIs match dealers by ZIP, so the area covered by a list of
+    searches is the set of ZIP centroids within the radius of any searched
+    ZIP. The planner computes that set and picks search centres with a greedy
+    set cover, then drops centres that became redundant.
+    """
+
+    def __init__(self, centroids_file: str = DEFAULT_CENTROIDS_FILE):
+        with gzip.open(centroids_file, 'rt', newline='') as f:
+            reader = csv.reader(f)
+            next(reader)  # header
+            rows = list(reader)
+        self.zips = np.array([row[0] for row in rows])
+        self.lat = np.radians(np.array([float(row[1]) for row in rows]))
+        self.lon = np.radians(np.array([float(row[2]) for row in rows]))
+        self.index = {zip_code: i for i, zip_code in enumerate(self.zips)}
+
+    def plan(self, zip_codes: List[str], radius: float, tolerance: float = 0.0) -> CoveragePlan:
+        """Plan search centres for the given ZIP codes.
+
+        With the default tolerance every ZIP reachable from the original list is
+        still reachable from the plan. A positive tolerance ignores ZIPs in the
+        outermost `tolerance` miles of the original search area, trading a thin
+        edge band for fewer searches.
+        """
+        unique_zips = list(dict.fromkeys(zip_codes))
+        unknown_zips = [z for z in unique_zips if z not in self.index]
+        origins = np.array([self.index[z] for z in unique_zips if z in self.index],
+                           dtype=np.intp)
+        if len(origins) == 0:
+            return CoveragePlan(unknown_zips, len(zip_codes), radius, unknown_zips)
+
+        # ZIP centroids reachable from any of the original searches
+        reachable = np.zeros(len(self.zips), dtype=bool)
+        for origin in origins:
+            reachable |= _haversine(self.lat[origin], self.lon[origin],
+                                    self.lat, self.lon) <= radius - tolerance
+        targets = np.flatnonzero(reachable)
+        candidates = np.union1d(origins, targets)
+
+        cover = np.empty((len(candidates), len(targets)), dtype=bool)
+        for start in range(0, len(candidates), _CHUNK_SIZE):
+            rows = candidates[start:start + _CHUNK_SIZE]
+            cover[start:start + len(rows)] = _haversine(
+                self.lat[rows, None], self.lon[rows, None],
+                self.lat[None, targets], self.lon[None, targets]) <= radius
+
+        # Greedy set cover, preferring the original ZIPs on ties
+        is_origin = np.isin(candidates, origins)
+        gain = cover.sum(axis=1, dtype=np.int64)
+        uncovered = np.ones(len(targets), dtype=bool)
+        chosen = []
+        while uncovered.any():
+            best = np.flatnonzero(gain == gain.max())
+            preferred = best[is_origin[best]]
+            pick = preferred[0] if len(preferred) else best[0]
+            newly_covered = cover[pick] & uncovered
+            uncovered &= ~newly_covered
+            gain -= cover[:, newly_covered].sum(axis=1, dtype=np.int64)
+            chosen.append(pick)
+
+        # Greedy picks can be made redundant by later ones; drop those
+        cover_count = cover[chosen].sum(axis=0, dtype=np.int64)
+        for pick in reversed(list(chosen)):
+            if (cover_count[cover[pick]] > 1).all():
+                chosen.remove(pick)
+                cover_count -= cover[pick]
+
+        planned = [str(z) for z in self.zips[candidates[chosen]]]
+        if len(planned) >= len(origins):
+            # Never plan more searches than the original list needs
+            planned = [z for z in unique_zips if z in self.index]
+        return CoveragePlan(planned + unknown_zips, len(zip_codes), radius, unknown_zips)
+
+
+def _plan_key(zip_codes: List[str], radius: float, tolerance: float, centroids_file: str) -> str:
+    """Identify a plan by its inputs, including the version of the centroids file"""
+    stat = Path(centroids_file).stat()
+    inputs = [zip_codes, radius, tolerance, stat.st_size, stat.st_mtime_ns]
+    return hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+
+
+def cached_plan(zip_codes: List[str], radius: float, tolerance: float = 0.0,
+                cache_file: str = DEFAULT_PLAN_CACHE_FILE,
+                centroids_file: str = DEFAULT_CENTROIDS_FILE) -> CoveragePlan:
+    """Plan search centres, reusing the cached plan when it was made from the same inputs"""
+    key = _plan_key(list(zip_codes), radius, tolerance, str(centroids_file))
+    cache_file = Path(cache_file)
+    try:
+        cached = json.loads(cache_file.read_text())
+        if cached.get('key') == key:
+            return CoveragePlan(**cached['plan'])
+    except (OSError, ValueError, TypeError, KeyError):
+        pass  # Missing or unreadable; plan afresh and replace it
+
+    plan = ZipCoveragePlanner(centroids_file).plan(zip_codes, radius, tolerance)
+    # Write then rename so a concurrent run never reads a half-written file
+    tmp_file = cache_file.with_suffix('.json.tmp')
+    tmp_file.write_text(json.dumps({'key': key, 'plan': asdict(plan)}))
+    tmp_file.replace(cache_file)
+    return plan
@@ -0,0 +1,78 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+import pandas as pd
+from database import YIELD_COLUMNS
+
+
+@dataclass
+class ZipSchedule:
+    """The ZIPs a run crawls, highest expected yield first"""
+    zip_codes: List[str]
+    run_number: int
+    full_sweep: bool
+    deferred: List[str] = field(default_factory=list)
+
+    def get_summary(self) -> str:
+        """Get a human-readable summary of the schedule"""
+        if self.full_sweep:
+            return f"Run {self.run_number}: full sweep of {len(self.zip_codes)} ZIPs"
+        return (f"Run {self.run_number}: crawling {len(self.zip_codes)} ZIPs, "
+                f"{len(self.deferred)} low-yield ZIPs deferred")
+
+
+class YieldScheduler:
+    """Orders and thins a run's ZIP list using each ZIP's past yield.
+
+    A ZIP's yield is the number of VINs it contributed per request that were
+    new to the database or changed price, counting each VIN only for the
+    first ZIP of the run that returned it. ZIPs at or above `min_yield` are
+    crawled every run. Every crawl below it doubles the gap before the next
+    one, up to `max_interval` runs, and a crawl that yields again resets the
+    gap. Every `sweep_every`-th run crawls all ZIPs regardless.
+    """
+
+    def __init__(self, sweep_every: int = 6, min_yield: float = 0.5,
+                 max_interval: int = 8, smoothing: float = 0.5):
+        self.sweep_every = max(1, sweep_every)
+        self.min_yield = min_yield
+        self.max_interval = max(1, max_interval)
+        # Weight of the latest crawl in the exponentially averaged score
+        self.smoothing = smoothing
+
+    def interval(self, low_streak: int) -> int:
+        """Runs between crawls of a ZIP after `low_streak` low-yield crawls in a row"""
+        return min(self.max_interval, 2 ** low_streak)
+
+    def schedule(self, zip_codes: List[str], yields: pd.DataFrame, run_number: int) -> ZipSchedule:
+        """Choose and order the ZIPs for a run; ZIPs without history are always crawled"""
+        full_sweep = run_number % self.sweep_every == 0
+        history = yields.set_index('zip_code').to_dict('index')
+        due, deferred = [], []
+        for zip_code in dict.fromkeys(zip_codes):
+            stats = history.get(zip_code)
+            if (stats is None or full_sweep or
+                    run_number - stats['last_run'] >= self.interval(stats['low_streak'])):
+                due.append(zip_code)
+            else:
+                deferred.append(zip_code)
+        # Unknown ZIPs first, then by score, so the best sources claim shared VINs
+        due.sort(key=lambda z: -history[z]['score'] if z in history else float('-inf'))
+        return ZipSchedule(due, run_number, full_sweep, deferred)
+
+    def update(self, yields: pd.DataFrame, crawled: Dict[str, Tuple[int, int, int]],
+               run_number: int) -> pd.DataFrame:
+        """Fold a run's (requests, new VINs, price changes) per ZIP into the yield records"""
+        history = yields.set_index('zip_code').to_dict('index')
+        rows = []
+        for zip_code, (requests, new_vins, price_changes) in crawled.items():
+            latest = (new_vins + price_changes) / max(requests, 1)
+            stats = history.get(zip_code)
+            if stats is None:
+                score, low_streak = latest, 0
+            else:
+                score = self.smoothing * latest + (1 - self.smoothing) * stats['score']
+                low_streak = stats['low_streak']
+            low_streak = low_streak + 1 if latest < self.min_yield else 0
+            rows.append((zip_code, score, low_streak, run_number,
+                         requests, new_vins, price_changes))
+        return pd.DataFrame(rows, columns=YIELD_COLUMNS)